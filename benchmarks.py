@@ -0,0 +1,371 @@
+__author__ = 'Steve Theodore'
+"""
+Timing benchmarks for the sfx module. Usage:
+
+   cd path/to/benchmarks/and/sfx/module
+   path/to/mayapy.exe  benchmarks.py
+
+'benchmarks.py budgets' only runs the budget suite, which times the common network operations at several sizes and
+counts the shaderfx commands they send. It exits with an error if any operation sends more commands than its budget in
+BUDGETS allows.
+
+Without Maya the benchmarks run against sfx.headless, with HEADLESS_LATENCY added to every command.
+"""
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+from collections import OrderedDict
+
+import sfx
+import sfx.headless as headless
+import sfx.sfxnodes as sfxnodes
+import sfx.workers as workers
+from sfx import SFXNetwork
+from sfx.graph import layered_layout
+
+REPEATS = 5
+
+# seconds per command when running without Maya
+HEADLESS_LATENCY = 0.0001
+
+try:
+    import maya.cmds as cmds
+
+    HEADLESS = False
+except ImportError:
+    cmds = headless.use_backend(headless.HeadlessMaya(latency=HEADLESS_LATENCY))
+    HEADLESS = True
+
+# { operation: ( commands per node, fixed commands ) } for the budget suite. An operation on a network of n extra
+# nodes may send at most n * per node + fixed commands. The fixed part covers the default graph and the first query
+# of each node type's schema; the per node part is what the operation is expected to cost.
+BUDGETS = OrderedDict([
+    ('add', (2, 5)),
+    ('connect', (1, 50)),
+    ('open', (0, 50)),
+    ('find_by_type', (0, 50)),
+    ('get_inputs traversal', (9, 500)),
+    ('layout', (3, 200)),
+    ('fingerprint', (5, 100)),
+    ('fingerprint after one edit', (0, 50)),
+])
+
+BUDGET_SIZES = (50, 200, 1000)
+
+
+def report(label, seconds):
+    print "{0:<48} {1:>10.2f} ms".format(label, seconds * 1000.0)
+
+
+def report_size(label, size):
+    print "{0:<48} {1:>10.1f} kb".format(label, size / 1024.0)
+
+
+def best_time(func, repeats=REPEATS):
+    """
+    returns the best of <repeats> runs of <func>, in seconds
+    """
+    return min(timeit.repeat(func, number=1, repeat=repeats))
+
+
+def dense_network(name, size):
+    """
+    creates a network with <size> extra nodes and no gaps in the node ids
+    """
+    network = SFXNetwork.create(name)
+    for _ in range(size):
+        network.add(sfxnodes.Float)
+    return network
+
+
+def sparse_network(name, size):
+    """
+    creates a network with <size> extra nodes, where the ids of the nodes are spread out by adding and deleting 9
+    nodes for every one that's kept
+    """
+    network = SFXNetwork.create(name)
+    for n in range(size * 10):
+        node = network.add(sfxnodes.Float)
+        if n % 10:
+            network.delete(node)
+    return network
+
+
+def bench_discovery(sizes=(50, 200)):
+    for size in sizes:
+        for label, factory in (('dense', dense_network), ('sparse', sparse_network)):
+            cmds.file(new=True, f=True)
+            network = factory('bench', size)
+            report('discovery: saved graph, %s, %d nodes' % (label, size), best_time(network._discover_from_graph))
+            report('discovery: probe, %s, %d nodes' % (label, size), best_time(network._discover_by_probe))
+
+
+def chain_spec(size):
+    """
+    a build() spec for a chain of <size> Add nodes, each feeding the next
+    """
+    nodes = [{'name': 'add_%d' % n, 'type': sfxnodes.Add, 'properties': {'posx': n * -150.0}}
+             for n in range(size)]
+    connections = [('add_%d.result' % n, 'add_%d.a' % (n + 1)) for n in range(size - 1)]
+    return {'nodes': nodes, 'connections': connections}
+
+
+def bench_build(sizes=(100, 300)):
+    """
+    times build() and counts the shaderfx commands it sends
+    """
+    for size in sizes:
+        spec = chain_spec(size)
+        cmds.file(new=True, f=True)
+        network = SFXNetwork.create('bench')
+        _, seconds, calls = counted(lambda: network.build(spec))
+        report('build(), %d nodes (%d commands)' % (size, calls), seconds)
+
+
+def bench_snapshot(sizes=(100, 300)):
+    """
+    compares snapshot() / restore() with a saveGraph / loadGraph round trip, which is the other way to store and
+    reopen a network
+    """
+    folder = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            cmds.file(new=True, f=True)
+            network = SFXNetwork.create('bench')
+            network.build(chain_spec(size))
+            sfx_path = os.path.join(folder, 'bench.sfx')
+            snapshot_path = os.path.join(folder, 'bench.snapshot')
+            gz_path = snapshot_path + '.gz'
+
+            report('saveGraph, %d nodes' % size, best_time(lambda: network.cmd(saveGraph=sfx_path)))
+            report('snapshot(), %d nodes' % size, best_time(lambda: network.snapshot(snapshot_path)))
+            report('snapshot() gzipped, %d nodes' % size, best_time(lambda: network.snapshot(gz_path)))
+            report_size('saveGraph size, %d nodes' % size, os.path.getsize(sfx_path))
+            report_size('snapshot size, %d nodes' % size, os.path.getsize(snapshot_path))
+            report_size('snapshot size gzipped, %d nodes' % size, os.path.getsize(gz_path))
+
+            def load_graph():
+                cmds.file(new=True, f=True)
+                SFXNetwork.instantiate('restored', sfx_path)
+
+            def restore_new():
+                cmds.file(new=True, f=True)
+                SFXNetwork.restore(snapshot_path, 'restored')
+
+            report('loadGraph into a new shader, %d nodes' % size, best_time(load_graph, 1))
+            report('restore() into a new shader, %d nodes' % size, best_time(restore_new, 1))
+            report('reopen with SFXNetwork(), %d nodes' % size, best_time(lambda: SFXNetwork('restored')))
+            # the restored shader has different node ids from the snapshot, so this one has to diff
+            report('reopen with restore(), changed, %d nodes' % size,
+                   best_time(lambda: SFXNetwork.restore(snapshot_path, 'restored')))
+            SFXNetwork('restored').snapshot(snapshot_path)
+            _, seconds, calls = counted(lambda: SFXNetwork.restore(snapshot_path, 'restored'))
+            report('reopen with restore(), unchanged, %d nodes (%d commands)' % (size, calls), seconds)
+    finally:
+        shutil.rmtree(folder)
+
+
+def random_dag(size, fan_in=2, reach=20, seed=1):
+    """
+    returns { node: [ input_node, ... ] } for a DAG of <size> nodes rooted at 0, where each node takes inputs from up
+    to <fan_in> of the <reach> nodes after it, so that lots of nodes are shared by several paths
+    """
+    rng = random.Random(seed)
+    return dict((n, [rng.randint(n + 1, min(n + reach, size - 1)) for _ in range(fan_in)] if n < size - 1 else [])
+                for n in range(size))
+
+
+def dag_spec(size):
+    """
+    a build() spec for random_dag(size) made of Add nodes, feeding the root
+    """
+    dag = random_dag(size)
+    nodes = [{'name': 'add_%d' % n, 'type': sfxnodes.Add} for n in range(size)]
+    connections = [('add_0.result', 'root.color')]
+    for n, sources in dag.items():
+        for source, plug in zip(sources, ('a', 'b')):
+            connections.append(('add_%d.result' % source, 'add_%d.%s' % (n, plug)))
+    return {'nodes': nodes, 'connections': connections}
+
+
+def bench_layout(engine_sizes=(100, 1000, 5000), network_sizes=(100, 1000)):
+    for size in engine_sizes:
+        dag = random_dag(size)
+        report('layered_layout(), %d nodes' % size, best_time(lambda: layered_layout(0, dag.get)))
+    for size in network_sizes:
+        cmds.file(new=True, f=True)
+        network = SFXNetwork.create('bench')
+        network.build(dag_spec(size))
+        report('layout(), %d nodes' % size, best_time(network.layout, 1))
+
+
+def bench_scene(shader_count=100, size=20):
+    cmds.file(new=True, f=True)
+    for n in range(shader_count):
+        network = SFXNetwork.create('bench_%d' % n)
+        network.build(chain_spec(size))
+    stats = sfx.SFXSceneStats()
+    for _ in sfx.load_scene_networks(stats=stats):
+        pass
+    report('load_scene_networks(), %d shaders of %d nodes' % (shader_count, size), stats.seconds)
+    print stats
+
+
+def traverse_file(network):
+    return traverse_inputs(network)
+
+
+def bench_workers(file_count=32, size=100, process_counts=(1, 2, 4)):
+    """
+    how the throughput of a worker pool scales with the number of workers. The workers are started before the clock
+    starts, so this is the steady state of a warm pool.
+    """
+    folder = tempfile.mkdtemp()
+    try:
+        cmds.file(new=True, f=True)
+        network = SFXNetwork.create('bench')
+        network.build(dag_spec(size))
+        paths = [os.path.join(folder, 'bench_%d.sfx' % n) for n in range(file_count)]
+        for path in paths:
+            network.cmd(saveGraph=path)
+        for processes in process_counts:
+            with workers.SFXWorkerPool(processes) as pool:
+                list(pool.run(paths[:processes], traverse_file))
+                start = timeit.default_timer()
+                list(pool.run(paths, traverse_file))
+                seconds = timeit.default_timer() - start
+            report('%d files of %d nodes, %d workers (%.1f files/s)' % (file_count, size, processes,
+                                                                        file_count / seconds), seconds)
+    finally:
+        shutil.rmtree(folder)
+
+
+def bench_profiler(count=1000):
+    cmds.file(new=True, f=True)
+    network = SFXNetwork.create('bench')
+
+    def commands():
+        for _ in range(count):
+            network.cmd(getNodeCount=True)
+
+    report('%d commands, not profiled' % count, best_time(commands))
+    with sfx.profile():
+        report('%d commands, profiled' % count, best_time(commands))
+
+
+def counted(func):
+    """
+    runs <func> once and returns ( its result, seconds, shaderfx commands sent )
+    """
+    with sfx.profile() as profiler:
+        start = timeit.default_timer()
+        result = func()
+        seconds = timeit.default_timer() - start
+    return result, seconds, len(profiler.commands)
+
+
+def traverse_inputs(network):
+    """
+    visits every node upstream of the root with get_inputs(), and returns how many there were
+    """
+    seen = set([network.root.index])
+    pending = [network.root]
+    while pending:
+        for node in network.get_inputs(pending.pop()).values():
+            if node.index not in seen:
+                seen.add(node.index)
+                pending.append(node)
+    return len(seen)
+
+
+def bench_budgets(sizes=BUDGET_SIZES):
+    """
+    Times the common operations on networks of each size and checks the shaderfx commands they send against BUDGETS.
+    Returns a list of the operations which went over budget.
+    """
+    over = []
+
+    def check(operation, size, seconds, calls):
+        per_node, fixed = BUDGETS[operation]
+        budget = per_node * size + fixed
+        status = 'ok' if calls <= budget else 'OVER BUDGET'
+        print "{0:<28} {1:>6} {2:>10.2f} ms {3:>8} calls {4:>8} budget  {5}".format(
+            operation, size, seconds * 1000.0, calls, budget, status)
+        if calls > budget:
+            over.append('%s, %d nodes: %d calls, budget %d' % (operation, size, calls, budget))
+
+    for size in sizes:
+        cmds.file(new=True, f=True)
+        network = SFXNetwork.create('bench')
+
+        nodes, seconds, calls = counted(lambda: [network.add(sfxnodes.Add) for _ in range(size)])
+        check('add', size, seconds, calls)
+
+        def connect_chain():
+            for upstream, downstream in zip(nodes, nodes[1:]):
+                network.connect(upstream.outputs.result, downstream.inputs.a)
+            network.connect(nodes[-1].outputs.result, network.root.inputs.color)
+
+        _, seconds, calls = counted(connect_chain)
+        check('connect', size, seconds, calls)
+
+        # the rest start from a freshly opened network, as a tool would
+        reopened, seconds, calls = counted(lambda: SFXNetwork('bench'))
+        check('open', size, seconds, calls)
+        _, seconds, calls = counted(lambda: reopened.find_by_type(sfxnodes.Add))
+        check('find_by_type', size, seconds, calls)
+        _, seconds, calls = counted(lambda: traverse_inputs(reopened))
+        check('get_inputs traversal', size, seconds, calls)
+        _, seconds, calls = counted(reopened.layout)
+        check('layout', size, seconds, calls)
+        _, seconds, calls = counted(reopened.fingerprint)
+        check('fingerprint', size, seconds, calls)
+        # the last node in the chain only feeds the root, so only the two of them are hashed again
+        reopened.nodes[nodes[-1].index].uiorder = 1
+        _, seconds, calls = counted(reopened.fingerprint)
+        check('fingerprint after one edit', size, seconds, calls)
+    return over
+
+
+def cold_import_time(statement, repeats=REPEATS):
+    """
+    the best time for <statement> to run in a fresh interpreter, in seconds
+    """
+    code = ("import sys, time; sys.path.insert(0, %r); start = time.time(); %s; "
+            "sys.stdout.write(repr(time.time() - start))" % (os.path.dirname(os.path.abspath(__file__)), statement))
+    return min(float(subprocess.check_output([sys.executable, '-c', code])) for _ in range(repeats))
+
+
+def bench_import():
+    report('import sfx', cold_import_time('import sfx'))
+    report('import sfx, sfxnodes and pbsnodes', cold_import_time('import sfx.sfxnodes, sfx.pbsnodes'))
+    if HEADLESS:
+        return
+    # what importing sfx used to cost: maya.cmds, the file modules and every node type class, all up front
+    report('import everything up front',
+           cold_import_time('import maya.cmds, sfx, sfx.sfxfile, sfx.snapshot, sfx.typecache; '
+                            '[sfx.node_registry[f] for f in sfx.node_registry.flavours()]'))
+
+
+if __name__ == '__main__':
+    if not HEADLESS:
+        import maya.standalone
+
+        maya.standalone.initialize()
+    if 'budgets' not in sys.argv[1:]:
+        bench_discovery()
+        bench_build()
+        bench_snapshot()
+        bench_layout()
+        bench_scene()
+        bench_workers()
+        bench_import()
+        bench_profiler()
+    over_budget = bench_budgets()
+    if over_budget:
+        sys.exit('over budget:\n  ' + '\n  '.join(over_budget))
@@ -1,12 +1,112 @@
-from functools import partial
+import hashlib
+import importlib
+import logging
+import os
+import types
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import partial, wraps
 
-import maya.cmds as cmds
+from sfx import profiling
+from sfx.graph import EdgeIndex, KeyIndex, layered_layout
+
+
+class _MayaCommands(object):
+    """
+    Stands in for maya.cmds until a command is first used, so importing sfx doesn't import Maya. Outside of Maya only
+    the parts of the package which don't talk to shaders, such as sfx.sfxfile and sfx.snapshot, will work.
+    """
+
+    def __getattr__(self, item):
+        global cmds
+        import maya.cmds
+        cmds = maya.cmds
+        return getattr(cmds, item)
+
+
+cmds = _MayaCommands()
+
+logger = logging.getLogger(__name__)
+
+# the active recorder from sfx.profiling, if any: see profile()
+_recorder = None
+
+
+def _shaderfx(*args, **flags):
+    """
+    sends a shaderfx command. Everything in the package goes through here, so the active recorder sees every command
+    """
+    if _recorder is None:
+        return cmds.shaderfx(*args, **flags)
+    start = profiling.clock()
+    try:
+        return cmds.shaderfx(*args, **flags)
+    finally:
+        _recorder.command(flags, start, profiling.clock() - start)
+
+
+def _operation(func):
+    """
+    marks a method as an operation, so the commands it sends are credited to it by the active recorder
+    """
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if _recorder is None:
+            return func(self, *args, **kwargs)
+        owner = self if isinstance(self, type) else type(self)
+        _recorder.begin('%s.%s' % (owner.__name__, func.__name__), self, args)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            _recorder.end()
+
+    return wrapper
+
+
+@contextmanager
+def profile(recorder=None):
+    """
+    Record the shaderfx commands sent inside a 'with' block, with an sfx.profiling.SFXProfiler unless another
+    <recorder> (such as an sfx.profiling.SFXTracer) is given:
+
+        with sfx.profile() as profiler:
+            network.layout()
+        print profiler.report()
+
+    Profiles can't be nested: an inner profile() takes over from the outer one until it ends.
+    """
+    global _recorder
+    previous = _recorder
+    _recorder = recorder or profiling.SFXProfiler()
+    try:
+        yield _recorder
+    finally:
+        _recorder = previous
+
+
+# properties which only affect how a node is drawn in the ShaderFX editor. diff() ignores them by default.
+UI_PROPERTIES = ('posx', 'posy', 'collapsed')
+
+# node types which dedupe() never merges, because their names are part of the shader: each material variable is a
+# separate parameter on the material
+UNIQUE_TYPES = ('Material Variable',)
 
 
 class SFXPropertyNotFound(AttributeError):
     pass
 
 
+class SFXSpecError(ValueError):
+    """
+    Raised by SFXNetwork.build() when a spec is invalid. 'problems' lists everything that was wrong with it.
+    """
+
+    def __init__(self, problems):
+        super(SFXSpecError, self).__init__('invalid network spec:\n  ' + '\n  '.join(problems))
+        self.problems = problems
+
+
 class SFXNodeType(object):
     """
     This class represents the magic name-id combo for different node types in shaderFX -- it's much easier to code if
@@ -19,37 +119,82 @@ class SFXNodeType(object):
     NODE_TYPE = ''
     NODE_ID = -1
 
-    SFX_NODE_TEMPLATE = """
-    class {0} ({1}):
-        TYPE = "{2}"
-        ID = {3}
-    """
+    # a row of the _NODE_TYPES table in sfxnodes or pbsnodes. {1} is the base class, which is always SFXNodeType
+    SFX_NODE_TEMPLATE = '''    ("{0}", "{2}", {3}),'''
 
     def __repr__(self):
         return "<%s: %s>" % (self.NODE_TYPE, self.NODE_ID)
 
     @classmethod
-    def generate_class_definitions(cls, shader, node_list):
+    def generate_class_definitions(cls, shader, node_list, use_cache=False):
         """
         helper method which generates class definitions for known node types. These are stable within maya versions
         but may change between them. Requires a shader node to run.  Create a node, then pass in one of the string lists
         in the pbsnodes or sfxnodes modules to this -- it will spit out a the text of all the classes for your version
-        of Maya.
+        of Maya, as rows for the _NODE_TYPES table in those modules.
+
+        If <use_cache> is True the ids come from the sfx.typecache file for this Maya version and flavour. If there
+        isn't one yet it is generated, which adds and deletes a node of every type in <shader>, and saved under the
+        typecache folder (~/.sfx_cache unless SFX_CACHE_DIR is set). <errors> is a list of ( type, message ) for the
+        types whose ids couldn't be found.
         """
-        class_def = []
-        errors = []
+        if use_cache:
+            from sfx import typecache
+            flavour = cmds.nodeType(shader)
+            data = typecache.load(maya_version(), flavour)
+            if data is None or set(data.get('ids', ())) | set(data.get('errors', ())) != set(node_list.split('\n')):
+                data = typecache.generate(shader, node_list)
+                typecache.save(data)
+            ids = data['ids']
+            # a type whose id was found but whose schema couldn't be read is still listed in the cache's errors
+            errors = sorted((k, v) for k, v in data['errors'].items() if k not in ids)
+        else:
+            ids = {}
+            errors = []
+            for item in node_list.split('\n'):
+                try:
+                    ids[item] = _shaderfx(sfxnode=shader, getNodeTypeByClassName=item)
+                except RuntimeError as e:
+                    errors.append((item, str(e)))
 
+        class_def = []
         for item in node_list.split('\n'):
-            try:
+            if item in ids:
                 classname = item.replace(" ", "")
-                id_code = cmds.shaderfx(sfxnode=shader, getNodeTypeByClassName=item)
-                class_def.append(cls.SFX_NODE_TEMPLATE.format(classname, cls.__name__, item, id_code))
-            except:
-                errors.append(item)
-
+                class_def.append(cls.SFX_NODE_TEMPLATE.format(classname, cls.__name__, item, ids[item]))
         return class_def, errors
 
 
+class SFXNodeTypeModule(types.ModuleType):
+    """
+    A module of SFXNodeType classes which are created the first time they are used. sfxnodes and pbsnodes replace
+    themselves in sys.modules with one of these, so that importing them doesn't create hundreds of classes:
+
+        sys.modules[__name__] = SFXNodeTypeModule(sys.modules[__name__], _NODE_TYPES)
+
+    <table> is a sequence of ( class name, TYPE, ID ). Everything else in the original module works as usual.
+    """
+
+    def __init__(self, module, table):
+        super(SFXNodeTypeModule, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+        # python 2 empties the globals of a module when it is garbage collected, so keep the original alive
+        self._module = module
+        self._table = dict((row[0], row[1:]) for row in table)
+
+    def __getattr__(self, item):
+        # only called for attributes which don't exist yet
+        if item.startswith('__') or item not in self._table:
+            raise AttributeError("'module' object has no attribute '%s'" % item)
+        type_name, id_code = self._table[item]
+        klass = type(item, (SFXNodeType,), {'TYPE': type_name, 'ID': id_code, '__module__': self.__name__})
+        setattr(self, item, klass)
+        return klass
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._table))
+
+
 class SFXPlugs(object):
     """
     A wrapper for an enumerated list of named plugs so you can write code like
@@ -64,16 +209,265 @@ class SFXPlugs(object):
     """
 
     def __init__(self, node, plugs):
-        def _safe_plug_name(p):
-            result = p.lower().replace(" ", "_")
-            if result.startswith("_"):
-                result = result[1:]
-            return result
+        self.node = node
+        if not isinstance(plugs, dict):
+            plugs = plug_sockets(plugs)
+        # { plug_name: socket index }, shared by every node that uses the same SFXNodeSchema
+        self.sockets = plugs
 
-        self.plugs = dict((_safe_plug_name(plug), (node, i)) for i, plug in enumerate(plugs))
+    @property
+    def plugs(self):
+        return dict((k, (self.node, v)) for k, v in self.sockets.items())
 
     def __getattr__(self, item):
-        return self.plugs[item]
+        if item in ('node', 'sockets'):
+            raise AttributeError(item)
+        return self.node, self.sockets[item]
+
+
+def plug_sockets(plugs):
+    """
+    returns a dictionary of { plug_name : socket_index } for a list of shaderfx plug names, using the python-safe
+    versions of the names
+    """
+
+    def _safe_plug_name(p):
+        result = p.lower().replace(" ", "_")
+        if result.startswith("_"):
+            result = result[1:]
+        return result
+
+    return dict((_safe_plug_name(plug), i) for i, plug in enumerate(plugs))
+
+
+class _FrozenDict(dict):
+    """
+    A dictionary which can't be changed after it is created, used for data shared between nodes
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("%s is read-only" % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+class SFXNodeSchema(object):
+    """
+    The property types and plug names for one type of node. Schemas are shared by all the SFXNodes of the same type
+    through the SFXSchemaCache, so they are read only:
+
+        properties:  { property_name: property_type }
+        inputs:      { input_plug_name: socket_index }
+        outputs:     { output_plug_name: socket_index }
+    """
+    __slots__ = ['properties', 'inputs', 'outputs']
+
+    # these two properties on the MaterialVariable node never report their type correctly in Maya2016
+    # so the schema records the correct types instead
+    KNOWN_PROPERTY_TYPES = {'defaultvectwo': 'float2', 'defaultvectthree': 'float3'}
+
+    def __init__(self, properties, inputs, outputs):
+        object.__setattr__(self, 'properties', _FrozenDict(properties))
+        object.__setattr__(self, 'inputs', _FrozenDict(plug_sockets(inputs)))
+        object.__setattr__(self, 'outputs', _FrozenDict(plug_sockets(outputs)))
+
+    def __setattr__(self, key, value):
+        raise TypeError("SFXNodeSchema is read-only")
+
+    def to_dict(self):
+        """
+        returns this schema as plain data: { 'properties': { name: type }, 'inputs': [ plug, ... ], 'outputs': [...] }
+        """
+        return {'properties': dict(self.properties),
+                'inputs': sorted(self.inputs, key=self.inputs.get),
+                'outputs': sorted(self.outputs, key=self.outputs.get)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        makes a schema from the output of to_dict()
+        """
+        return cls(data['properties'], data['inputs'], data['outputs'])
+
+    @classmethod
+    def query(cls, shader, idx):
+        """
+        Query the schema of node <idx> in <shader>
+        """
+        cmd = partial(_shaderfx, n=shader)
+        properties = {}
+        for k in cmd(lp=idx):
+            try:
+                # note this has to be a STRING NOT A UNICODE
+                # otherwise the SFXNode.__setattr__ hack will fail
+                properties[k] = str(cmd(gpt=(idx, k)))
+            except RuntimeError:
+                properties[k] = cls.KNOWN_PROPERTY_TYPES.get(k)
+
+        input_count = cmd(gsc=(idx, 0))
+        input_plugs = [cmd(gsn=(idx, 0, i)) for i in range(input_count)]
+        output_count = cmd(gsc=(idx, 1))
+        output_plugs = [cmd(gsn=(idx, 1, i)) for i in range(output_count)]
+        return cls(properties, input_plugs, output_plugs)
+
+
+class SFXSchemaCache(object):
+    """
+    A process-wide cache of SFXNodeSchemas, keyed by (node class name, maya version, shader flavour) where the flavour
+    is the shader node type ('ShaderfxShader' or 'StingrayPBS'). The first time a flavour misses, the schemas in the
+    sfx.typecache file for it (if there is one) are loaded, so they don't need to be queried at all.
+
+        print sfx.schema_cache.hits, sfx.schema_cache.misses
+        # 25 1
+        # most nodes found their schema in the cache
+
+        sfx.schema_cache.clear()
+        # forget everything and reset the counters
+    """
+
+    def __init__(self):
+        self.schemas = {}
+        self.hits = 0
+        self.misses = 0
+        # ( maya version, flavour ) pairs whose typecache file has been loaded
+        self.loaded = set()
+
+    def get(self, shader, idx, nodetype, flavour):
+        """
+        Return the schema for node <idx> in <shader>, querying it only if no node of the same type has been seen
+        """
+        key = (nodetype, maya_version(), flavour)
+        schema = self.schemas.get(key)
+        if schema is None and key[1:] not in self.loaded:
+            self.load(*key[1:])
+            schema = self.schemas.get(key)
+        if schema is None:
+            self.misses += 1
+            schema = self.schemas[key] = SFXNodeSchema.query(shader, idx)
+        else:
+            self.hits += 1
+        return schema
+
+    def load(self, version, flavour):
+        """
+        add the schemas from the typecache file for <version> and <flavour>, if there is one, to the cache
+        """
+        from sfx import typecache
+        self.loaded.add((version, flavour))
+        data = typecache.load(version, flavour)
+        if data is None:
+            return
+        for nodetype, schema in data.get('schemas', {}).items():
+            self.schemas.setdefault((nodetype, version, flavour), SFXNodeSchema.from_dict(schema))
+
+    def clear(self):
+        self.schemas.clear()
+        self.loaded.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.schemas)
+
+
+schema_cache = SFXSchemaCache()
+
+_MAYA_VERSION = []
+
+
+def maya_version():
+    """
+    returns the running Maya version string, which is only queried once
+    """
+    if not _MAYA_VERSION:
+        _MAYA_VERSION.append(cmds.about(version=True))
+    return _MAYA_VERSION[0]
+
+
+class SFXNodeTypes(object):
+    """
+    Lookup tables for the SFXNodeType classes of one shader flavour:
+
+        by_type:    { TYPE: class }, where TYPE is the shaderfx class name such as 'Sample Texture'
+        by_id:      { ID: class }
+        by_group:   { group file name: class } for group nodes, as passed to addGroup
+        by_name:    { python class name: class }
+    """
+    __slots__ = ['flavour', 'by_type', 'by_id', 'by_group', 'by_name']
+
+    def __init__(self, flavour, module):
+        self.flavour = flavour
+        self.by_type = {}
+        self.by_id = {}
+        self.by_group = {}
+        self.by_name = {}
+        for name in dir(module):
+            value = getattr(module, name)
+            if isinstance(value, type) and issubclass(value, SFXNodeType) and hasattr(value, 'ID'):
+                self.by_type[value.TYPE] = value
+                self.by_id[value.ID] = value
+                self.by_name[value.__name__] = value
+                if hasattr(value, 'group_id'):
+                    self.by_group[value.group_id()] = value
+
+    def __contains__(self, node_klass):
+        return self.by_id.get(getattr(node_klass, 'ID', None)) is node_klass
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+class SFXNodeRegistry(object):
+    """
+    The SFXNodeType classes in the sfxnodes and pbsnodes modules, indexed by flavour (the shader node type):
+
+        print sfx.node_registry['StingrayPBS'].by_type['Sample Texture']
+        # <class 'sfx.pbsnodes.SampleTexture'>
+
+        print sfx.node_registry.resolve('ShaderfxShader', 'Color')
+        # <class 'sfx.sfxnodes.Color'>
+
+        print sfx.node_registry.flavour_of(pbsnodes.SampleTexture)
+        # 'StingrayPBS'
+
+    The tables for a flavour are built once, the first time they are used.
+    """
+    MODULES = OrderedDict([('ShaderfxShader', 'sfx.sfxnodes'), ('StingrayPBS', 'sfx.pbsnodes')])
+
+    def __init__(self):
+        self.tables = {}
+
+    def __getitem__(self, flavour):
+        if flavour not in self.tables:
+            self.tables[flavour] = SFXNodeTypes(flavour, importlib.import_module(self.MODULES[flavour]))
+        return self.tables[flavour]
+
+    def flavours(self):
+        return list(self.MODULES)
+
+    def flavour_of(self, node_klass):
+        """
+        returns the flavour an SFXNodeType class belongs to, or None if it isn't one of the registered classes
+        """
+        for flavour, module in self.MODULES.items():
+            if getattr(node_klass, '__module__', None) == module:
+                return flavour if node_klass in self[flavour] else None
+        return None
+
+    def resolve(self, flavour, node_type):
+        """
+        returns the SFXNodeType class for <flavour> given the class itself, its TYPE, ID, group file name or python
+        class name, or None if there isn't one
+        """
+        table = self[flavour]
+        if isinstance(node_type, type):
+            return node_type if node_type in table else None
+        if isinstance(node_type, (int, long)):
+            return table.by_id.get(node_type)
+        return table.by_type.get(node_type) or table.by_name.get(node_type) or table.by_group.get(node_type)
+
+
+node_registry = SFXNodeRegistry()
 
 
 class SFXNode(object):
@@ -87,6 +481,10 @@ class SFXNode(object):
         node = SFXNode('sfx_shader', 4)
         # gets node index 1 in the network 'sfx_shader'
 
+    Inside a network, use network.node(4) instead: the network keeps one wrapper for each node, which is shared by
+    'nodes', 'root', get_inputs() and so on, so its schema and node type are only fetched once. Wrappers for the same
+    node compare equal either way.
+
         print node.nodetype
         # 'Fresnel'
         # gets the display name of the wrapped node
@@ -118,82 +516,160 @@ class SFXNode(object):
 
         network.connect( node1, 0,  node2, 11)
 
+    Nodes are lazy by default: creating one only records the shader and index. The property types and the plug
+    names are queried the first time 'properties', 'inputs', 'outputs' or a named property is used. Pass lazy=False
+    to query everything up front.
     """
-    __slots__ = ['cmd', 'index', 'node', '_cached_properties', 'nodetype', 'inputs', 'outputs', 'properties']
+    __slots__ = ['cmd', 'index', 'node', 'flavour', '_network', '_nodetype', '_cached_properties', '_inputs',
+                 '_outputs']
+
+    # set to False for nodes whose plugs vary from instance to instance, so they can't share a schema
+    CACHE_SCHEMA = True
 
-    def __init__(self, node, idx):
-        self.cmd = partial(cmds.shaderfx, n=node)
+    def __init__(self, node, idx, lazy=True, flavour=None):
+        self.cmd = partial(_shaderfx, n=node)
         self.index = idx
         self.node = node
-        self._cached_properties = dict((k, None) for k in self.cmd(lp=self.index))
-
-        for k in self._cached_properties.keys():
-            try:
-                # note this has to be a STRING NOT A UNICODE
-                # otherwise the __setattr__ hack will fail
-                tt = str(self.cmd(gpt=(self.index, k)))
-                self._cached_properties[k] = tt
-            except RuntimeError:
-                # these two properties on the MaterialVariable node
-                # never report their type correctly in Maya2016
-                # so this is a workaround
-                if k == 'defaultvectwo':
-                    self._cached_properties[k] = 'float2'
-                    continue
-                if k == 'defaultvectthree':
-                    self._cached_properties[k] = 'float3'
-                    continue
+        self.flavour = flavour
+        self._network = None
+        self._nodetype = None
+        self._cached_properties = None
+        self._inputs = None
+        self._outputs = None
+        if not lazy:
+            self._load_schema()
+
+    @_operation
+    def _load_schema(self):
+        """
+        Get the property types and the input and output plug names of this node from the schema cache, querying them
+        if this is the first node of its type. Lazy nodes (the default) don't call this until one of 'properties',
+        'inputs' or 'outputs' is first used.
+        """
+        if self.CACHE_SCHEMA:
+            if self.flavour is None:
+                self.flavour = cmds.nodeType(self.node)
+            schema = schema_cache.get(self.node, self.index, self.nodetype, self.flavour)
+        else:
+            schema = SFXNodeSchema.query(self.node, self.index)
 
-        input_count = self.cmd(gsc=(self.index, 0))
-        input_plugs = [self.cmd(gsn=(self.index, 0, i)) for i in range(input_count)]
-        output_count = self.cmd(gsc=(self.index, 1))
-        output_plugs = [self.cmd(gsn=(self.index, 1, i)) for i in range(output_count)]
-        self.inputs = SFXPlugs(self.index, input_plugs)
-        self.outputs = SFXPlugs(self.index, output_plugs)
+        self._inputs = SFXPlugs(self.index, schema.inputs)
+        self._outputs = SFXPlugs(self.index, schema.outputs)
+        self._cached_properties = schema.properties
 
     @property
     def nodetype(self):
         """
         Return the node type of this node as a string
         """
-        return self.cmd(getNodeClassName=self.index)
+        # a node can't change its type, so this is only queried once
+        if self._nodetype is None:
+            self._nodetype = self.cmd(getNodeClassName=self.index)
+        return self._nodetype
+
+    @property
+    def node_class(self):
+        """
+        Return the SFXNodeType class for this node's type, or None if it isn't one of the known types
+        """
+        if self.flavour is None:
+            self.flavour = cmds.nodeType(self.node)
+        return node_registry[self.flavour].by_type.get(self.nodetype)
 
     @property
     def properties(self):
         """
-        returns a dictionary of { property_name: property_type} for all properties in this node
+        returns a dictionary of { property_name: property_type} for all properties in this node. The dictionary
+        belongs to the shared SFXNodeSchema for this node type, so it is read-only.
         """
+        if self._cached_properties is None:
+            self._load_schema()
         return self._cached_properties
 
+    @property
+    def inputs(self):
+        """
+        returns the SFXPlugs for the input side of this node
+        """
+        if self._inputs is None:
+            self._load_schema()
+        return self._inputs
+
+    @property
+    def outputs(self):
+        """
+        returns the SFXPlugs for the output side of this node
+        """
+        if self._outputs is None:
+            self._load_schema()
+        return self._outputs
+
     def __getattr__(self, item):
         """
         Magic property getter
         """
-        if item in self.__slots__:
+        # slots, python properties and methods live on the class: if we get here for one of them it's an unset slot
+        # or an AttributeError inside a property, which should not be mistaken for a missing shaderfx property
+        if hasattr(type(self), item):
             return object.__getattribute__(self, item)
 
-        if item in self._cached_properties:
-            return self.cmd(gpv=(self.index, item))
+        if item in self.properties:
+            batch = self._network and self._network._batch
+            if batch and (self.index, item) in batch.properties:
+                return batch.properties[(self.index, item)]
+            return self._get_property(item)
         raise SFXPropertyNotFound, 'no attribute named %s' % item
 
     def __setattr__(self, key, value):
         """
         Magic property setter
         """
-        if key in self.__slots__:
+        if hasattr(type(self), key):
             object.__setattr__(self, key, value)
             return
-        if key in self._cached_properties:
+        if key in self.properties:
+            batch = self._network and self._network._batch
+            if batch:
+                batch.set_property(self, key, value)
+            else:
+                self._set_property(key, value)
 
-            flag = 'edit_' + self._cached_properties[key]
+    @_operation
+    def _get_property(self, key):
+        """
+        returns the value of the shaderfx property <key>
+        """
+        return self.cmd(gpv=(self.index, key))
 
-            args = [self.index, key]
-            if hasattr(value, '__iter__'):
-                args.extend([i for i in value])
-            else:
-                args.append(value)
-            flags = {flag: tuple(args)}
-            self.cmd(**flags)
+    @_operation
+    def _set_property(self, key, value):
+        """
+        sets the shaderfx property <key> to <value>
+        """
+        flag = 'edit_' + self.properties[key]
+
+        args = [self.index, key]
+        if hasattr(value, '__iter__'):
+            args.extend([i for i in value])
+        else:
+            args.append(value)
+        flags = {flag: tuple(args)}
+        self.cmd(**flags)
+        if self._network is not None:
+            if key == 'name':
+                self._network._node_renamed(self, value)
+            # picking the active socket doesn't change the shader, setting its swizzle does
+            if key not in UI_PROPERTIES and key != 'activesocket':
+                self._network._changed(self.index)
+
+    def __eq__(self, other):
+        return isinstance(other, SFXNode) and self.index == other.index and self.node == other.node
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.node, self.index))
 
     def __repr__(self):
         return "<sfxNode '{0}' ({1})>".format(self.name, self.nodetype)
@@ -205,13 +681,195 @@ class SFXGroupNode(SFXNode):
     that outputs are managed. Group nodes do not correctly report the output values they display: those are
     delegated to a separate 'group end node' which is captured here.
     """
-    __slots__ = ['cmd', 'index', 'node', '_cached_properties', 'nodetype', 'inputs', 'outputs', 'properties',
-                 'end_node']
+    __slots__ = ['_end_node']
+
+    # groups of different kinds don't have the same plugs, so they always query their own schema
+    CACHE_SCHEMA = False
 
-    def __init__(self, node, idx):
-        super(SFXGroupNode, self).__init__(node, idx)
-        self.end_node = SFXNode(node, self.cmd(getGroupEndUID=idx))
-        self.outputs = self.end_node.outputs
+    def __init__(self, node, idx, lazy=True, flavour=None):
+        self._end_node = None
+        super(SFXGroupNode, self).__init__(node, idx, lazy, flavour)
+        if not lazy:
+            self.end_node._load_schema()
+
+    @property
+    def end_node(self):
+        """
+        returns the SFXGroupEndNode which owns the outputs of the group
+        """
+        if self._end_node is None:
+            self._end_node = SFXGroupEndNode(self.node, self.cmd(getGroupEndUID=self.index), flavour=self.flavour)
+            self._end_node._network = self._network
+        return self._end_node
+
+    @property
+    def outputs(self):
+        return self.end_node.outputs
+
+
+class SFXGroupEndNode(SFXNode):
+    """
+    The hidden node at the end of a group, which carries the outputs of its SFXGroupNode. Like the group node itself
+    it never shares a schema with other nodes.
+    """
+    __slots__ = []
+
+    CACHE_SCHEMA = False
+
+
+class SFXBatch(object):
+    """
+    Collects the edits made to an SFXNetwork inside a 'with network.batch():' block and sends them to the shader
+    when the block ends. See SFXNetwork.batch()
+
+    Property sets are coalesced, so only the last value set for each node property is sent. Connections,
+    disconnections and the socket properties used for swizzling (which depend on the order they are set in) are kept
+    in order and sent after the other properties.
+
+        queued:     the number of edits made inside the block
+        issued:     the number of shaderfx commands sent for them
+        coalesced:  the number of commands which were saved by coalescing property sets
+    """
+    # these properties pick a socket and then set its swizzle, so they can't be reordered or coalesced
+    SOCKET_PROPERTIES = ('activesocket', 'socketswizzlevalue')
+
+    def __init__(self, network):
+        self.network = network
+        # { (node_index, property): value }, in the order the properties were first set
+        self.properties = OrderedDict()
+        # [ (method, args) ] for edits that have to stay in order
+        self.sequence = []
+        self.queued = 0
+        self.issued = 0
+        self.coalesced = 0
+
+    def set_property(self, node, key, value):
+        self.queued += 1
+        if key in self.SOCKET_PROPERTIES:
+            self.sequence.append(('property', (node.index, key, value)))
+            return
+        if (node.index, key) in self.properties:
+            self.coalesced += 1
+        self.properties[(node.index, key)] = value
+
+    def connect(self, start_plug, end_plug, swizzle=None):
+        self.queued += 1
+        self.sequence.append(('connect', (start_plug, end_plug, swizzle)))
+
+    def disconnect(self, start_plug, end_plug):
+        self.queued += 1
+        self.sequence.append(('disconnect', (start_plug, end_plug)))
+
+    def discard_node(self, idx):
+        """
+        drop the queued edits for a node that has been deleted
+        """
+        for key in [k for k in self.properties if k[0] == idx]:
+            del self.properties[key]
+        keep = []
+        for method, args in self.sequence:
+            if method == 'property':
+                nodes = (args[0],)
+            else:
+                nodes = (args[0][0], args[1][0])
+            if idx not in nodes:
+                keep.append((method, args))
+        self.sequence = keep
+
+    @_operation
+    def flush(self):
+        """
+        send the queued edits to the shader. This is called automatically at the end of the batch() block
+        """
+        network = self.network
+        for (idx, key), value in self.properties.items():
+            network.nodes[idx]._set_property(key, value)
+            self.issued += 1
+        for method, args in self.sequence:
+            if method == 'property':
+                idx, key, value = args
+                network.nodes[idx]._set_property(key, value)
+                self.issued += 1
+            elif method == 'connect':
+                network.connect(*args)
+                self.issued += 3 if args[2] else 1
+            else:
+                network.disconnect(*args)
+                self.issued += 1
+        self.properties.clear()
+        self.sequence = []
+
+    def __repr__(self):
+        return "<sfxBatch queued: {0} issued: {1} coalesced: {2}>".format(self.queued, self.issued, self.coalesced)
+
+
+class SFXPatch(object):
+    """
+    The changes needed to make one network match another, as found by SFXNetwork.diff() and sent by
+    SFXNetwork.apply_patch(). Nodes are identified by key (see SFXNetwork.node_keys()) and plugs by 'key.plug' strings,
+    so a patch is plain data which can be saved as json:
+
+        add:         build() node specs for the nodes to create
+        delete:      the keys of the nodes to delete
+        set:         ( key, property, value ) for each property to change
+        disconnect:  ( 'key.output', 'key.input' ) for each connection to break
+        connect:     ( 'key.output', 'key.input' [, swizzle] ) for each connection to make
+    """
+
+    def __init__(self):
+        self.add = []
+        self.delete = []
+        self.set = []
+        self.disconnect = []
+        self.connect = []
+
+    def __len__(self):
+        return len(self.add) + len(self.delete) + len(self.set) + len(self.disconnect) + len(self.connect)
+
+    def __repr__(self):
+        return "<sfxPatch add: {0} delete: {1} set: {2} disconnect: {3} connect: {4}>".format(
+            len(self.add), len(self.delete), len(self.set), len(self.disconnect), len(self.connect))
+
+
+def _same_value(value, other):
+    """
+    compare property values, allowing for lists vs tuples and float rounding
+    """
+    if isinstance(value, (list, tuple)) and isinstance(other, (list, tuple)):
+        return len(value) == len(other) and all(_same_value(a, b) for a, b in zip(value, other))
+    if isinstance(value, float) or isinstance(other, float):
+        try:
+            return abs(float(value) - float(other)) < 1e-6
+        except (TypeError, ValueError):
+            return False
+    return value == other
+
+
+def _hashable(value):
+    """
+    a hashable version of a property value for dedupe() and fingerprint(), with lists as tuples and floats rounded
+    like _same_value()
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _load_snapshot_schemas(snapshot):
+    """
+    add the node schemas saved in <snapshot> to the schema cache, if it was taken in this version of Maya
+    """
+    if snapshot.header.get('maya') != maya_version():
+        return
+    for nodetype, schema in snapshot.schemas.items():
+        key = (nodetype, maya_version(), snapshot.header['flavour'])
+        if key not in schema_cache.schemas:
+            properties = dict((k, v and str(v)) for k, v in schema['properties'].items())
+            schema_cache.schemas[key] = SFXNodeSchema.from_dict(dict(schema, properties=properties))
 
 
 class SFXNetwork(object):
@@ -221,7 +879,10 @@ class SFXNetwork(object):
     Usage:
 
         network = SFXNetwork('shader')
-        # create a network
+        # create a network. Nodes are lazy: their properties and plugs are only queried when first used
+
+        network = SFXNetwork('shader', lazy=False)
+        # create a network, querying the properties and plugs of every node up front
 
         print network.root
         # <sfxNode UnlitBase (1)>
@@ -265,10 +926,151 @@ class SFXNetwork(object):
         # alternate syntax: delete node at index 2
     """
 
-    def __init__(self, shader):
+    @_operation
+    def __init__(self, shader, lazy=True):
+        self._setup(shader, lazy)
+        self._load_nodes()
+
+    def _setup(self, shader, lazy):
+        """
+        sets up an empty network object for <shader>, before any nodes are loaded
+        """
         self.shader = shader
+        self.lazy = lazy
+        self.flavour = cmds.nodeType(shader)
         self.nodes = {}
-        self.cmd = partial(cmds.shaderfx, n=self.shader)
+        self.cmd = partial(_shaderfx, n=self.shader)
+        self._edge_index = None
+        self._names = KeyIndex()
+        self._type_index = None
+        self._batch = None
+        # { node index: hash } for fingerprint()
+        self._fingerprints = {}
+
+    def _wrap(self, idx, is_group=False, nodetype=None):
+        """
+        creates the SFXNode or SFXGroupNode for node <idx> and attaches it to this network. If the <nodetype> is
+        already known it's recorded so the node doesn't have to ask for it.
+        """
+        if is_group:
+            result = SFXGroupNode(self.shader, idx, self.lazy, self.flavour)
+        else:
+            result = SFXNode(self.shader, idx, self.lazy, self.flavour)
+        result._network = self
+        if nodetype:
+            result._nodetype = nodetype
+        return result
+
+    def _load_nodes(self, found=None, root_index=None):
+        """
+        (re)builds the node table and the name index from the shader, or from <found> and <root_index> if they are
+        already known. Nodes which are already in the table keep their wrappers.
+        """
+        if found is None:
+            found = self._discover()
+        nodes = {}
+        names = KeyIndex()
+        for idx, is_group, name, nodetype in found:
+            result = self.nodes.get(idx)
+            if result is None or isinstance(result, SFXGroupNode) != bool(is_group):
+                result = self._wrap(idx, is_group, nodetype)
+            if name:
+                nodes[idx] = result
+                names.set(idx, name)
+
+        # group end nodes are found by the search as ordinary nodes: use the group's own end node instead, so they
+        # don't pick up a cached schema from some other kind of group. A snapshot doesn't name them, so they're
+        # added here if they weren't found
+        for group in [n for n in nodes.values() if isinstance(n, SFXGroupNode)]:
+            nodes[group.end_node.index] = group.end_node
+        self.nodes = nodes
+        self._names = names
+        self._type_index = None
+        self._fingerprints = {}
+
+        if root_index is None:
+            root_index = self.cmd(rhw=True)
+        self.root = self.node(root_index)
+
+    @_operation
+    def refresh(self):
+        """
+        Resynchronize the node table and the connection index with the shader. Use this if the graph has been edited
+        by something other than this network object, such as the ShaderFX editor or a loadGraph.
+        """
+        self._load_nodes()
+        self._edge_index = self._query_edges()
+
+    @_operation
+    def _discover(self):
+        """
+        Returns a list of ( index, is_group_start, name, nodetype ) for every node in the network, using the saved
+        graph if possible and falling back to searching for node ids if not. <nodetype> is None if it isn't known.
+        """
+        found = self._discover_from_graph()
+        if found is None:
+            found = self._discover_by_probe()
+        return found
+
+    def _discover_from_graph(self):
+        """
+        Finds all the nodes in one go by saving the graph to a temporary file and reading the node ids out of it.
+        Returns None if that fails or the file doesn't account for every node in the network. Either way a warning is
+        logged, since it usually means the file isn't in the layout sfx.sfxfile expects.
+        """
+        from sfx import sfxfile
+        try:
+            with self._saved_graph() as saved:
+                found = list(sfxfile.iter_node_records(saved))
+        except (RuntimeError,) + sfxfile.READ_ERRORS as e:
+            logger.warning("can't read the saved graph of %s, probing for its nodes instead: %s", self.shader, e)
+            return None
+
+        count = self.cmd(getNodeCount=True)
+        if len(found) != count:
+            logger.warning('the saved graph of %s has %d nodes, not %d: probing for its nodes instead', self.shader,
+                           len(found), count)
+            return None
+        results = []
+        for idx, is_group, name, nodetype in found:
+            if name is None:
+                name = self.cmd(gpv=(idx, 'name'))
+            results.append((idx, is_group, name, nodetype))
+        return results
+
+    @contextmanager
+    def _saved_graph(self):
+        """
+        saves the graph with saveGraph to a temporary file, which is deleted again at the end of the with block, and
+        yields its path
+        """
+        import tempfile
+        handle, temp_file = tempfile.mkstemp(suffix='.sfx')
+        os.close(handle)
+        try:
+            self.cmd(saveGraph=temp_file)
+            yield temp_file
+        finally:
+            os.remove(temp_file)
+
+    def _graph_digest(self):
+        """
+        returns a sha1 of the graph as saveGraph writes it, or None if it can't be saved. Any edit to the shader,
+        even moving a node, changes it, so it's a cheap way to tell that a shader hasn't changed without reading it
+        """
+        try:
+            with self._saved_graph() as saved:
+                with open(saved, 'rb') as handle:
+                    return hashlib.sha1(handle.read()).hexdigest()
+        except (RuntimeError, EnvironmentError):
+            return None
+
+    def _discover_by_probe(self):
+        """
+        Finds all the nodes by trying ids one at a time until the node count is reached. This is slow, particularly
+        on networks where lots of nodes have been deleted, so it's only used if _discover_from_graph() fails.
+        """
+        results = []
         found = 0
         nodes = self.cmd(getNodeCount=True)
         for r in range(1, 7999):
@@ -278,21 +1080,14 @@ class SFXNetwork(object):
             # so we try random IDs until we have our count
             # we'll rarely get past 20 or so...
             try:
-                result = None
-                if self.cmd(isGroupStart=r):
-                    result = SFXGroupNode(self.shader, r)
-                else:
-                    result = SFXNode(self.shader, r)
-
-                if result.name:
-                    self.nodes[result.index] = result
+                is_group = self.cmd(isGroupStart=r)
+                results.append((r, is_group, self.cmd(gpv=(r, 'name')), None))
                 found += 1
             except:
                 pass
+        return results
 
-        root_index = self.cmd(rhw=True)
-        self.root = SFXNode(self.shader, root_index)
-
+    @_operation
     def add(self, node_klass, name=None):
         """
         Add a new node of type <node_klass> to the network, with the optional name.  <node_Klass> is either one of the
@@ -303,23 +1098,61 @@ class SFXNetwork(object):
 
         new_node_id = self.cmd(addNode=node_klass.ID)
 
-        result = SFXNode(self.shader, new_node_id)
-        if name:
-            result.name = name
-        self.nodes[result.index] = result
+        # the class name of an ordinary node is the TYPE it was created from
+        result = self._wrap(new_node_id, nodetype=node_klass.TYPE)
+        self._register(result, name)
         return result
 
+    @_operation
     def _add_group(self, node_klass, name=None):
         """
         adds a group node of type node_klass.  Only called from add()
         """
         new_node_id = self.cmd(addGroup=node_klass.group_id())
-        result = SFXGroupNode(self.shader, new_node_id)
-        if name:
-            result.name = name
-        self.nodes[result.index] = result
+        result = self._wrap(new_node_id, True)
+        self._register(result, name)
+        # the end node owns the group's outputs, so connections from the group come from it
+        self.nodes[result.end_node.index] = result.end_node
+        return result
+
+    def node(self, idx):
+        """
+        Returns the wrapper for node <idx>. There is only one for each node in the network, so this is the same
+        object as network.nodes[idx]. A node which isn't in the table yet, because it was made by something other
+        than this network, is wrapped and added to it.
+        """
+        result = self.nodes.get(idx)
+        if result is None:
+            result = self._wrap(idx, self.cmd(isGroupStart=idx))
+            self.nodes[idx] = result
+            self._names.set(idx, self.cmd(gpv=(idx, 'name')))
+            if self._type_index is not None:
+                self._type_index.set(idx, result.nodetype)
         return result
 
+    def _register(self, node, name=None):
+        """
+        adds a newly created node to the node table and the indices, naming it if <name> is supplied. Otherwise the
+        name ShaderFX gave the node is queried once, so the index holds the real name rather than a guess at it.
+        """
+        self.nodes[node.index] = node
+        if name:
+            node.name = name
+            # inside a batch() the name isn't sent until the end, but the node has to be indexed now
+            self._names.set(node.index, name)
+        else:
+            self._names.set(node.index, self.cmd(gpv=(node.index, 'name')))
+        if self._type_index is not None:
+            self._type_index.set(node.index, node.nodetype)
+
+    def _node_renamed(self, node, name):
+        """
+        called by SFXNode when its name is set, to keep the name index current
+        """
+        if node.index in self.nodes:
+            self._names.set(node.index, name)
+
+    @_operation
     def delete(self, node_or_id):
         """
         remove the specified node from the network.
@@ -327,9 +1160,24 @@ class SFXNetwork(object):
         if hasattr(node_or_id, 'index'):
             node_or_id = node_or_id.index
 
-        del (self.nodes[node_or_id])
+        node = self.nodes.pop(node_or_id)
         self.cmd(deleteNode=node_or_id)
-
+        # deleting a group deletes its end node too
+        removed = [node_or_id]
+        if isinstance(node, SFXGroupNode) and node._end_node is not None:
+            removed.append(node._end_node.index)
+            self.nodes.pop(node._end_node.index, None)
+        for idx in removed:
+            self._changed(idx)
+            if self._batch is not None:
+                self._batch.discard_node(idx)
+            self._names.remove(idx)
+            if self._type_index is not None:
+                self._type_index.remove(idx)
+            if self._edge_index is not None:
+                self._edge_index.remove_node(idx)
+
+    @_operation
     def connect(self, start_plug, end_plug, swizzle=None):
         """
         connect two sockets, represented by SFXPlug tuples of (node, socket).  Ordinarily you'd call this like
@@ -348,14 +1196,23 @@ class SFXNetwork(object):
         'specularcolor' and so on. In PBS networks spaces become underscores
 
         """
+        if self._batch is not None:
+            self._batch.connect(start_plug, end_plug, swizzle)
+            return
+
         node, plug = start_plug
         node2, plug2 = end_plug
 
         self.cmd(makeConnection=(node, plug, node2, plug2))
+        self._changed(node2)
+        if self._edge_index is not None:
+            self._edge_index.connect(node, plug, node2, plug2)
         if swizzle:
-            node2.activesocket = plug2
-            node2.socketswizzlevalue = swizzle
+            target = self.nodes[node2]
+            target.activesocket = plug2
+            target.socketswizzlevalue = swizzle
 
+    @_operation
     def disconnect(self, start_plug, end_plug):
         """
         connect two sockets, represented by SFXPlug tuples of (node, socket).  Ordinarily you'd call this like
@@ -369,57 +1226,621 @@ class SFXNetwork(object):
         will also work
 
         """
+        if self._batch is not None:
+            self._batch.disconnect(start_plug, end_plug)
+            return
+
         node, plug = start_plug
         node2, plug2 = end_plug
         self.cmd(breakConnection=(node, plug, node2, plug2))
+        self._changed(node2)
+        if self._edge_index is not None:
+            self._edge_index.disconnect(node, plug, node2, plug2)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the edits made inside a 'with' block and send them all at the end, as a single undo step:
+
+            with network.batch() as batch:
+                for node in network.find_by_type(sfxnodes.Color):
+                    node.color = (1, 0, 0, 1)
+                    node.posx = node.posx + 100
+                    node.posx = node.posx + 100
+                network.connect(mult_node.outputs.result, network.root.inputs.color)
+
+            print batch
+            # <sfxBatch queued: 79 issued: 53 coalesced: 26>
+
+        Only the last value set for each node property is sent, and reading a property inside the block returns the
+        value waiting to be set. Connections and disconnections are sent after the properties, in the order they were
+        made. Nodes are still added and deleted immediately, and the other queries on the network (get_inputs(),
+        find_by_name() and so on) don't see the queued edits until the block ends. If the block raises, the queued
+        edits are dropped.
+
+        Batches can be nested: an inner batch() just joins the outer one.
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+
+        batch = self._batch = SFXBatch(self)
+        cmds.undoInfo(openChunk=True)
+        try:
+            try:
+                yield batch
+            finally:
+                self._batch = None
+            batch.flush()
+        finally:
+            cmds.undoInfo(closeChunk=True)
+
+    @_operation
+    def build(self, spec):
+        """
+        Add the nodes, property values and connections described by <spec> to this network, and return a dictionary
+        of { name: node } for the new nodes. The spec is a dictionary (so it can come from json):
+
+            spec = {
+                'nodes': [
+                    {'name': 'tint', 'type': pbsnodes.ConstantVector4, 'properties': {'value': (1, 0, 0, 1)}},
+                    {'name': 'mult', 'type': 'Multiply'},
+                ],
+                'connections': [
+                    ('tint.rgba', 'mult.a'),
+                    ('mult.result', 'root.base_color', 'xyz'),
+                ]
+            }
+            nodes = network.build(spec)
+
+        Node types are SFXNodeType classes from the sfxnodes or pbsnodes module matching this network, the
+        names of those classes or their TYPE strings. Connections are ( 'node.output', 'node.input' ) pairs with an
+        optional swizzle. Plugs can belong to new nodes or to nodes already in the network, by name; 'root' is the
+        network root. A node spec can have a 'key' which is used instead of its name in connections and in the
+        returned dictionary, so that several new nodes can share a name, and the spec can set properties on the
+        root with a 'root': {'properties': {...}} entry.
+
+        The whole spec is checked before anything is changed, and an SFXSpecError listing all the problems is raised
+        if it is invalid. Plug and property names can only be checked once the schema for a node type is known. If
+        a new type turns out to be used incorrectly after its nodes are added, they are deleted again before the
+        error is raised. Everything else is sent as a single batch().
+        """
+        problems = []
+        node_specs = spec.get('nodes', [])
+        connections = [tuple(c) for c in spec.get('connections', [])]
+
+        root_properties = spec.get('root', {}).get('properties', {})
+
+        types = {}
+        for n, node_spec in enumerate(node_specs):
+            name = node_spec.get('name')
+            if not name:
+                problems.append('node %d has no name' % n)
+                continue
+            key = node_spec.get('key', name)
+            if key in types or key == 'root':
+                problems.append('duplicate node name %s' % key)
+            node_klass = node_registry.resolve(self.flavour, node_spec.get('type'))
+            if node_klass is None:
+                problems.append('unknown %s node type %r for %s' % (self.flavour, node_spec.get('type'), key))
+            types[key] = node_klass
+
+        for key in root_properties:
+            if key not in self.root.properties:
+                problems.append('root has no property %s' % key)
+
+        def plug_node(plug):
+            node_name = plug.rsplit('.', 1)[0]
+            if node_name in types or node_name == 'root':
+                return node_name
+            if len(self.find_by_name(node_name)) != 1:
+                problems.append('%s does not name a new node or a single existing node' % plug)
+            return node_name
+
+        for connection in connections:
+            if len(connection) not in (2, 3) or not all('.' in p for p in connection[:2]):
+                problems.append('bad connection %r' % (connection,))
+                continue
+            plug_node(connection[0])
+            plug_node(connection[1])
+        if problems:
+            raise SFXSpecError(problems)
+
+        # check everything that can be checked against schemas we already know about
+        problems.extend(self._check_spec_schemas(node_specs, connections, types, {}))
+        if problems:
+            raise SFXSpecError(problems)
+
+        with self.batch():
+            created = {}
+            for node_spec in node_specs:
+                key = node_spec.get('key', node_spec['name'])
+                created[key] = self.add(types[key], node_spec['name'])
+
+            problems = self._check_spec_schemas(node_specs, connections, types, created)
+            if problems:
+                for node in created.values():
+                    self.delete(node)
+                raise SFXSpecError(problems)
+
+            def plug(ref, side):
+                node_name, plug_name = ref.rsplit('.', 1)
+                node = created.get(node_name) or self._named_node(node_name)
+                return getattr(getattr(node, side), plug_name)
+
+            for node_spec in node_specs:
+                node = created[node_spec.get('key', node_spec['name'])]
+                for key, value in node_spec.get('properties', {}).items():
+                    setattr(node, key, value)
+            for key, value in root_properties.items():
+                setattr(self.root, key, value)
+            for connection in connections:
+                swizzle = connection[2] if len(connection) > 2 else None
+                self.connect(plug(connection[0], 'outputs'), plug(connection[1], 'inputs'), swizzle)
+        return created
+
+    def _check_spec_schemas(self, node_specs, connections, types, created):
+        """
+        check the property and plug names in a build() spec. New nodes are checked against the cached schema for
+        their type, or against the <created> node if there is one; anything else is skipped.
+        """
+        problems = []
+
+        def schema_for(node_name):
+            if node_name in created:
+                node = created[node_name]
+                return node.properties, node.inputs.sockets, node.outputs.sockets
+            if node_name in types:
+                node_klass = types[node_name]
+                if hasattr(node_klass, 'group_id'):
+                    return None
+                schema = schema_cache.schemas.get((node_klass.TYPE, maya_version(), self.flavour))
+                return schema and (schema.properties, schema.inputs, schema.outputs)
+            node = self._named_node(node_name)
+            return node.properties, node.inputs.sockets, node.outputs.sockets
+
+        for node_spec in node_specs:
+            node_key = node_spec.get('key', node_spec['name'])
+            schema = schema_for(node_key)
+            if schema is None:
+                continue
+            for key in node_spec.get('properties', {}):
+                if key not in schema[0]:
+                    problems.append('%s has no property %s' % (node_key, key))
+
+        for connection in connections:
+            for ref, side in ((connection[0], 2), (connection[1], 1)):
+                node_name, plug_name = ref.rsplit('.', 1)
+                schema = schema_for(node_name)
+                if schema is not None and plug_name not in schema[side]:
+                    problems.append('%s has no %s plug %s' % (node_name, ('', 'input', 'output')[side], plug_name))
+        return problems
+
+    def _named_node(self, name):
+        """
+        returns the root for 'root', or the single node called <name>
+        """
+        if name == 'root':
+            return self.root
+        return self.find_by_name(name)[0]
+
+    def node_keys(self):
+        """
+        Returns an OrderedDict of { key: node } which identifies the nodes of this network by name, for comparing it
+        with other networks. The root is 'root'. A node with a unique name is keyed by its name; nodes which share a
+        name are numbered in index order as 'name#1', 'name#2' and so on. Group end nodes are left out, since their
+        output plugs belong to their group.
+        """
+        keys = OrderedDict([('root', self.root)])
+        for idx in sorted(self.nodes):
+            node = self.nodes[idx]
+            if idx == self.root.index or isinstance(node, SFXGroupEndNode):
+                continue
+            name = self._names.keys[idx]
+            shared = self._names.find(name)
+            if len(shared) > 1:
+                name = '%s#%d' % (name, shared.index(idx) + 1)
+            keys[name] = node
+        return keys
+
+    def to_spec(self, ignore=UI_PROPERTIES):
+        """
+        Returns a build() spec describing every node, property value and connection in this network, except for the
+        properties in <ignore>. The spec is plain data with types given as TYPE strings, so it can be saved as json.
+        """
+        keys = self.node_keys()
+        nodes = []
+        for key, node in keys.items():
+            if key == 'root':
+                continue
+            node_spec = {'name': self._names.keys[node.index], 'type': node.nodetype,
+                         'properties': self._property_values(node, ignore)}
+            if key != node_spec['name']:
+                node_spec['key'] = key
+            nodes.append(node_spec)
+        return {'root': {'properties': self._property_values(self.root, ignore)},
+                'nodes': nodes,
+                'connections': sorted(self._connection_refs(keys))}
+
+    def _property_values(self, node, ignore):
+        """
+        returns { property: value } for the properties of <node> that describe the shader, skipping <ignore>
+        """
+        skip = set(ignore) | set(SFXBatch.SOCKET_PROPERTIES) | set(['name'])
+        results = {}
+        for key in node.properties:
+            if key in skip:
+                continue
+            try:
+                results[key] = getattr(node, key)
+            except RuntimeError:
+                # some properties, like the buttons in the property editor, don't have values
+                pass
+        return results
+
+    def _connection_refs(self, keys):
+        """
+        yields ( 'key.output', 'key.input' ) for each connection between the nodes in <keys>
+        """
+        for edge, refs in self._edge_refs(keys):
+            if refs is not None:
+                yield refs
+
+    def _edge_refs(self, keys):
+        """
+        yields ( edge, ( 'key.output', 'key.input' ) ) for every connection in the network, where <edge> is
+        ( source, source_socket, target, target_socket ). The plug names are None if the nodes at either end aren't in
+        <keys>
+        """
+        sources = dict((node.index, key) for key, node in keys.items())
+        targets = dict(sources)
+        for key, node in keys.items():
+            if isinstance(node, SFXGroupNode):
+                sources[node.end_node.index] = key
+
+        plug_names = {}
+
+        def plug_name(key, side, socket):
+            if (key, side) not in plug_names:
+                sockets = getattr(keys[key], side).sockets
+                plug_names[(key, side)] = dict((v, k) for k, v in sockets.items())
+            return '%s.%s' % (key, plug_names[(key, side)][socket])
+
+        for edge in self.edges.edges():
+            source, source_socket, target, target_socket = edge
+            if source in sources and target in targets and source_socket is not None:
+                yield edge, (plug_name(sources[source], 'outputs', source_socket),
+                             plug_name(targets[target], 'inputs', target_socket))
+            else:
+                yield edge, None
+
+    @_operation
+    def diff(self, other, ignore=UI_PROPERTIES, delete=True):
+        """
+        Compare this network with <other>, which is another SFXNetwork or a build() spec, and return an SFXPatch with
+        the changes that would make this network match it:
+
+            patch = derived.diff(master)
+            print patch
+            # <sfxPatch add: 1 delete: 0 set: 3 disconnect: 0 connect: 1>
+            derived.apply_patch(patch)
+
+        Nodes are matched by key (see node_keys()). A matched node whose type has changed is deleted and added again.
+        Only the properties given for a node in a spec are compared, and the properties in <ignore> (by default the
+        editor-only UI_PROPERTIES) are never compared, so node positions are kept. If <delete> is False, nodes and
+        connections which aren't in <other> are left alone, which is useful for specs that only describe part of a
+        network. Swizzles are only applied to new connections: existing connections are not checked for a changed
+        swizzle.
+        """
+        target = other.to_spec(ignore) if isinstance(other, SFXNetwork) else other
+        keys = self.node_keys()
+        patch = SFXPatch()
+
+        wanted = OrderedDict()
+        for node_spec in target.get('nodes', []):
+            wanted[node_spec.get('key', node_spec['name'])] = node_spec
+
+        def compare(key, node, properties):
+            for prop, value in sorted(properties.items()):
+                if prop not in ignore and not _same_value(getattr(node, prop), value):
+                    patch.set.append((key, prop, value))
+
+        compare('root', self.root, target.get('root', {}).get('properties', {}))
+        for key, node_spec in wanted.items():
+            node = keys.get(key)
+            if node is not None:
+                node_klass = node_registry.resolve(self.flavour, node_spec['type'])
+                if node.nodetype != getattr(node_klass, 'TYPE', node_spec['type']):
+                    patch.delete.append(key)
+                    node = None
+            if node is None:
+                patch.add.append(node_spec)
+            else:
+                compare(key, node, node_spec.get('properties', {}))
+        if delete:
+            patch.delete.extend(k for k in keys if k != 'root' and k not in wanted)
+
+        # connections to deleted nodes go with them, and connections to replaced nodes have to be made again
+        gone = set(patch.delete)
+        current = set(self._connection_refs(keys))
+        connections = OrderedDict()
+        for connection in target.get('connections', []):
+            connections[tuple(connection[:2])] = tuple(connection)
+        for start, end in sorted(current) if delete else ():
+            if (start, end) not in connections and not gone.intersection(r.rsplit('.', 1)[0] for r in (start, end)):
+                patch.disconnect.append((start, end))
+        for (start, end), connection in connections.items():
+            if (start, end) not in current or gone.intersection(r.rsplit('.', 1)[0] for r in (start, end)):
+                patch.connect.append(connection)
+        return patch
+
+    @_operation
+    def apply_patch(self, patch):
+        """
+        Make the changes in an SFXPatch from diff(), as a single batch(). Nodes are deleted first, then new nodes are
+        added with build(), then properties are set and connections are broken and made.
+        """
+        with self.batch():
+            keys = self.node_keys()
+            for key in patch.delete:
+                self.delete(keys.pop(key))
+            keys.update(self.build({'nodes': patch.add}))
+
+            def plug(ref, side):
+                key, plug_name = ref.rsplit('.', 1)
+                return getattr(getattr(keys[key], side), plug_name)
+
+            for key, prop, value in patch.set:
+                setattr(keys[key], prop, value)
+            for start, end in patch.disconnect:
+                self.disconnect(plug(start, 'outputs'), plug(end, 'inputs'))
+            for connection in patch.connect:
+                swizzle = connection[2] if len(connection) > 2 else None
+                self.connect(plug(connection[0], 'outputs'), plug(connection[1], 'inputs'), swizzle)
+
+    @_operation
+    def snapshot(self, path=None):
+        """
+        Capture the nodes, property values and connections of this network in an SFXSnapshot, and write it to <path>
+        if one is given. SFXNetwork.restore() turns a snapshot back into a network, and sfx.snapshot can read it
+        without Maya. See the sfx.snapshot module for the file format.
+        """
+        from sfx.snapshot import SFXSnapshot
+        keys = dict((node.index, key) for key, node in self.node_keys().items())
+        result = SFXSnapshot({'shader': self.shader, 'flavour': self.flavour, 'maya': maya_version(),
+                              'root': self.root.index, 'node_count': self.cmd(getNodeCount=True),
+                              'graph_digest': self._graph_digest()})
+
+        nodes = dict(self.nodes)
+        nodes.setdefault(self.root.index, self.root)
+        for idx, node in sorted(nodes.items()):
+            is_group = isinstance(node, SFXGroupNode)
+            if not is_group and not isinstance(node, SFXGroupEndNode) and node.nodetype not in result.schemas:
+                result.schemas[node.nodetype] = {
+                    'properties': dict(node.properties),
+                    'inputs': sorted(node.inputs.sockets, key=node.inputs.sockets.get),
+                    'outputs': sorted(node.outputs.sockets, key=node.outputs.sockets.get)}
+            result.nodes[idx] = {'key': keys.get(idx), 'name': self._names.keys.get(idx), 'type': node.nodetype,
+                                 'group': is_group, 'group_end': node.end_node.index if is_group else None,
+                                 'properties': self._property_values(node, ())}
+
+        for edge, refs in self._edge_refs(self.node_keys()):
+            result.edges.append(edge + (refs or (None, None)))
+        if path:
+            result.write(path)
+        return result
+
+    @classmethod
+    @_operation
+    def restore(cls, snapshot, shader=None):
+        """
+        Return a network made from <snapshot>, which is an SFXSnapshot or the path to a snapshot file, in <shader>
+        (by default the shader the snapshot was taken from).
+
+        If the shader still has the node count, root and saved graph digest recorded in the snapshot, it hasn't been
+        edited since, and the nodes, connections and schemas are loaded straight from the snapshot. Otherwise the
+        shader is created if necessary and updated to match the snapshot with diff() and apply_patch(), using the
+        node schemas saved in the snapshot instead of querying them again.
+        """
+        from sfx.snapshot import SFXSnapshot
+        if not isinstance(snapshot, SFXSnapshot):
+            snapshot = SFXSnapshot.read(snapshot)
+        header = snapshot.header
+        shader = shader or header['shader']
+
+        _load_snapshot_schemas(snapshot)
+        network_class = NETWORK_CLASSES[header['flavour']]
+        if not cmds.ls(shader):
+            network = network_class.create(shader)
+        elif cmds.nodeType(shader) != header['flavour']:
+            raise ValueError('%s is not a %s shader' % (shader, header['flavour']))
+        else:
+            network = network_class.__new__(network_class)
+            network._setup(shader, True)
+            # cheapest checks first: the digest needs a saveGraph
+            if (header.get('graph_digest') and network.cmd(getNodeCount=True) == header['node_count'] and
+                    network.cmd(rhw=True) == header['root'] and network._graph_digest() == header['graph_digest']):
+                network._load_snapshot(snapshot)
+                return network
+            network._load_nodes()
+
+        network.apply_patch(network.diff(snapshot.to_spec(), ignore=()))
+        return network
+
+    def _load_snapshot(self, snapshot):
+        """
+        fill the node table and the connection index from <snapshot> instead of the shader
+        """
+        found = [(idx, node['group'], node['name'], node['type']) for idx, node in snapshot.nodes.items()]
+        self._load_nodes(found, snapshot.header['root'])
+        self._edge_index = EdgeIndex()
+        for edge in snapshot.edges:
+            self._edge_index.connect(*edge[:4])
 
     def find_by_name(self, name):
-        return [i for i in self.nodes.values() if i.name == name]
+        # names are indexed when the network loads and kept current by add(), delete() and setting node.name;
+        # call refresh() if nodes are renamed some other way
+        return [self.nodes[i] for i in self._names.find(name)]
 
     def find_by_type(self, type):
         # accepts either type string or SFXNodeType objects
         if hasattr(type, 'TYPE'):
             type = type.TYPE
-        return [i for i in self.nodes.values() if i.nodetype == type]
+        return [self.nodes[i] for i in self.types.find(type)]
+
+    @property
+    def types(self):
+        """
+        A KeyIndex of node index <-> node type string for the nodes in this network. It is built the first time it's
+        needed; node types never change, so after that it only has to follow add() and delete()
+        """
+        if self._type_index is None:
+            self._type_index = KeyIndex()
+            for idx, node in self.nodes.items():
+                self._type_index.set(idx, node.nodetype)
+        return self._type_index
 
     def get_inputs(self, node):
         # inputs are always single items
-        results = self._get_connections(node, 0)
-        return dict((k, v[0]) for k, v in results.items() if v)
+        if hasattr(node, 'index'):
+            node = node.index
+        return dict((k, self.node(v)) for k, v in self.edges.inputs(node).items())
 
     def get_outputs(self, node):
         # outputs can have multiple items
-        return self._get_connections(node, 1)
+        if hasattr(node, 'index'):
+            node = node.index
+        if node in self.edges.stale:
+            self.edges.reset_outputs(node, self._get_connections(node, 1))
+        return dict((k, [self.node(n) for n in v]) for k, v in self.edges.outputs(node).items())
+
+    def upstream(self, start, depth=None, stop=None):
+        """
+        Yields (node, socket, depth) for every node which feeds <start>, nearest first. <start> is a node, a node
+        index or an input plug such as root.inputs.color; for a plug only what feeds that socket is visited. <socket>
+        is the input socket through which the node was reached, on the node one step nearer <start>, and <depth> is
+        how many connections away it is. Each node is visited once, at its shortest distance.
+
+            depth:  if given, don't go further than this many connections from <start>
+            stop:   a node type (an SFXNodeType class or type string) or a function taking a node. Nodes which
+                    match are yielded but the traversal doesn't continue past them.
+
+        This is a generator, so stopping early saves work:
+
+            any(n.nodetype == 'Time' for n, _, _ in network.upstream(network.root))
+
+        Once the edge index has been built this doesn't query the shader at all; until then only the nodes which
+        are actually reached are queried, so an early exit stops issuing commands.
+        """
+        return self._traverse(start, 0, depth, stop)
+
+    def downstream(self, start, depth=None, stop=None):
+        """
+        Yields (node, socket, depth) for every node fed by <start>, nearest first. <start> is a node, a node index or
+        an output plug; <socket> is the output socket through which the node was reached. See upstream().
+        """
+        return self._traverse(start, 1, depth, stop)
+
+    def _traverse(self, start, direction, depth, stop):
+        """
+        breadth first traversal for upstream() and downstream(); <direction> is 0 for inputs and 1 for outputs
+        """
+        only_socket = None
+        if isinstance(start, tuple):
+            start, only_socket = start
+        if hasattr(start, 'index'):
+            start = start.index
+
+        if isinstance(stop, basestring) or hasattr(stop, 'TYPE'):
+            stop_type = getattr(stop, 'TYPE', stop)
+            stop = lambda n: n.nodetype == stop_type
+
+        # group outputs live on the group's hidden end node: traverse the group itself in its place
+        groups = dict((n.end_node.index, n) for n in self.nodes.values() if isinstance(n, SFXGroupNode))
+
+        def connections(idx):
+            if direction == 1 and isinstance(self.nodes.get(idx), SFXGroupNode):
+                idx = self.nodes[idx].end_node.index
+            if self._edge_index is None:
+                return self._get_connections(idx, direction)
+            if direction == 0:
+                return dict((k, [v]) for k, v in self._edge_index.inputs(idx).items())
+            if idx in self._edge_index.stale:
+                self._edge_index.reset_outputs(idx, self._get_connections(idx, 1))
+            return self._edge_index.outputs(idx)
+
+        start = groups[start].index if start in groups else start
+        visited = set([start])
+        queue = deque([(start, 0)])
+        while queue:
+            idx, distance = queue.popleft()
+            if depth is not None and distance >= depth:
+                continue
+            found = connections(idx)
+            for socket in sorted(found):
+                if distance == 0 and only_socket is not None and socket != only_socket:
+                    continue
+                for other in found[socket]:
+                    node = groups.get(other) or self.node(other)
+                    if node.index in visited:
+                        continue
+                    visited.add(node.index)
+                    yield node, socket, distance + 1
+                    if stop is None or not stop(node):
+                        queue.append((node.index, distance + 1))
+
+    @property
+    def edges(self):
+        """
+        The EdgeIndex of all the connections in this network. It is filled from the shader the first time it's
+        needed and then kept up to date by connect(), disconnect() and delete(), so get_inputs() and get_outputs()
+        don't have to query the shader. Call refresh() if the graph is changed some other way.
+        """
+        if self._edge_index is None:
+            self._edge_index = self._query_edges()
+        return self._edge_index
 
-    def _get_connections(self, node, direction):
+    @_operation
+    def _query_edges(self):
         """
-        An internal method to traverse and return the connections of a given plug. Returns the graph connections
-        as a dictionary  { index : node } where <index> is the integer plug index and <node> is the node connected to that plug
+        builds an EdgeIndex by querying the sockets of every node in the network
+        """
+        inputs = {}
+        outputs = {}
+        for idx in self.nodes:
+            inputs[idx] = dict((k, v[0]) for k, v in self._get_connections(idx, 0).items() if v)
+            outputs[idx] = self._get_connections(idx, 1)
+        return EdgeIndex.from_sockets(inputs, outputs)
+
+    def _get_connections(self, idx, direction):
+        """
+        An internal method which queries the shader for the connections on one side of node <idx>. Returns the graph
+        connections as a dictionary { index : [node_id, ...] } where <index> is the integer plug index and <node_id>
+        is the index of a node connected to that plug
         """
         results = {}
-        if not hasattr(node, 'index'):
-            node = self.nodes[node]
-        socket_count = self.cmd(getSocketCount=(node.index, direction))
+        socket_count = self.cmd(getSocketCount=(idx, direction))
         for s in range(socket_count):
-            conn = self.cmd(getConnectedNodeID=(node.index, direction, s, 0, 1))
+            conn = self.cmd(getConnectedNodeID=(idx, direction, s, 0, 1))
             if conn:
-                connection_count = self.cmd(getConnectedSocketCount=(node.index, direction, s))
-                connections = [self.cmd(getConnectedNodeID=(node.index, direction, s, idx, 1)) for idx in
-                               range(connection_count)]
-                results[s] = [self.nodes[n] for n in connections]
+                connection_count = self.cmd(getConnectedSocketCount=(idx, direction, s))
+                results[s] = [self.cmd(getConnectedNodeID=(idx, direction, s, n, 1)) for n in
+                              range(connection_count)]
         return results
 
     @classmethod
+    @_operation
     def create(cls, name):
         """
         Create a new shader and return the ShaderNetwork that wraps it.
         """
         sfx_shader = cmds.shadingNode('ShaderfxShader', asShader=True, name=name)
-        cmds.shaderfx(sfxnode=sfx_shader, initShaderAttributes=True)
+        _shaderfx(sfxnode=sfx_shader, initShaderAttributes=True)
         network = cls(sfx_shader)
         return network
 
     @classmethod
+    @_operation
     def instantiate(cls, name, sfxfile):
         """
         create a new shader node from the supplied SFX file.  Note that sfx and stingray pbs files use the same SFX
@@ -428,40 +1849,257 @@ class SFXNetwork(object):
         """
         network = cls.create(name)
         network.cmd(loadGraph=sfxfile)
+        network.refresh()
         return network
 
+    @_operation
+    def prune(self, dry_run=False):
+        """
+        Deletes every node which doesn't feed the root, directly or through other nodes, and returns the list of
+        nodes deleted. With dry_run=True nothing is deleted and the list is of the nodes which would be.
+
+        A group is kept or deleted along with its end node, and the nodes inside a group are kept if they feed the
+        group's end node. The deletions happen in one batch(), so they can be undone in one step.
+        """
+        ends = dict((n.end_node.index, idx) for idx, n in self.nodes.items() if isinstance(n, SFXGroupNode))
+        edges = self.edges
+
+        reachable = set()
+        pending = [self.root.index]
+        while pending:
+            idx = pending.pop()
+            if idx in reachable:
+                continue
+            reachable.add(idx)
+            pending.extend(edges.inputs(idx).values())
+            node = self.nodes.get(idx)
+            if isinstance(node, SFXGroupNode):
+                pending.append(node.end_node.index)
+            if idx in ends:
+                pending.append(ends[idx])
+
+        # end nodes go with their groups, and groups go last in case deleting one takes the nodes inside with it
+        dead = [n for idx, n in sorted(self.nodes.items()) if idx not in reachable and idx not in ends]
+        dead.sort(key=lambda n: isinstance(n, SFXGroupNode))
+        if not dry_run:
+            with self.batch():
+                for node in dead:
+                    if node.index in self.nodes:
+                        self.delete(node)
+        return dead
+
+    @_operation
+    def dedupe(self, dry_run=False, ignore=UI_PROPERTIES):
+        """
+        Merges nodes which do the same thing: the same type, the same property values (apart from the name and the
+        properties in <ignore>) and the same inputs with the same swizzles. Nodes are compared from the sources of the
+        graph towards the root, so duplicates fed by duplicates are found too. The connections out of each duplicate
+        are moved to the first node like it and the duplicate is deleted, all in one batch(). Returns { duplicate: kept
+        node }; with dry_run=True nothing is changed.
+
+        Groups, the root and the types in UNIQUE_TYPES are never merged. A dry run only queries the shader, so it
+        compares the swizzle on each node's active socket rather than on all of its inputs, and may list a merge which
+        a real run skips because of a swizzle on another socket.
+        """
+        edges = self.edges
+        self._reset_stale()
+        # a dry run may only query the shader, so it can only see the swizzle on each node's active socket
+        read_swizzles = self._active_swizzle if dry_run else self._swizzles
+
+        kept = {}
+        survivors = {}
+        merged = OrderedDict()
+        read = {}
+
+        def swizzles(idx):
+            if idx not in read:
+                read[idx] = read_swizzles(self.nodes[idx])
+            return read[idx]
+
+        for idx in self._sources_first():
+            node = self.nodes[idx]
+            outgoing = edges.targets.get(idx, {})
+            if (idx == self.root.index or isinstance(node, (SFXGroupNode, SFXGroupEndNode)) or
+                    node.nodetype in UNIQUE_TYPES or None in outgoing):
+                continue
+            inputs = sorted((socket, survivors.get(source, source), source_socket)
+                            for socket, (source, source_socket) in edges.sources.get(idx, {}).items())
+            values = sorted((k, _hashable(v)) for k, v in self._property_values(node, ignore).items())
+            key = (node.nodetype, tuple(values), tuple(inputs))
+            # swizzles take several commands per node to read, so they're only compared when everything else matches
+            match = None
+            for other in kept.get(key, ()):
+                if swizzles(other) == swizzles(idx):
+                    match = other
+                    break
+            if match is None:
+                kept.setdefault(key, []).append(idx)
+            else:
+                survivors[idx] = match
+                merged[node] = self.nodes[match]
+
+        if not dry_run:
+            # the swizzles on the consumers' inputs are read before anything changes, and set again when they are
+            # reconnected to the kept node. Consumers which are duplicates themselves are about to be deleted.
+            duplicates = set(node.index for node in merged)
+            moves = []
+            for duplicate, survivor in merged.items():
+                for source_socket, targets in edges.targets.get(duplicate.index, {}).items():
+                    for target, target_socket in targets:
+                        if target in duplicates:
+                            continue
+                        swizzle = dict(self._swizzles(self.nodes[target], [target_socket])).get(target_socket)
+                        moves.append(((survivor.index, source_socket), (target, target_socket), swizzle))
+            with self.batch():
+                for duplicate in merged:
+                    self.delete(duplicate)
+                for start_plug, end_plug, swizzle in moves:
+                    self.connect(start_plug, end_plug, swizzle)
+        return merged
+
+    def _swizzles(self, node, sockets=None):
+        """
+        returns ( (socket, swizzle), ... ) for <sockets>, by default the connected inputs of <node>. ShaderFX only
+        reports the swizzle of a node's active socket, so each socket is made active in turn and the active socket is
+        put back afterwards. That edits the shader: use _active_swizzle() where only queries are allowed.
+        """
+        if sockets is None:
+            sockets = sorted(self.edges.sources.get(node.index, {}))
+        if not sockets or 'socketswizzlevalue' not in node.properties:
+            return ()
+        active = node._get_property('activesocket')
+        results = []
+        for socket in sockets:
+            node._set_property('activesocket', socket)
+            results.append((socket, node._get_property('socketswizzlevalue')))
+        if active != sockets[-1]:
+            node._set_property('activesocket', active)
+        return tuple(results)
+
+    def _active_swizzle(self, node):
+        """
+        returns ( (socket, swizzle), ) for the active socket of <node> if it is a connected input, otherwise ().
+        Unlike _swizzles() this only queries the shader.
+        """
+        if 'socketswizzlevalue' not in node.properties or not self.edges.sources.get(node.index):
+            return ()
+        active = node._get_property('activesocket')
+        if active not in self.edges.sources[node.index]:
+            return ()
+        return ((active, node._get_property('socketswizzlevalue')),)
+
+    def _reset_stale(self):
+        """
+        re-query the outputs of any nodes whose output sockets the edge index isn't sure of
+        """
+        edges = self.edges
+        for idx in list(edges.stale):
+            self._changed(idx)
+            edges.reset_outputs(idx, self._get_connections(idx, 1))
+
+    def _sources_first(self):
+        """
+        returns the indices of the nodes in this network ordered so that each node comes after every node feeding it.
+        Nodes in a cycle, which shouldn't happen in a shader, are left out.
+        """
+        edges = self.edges
+        pending = dict((idx, len([s for s in edges.inputs(idx).values() if s in self.nodes])) for idx in self.nodes)
+        ready = deque(sorted(idx for idx, count in pending.items() if not count))
+        order = []
+        while ready:
+            idx = ready.popleft()
+            order.append(idx)
+            for targets in edges.targets.get(idx, {}).values():
+                for target, _ in targets:
+                    if target in pending:
+                        pending[target] -= 1
+                        if not pending[target]:
+                            ready.append(target)
+        return order
+
+    def fingerprint(self):
+        """
+        Returns a hash of this network's graph: the types and property values of its nodes and how they are
+        connected. Node indices, names and the UI_PROPERTIES don't affect it, so two shaders built the same way have
+        the same fingerprint, which makes it useful for finding identical materials or as a cache key.
+
+        Each node's hash covers the nodes feeding it, and is kept until the node or something upstream of it is
+        changed through this network, so after an edit only the changed nodes and the nodes they feed are hashed
+        again. Call refresh() if the shader is changed some other way.
+
+        fingerprint() only queries the shader. ShaderFX only reports a swizzle once its socket has been made active,
+        which is an edit, so the one swizzle included for each node is the one on its active socket: usually the last
+        one given to connect().
+        """
+        edges = self.edges
+        self._reset_stale()
+        hashes = self._fingerprints
+        order = self._sources_first()
+        ordered = set(order)
+        for idx in order + sorted(i for i in self.nodes if i not in ordered):
+            if idx in hashes:
+                continue
+            node = self.nodes[idx]
+            values = self._property_values(node, UI_PROPERTIES)
+            if node.nodetype in UNIQUE_TYPES:
+                values['name'] = self._names.keys.get(idx)
+            inputs = sorted((socket, hashes.get(source), source_socket)
+                            for socket, (source, source_socket) in edges.sources.get(idx, {}).items())
+            # every string goes through _hashable, so unicode and str versions of the same text hash the same
+            key = _hashable((node.nodetype, sorted(_hashable(values.items())), inputs, self._active_swizzle(node)))
+            hashes[idx] = hashlib.sha1(repr(key)).hexdigest()
+        shape = _hashable((self.flavour, hashes[self.root.index], sorted(hashes[idx] for idx in self.nodes)))
+        return hashlib.sha1(repr(shape)).hexdigest()
+
+    def _changed(self, idx):
+        """
+        forget the fingerprint() hashes of node <idx> and everything downstream of it
+        """
+        pending = [idx]
+        while pending:
+            idx = pending.pop()
+            # if a node has no hash, nothing it feeds can have one either
+            if self._fingerprints.pop(idx, None) is None or self._edge_index is None:
+                continue
+            for targets in self._edge_index.targets.get(idx, {}).values():
+                pending.extend(target for target, _ in targets)
+
+    @_operation
     def layout(self):
         """
-        Does a quick grid layout of this network
-        It's not fancy, but it makes for eaiser visual debugging
+        Does a layered layout of the nodes which feed the root, in columns to the left of it. Each node is placed
+        one column further left than the furthest node it feeds, and the nodes in each column are ordered to keep
+        connections from crossing. All the nodes are collapsed, and everything is set in one batch(). The root stays
+        where it is. A group is placed as one node, in place of the hidden end node which carries its outputs.
         """
         V_SPACE = 100
         H_SPACE = -150
 
-        def recurse_node(node, level=0):
-            for each_node in self.get_inputs(node).values():
-
-                for sub_node in recurse_node(each_node, level + 2):
-                    yield sub_node
-                yield level + 1, each_node
-            yield level, node
-
-        results = [i for i in recurse_node(self.root)]
-        results.sort()
-        results.reverse()
-        last_lavel = -1
-        vertical = 0
-        for level, node in results:
-            if level != last_lavel:
-                vertical = 0
-            else:
-                vertical += 1
-            last_lavel = level
-            if node.posx == 0:
-                node.posy = V_SPACE * vertical
-
-            node.posx = min(node.posx, H_SPACE * (level + 1))
-            node.collapsed = True
+        edges = self.edges
+        groups = dict((n.end_node.index, idx) for idx, n in self.nodes.items() if isinstance(n, SFXGroupNode))
+
+        def inputs(idx):
+            results = []
+            for _, source in sorted(edges.inputs(idx).items()):
+                source = groups.get(source, source)
+                if source not in results:
+                    results.append(source)
+            return results
+
+        placed = layered_layout(self.root.index, inputs)
+        columns = {}
+        for rank, _ in placed.values():
+            columns[rank] = columns.get(rank, 0) + 1
+
+        left, top = self.root.posx, self.root.posy
+        with self.batch():
+            for idx, (rank, position) in placed.items():
+                node = self.nodes.get(idx)
+                if node is None:
+                    continue
+                node.posx = left + H_SPACE * rank
+                node.posy = top + V_SPACE * (position - (columns[rank] - 1) / 2.0)
+                node.collapsed = True
 
     def __repr__(self):
         return "<sfxNetwork '{0}'>".format(self.shader)
@@ -473,8 +2111,85 @@ class StingrayPBSNetwork(SFXNetwork):
     """
 
     @classmethod
+    @_operation
     def create(cls, name):
         sfx_shader = cmds.shadingNode('StingrayPBS', asShader=True, name=name)
-        cmds.shaderfx(sfxnode=sfx_shader, initShaderAttributes=True)
+        _shaderfx(sfxnode=sfx_shader, initShaderAttributes=True)
         network = cls(sfx_shader)
         return network
+
+
+# the network class for each flavour of shader
+NETWORK_CLASSES = OrderedDict([('ShaderfxShader', SFXNetwork), ('StingrayPBS', StingrayPBSNetwork)])
+
+
+class SFXSceneStats(object):
+    """
+    Totals for the networks loaded by load_scene_networks():
+
+        shaders:    the number of networks loaded
+        nodes:      the number of nodes in them
+        commands:   the number of shaderfx commands sent while loading them
+        seconds:    the time spent loading them
+
+    While a network loads this is the active recorder (see profile()). Anything it records is passed on to the
+    recorder that was active before, so load_scene_networks() can be profiled as usual.
+    """
+
+    def __init__(self):
+        self.shaders = 0
+        self.nodes = 0
+        self.commands = 0
+        self.seconds = 0.0
+        self._outer = None
+
+    def begin(self, name, target, args):
+        if self._outer is not None:
+            self._outer.begin(name, target, args)
+
+    def end(self):
+        if self._outer is not None:
+            self._outer.end()
+
+    def command(self, flags, start, seconds):
+        self.commands += 1
+        if self._outer is not None:
+            self._outer.command(flags, start, seconds)
+
+    def __repr__(self):
+        return "<sfxSceneStats shaders: {0} nodes: {1} commands: {2} seconds: {3:.3f}>".format(
+            self.shaders, self.nodes, self.commands, self.seconds)
+
+
+def load_scene_networks(shaders=None, lazy=True, stats=None):
+    """
+    Yields a network for every ShaderfxShader and StingrayPBS shader in the scene, or for each of <shaders>, using
+    the right network class for each one:
+
+        stats = sfx.SFXSceneStats()
+        for network in sfx.load_scene_networks(stats=stats):
+            validate(network)
+        print stats
+        # <sfxSceneStats shaders: 240 nodes: 9120 commands: 722 seconds: 4.108>
+
+    Networks are only made as they are asked for, so a scene's worth of them never has to be in memory at once.
+    All of them share the schema cache and the node type registry, so each node type's schema is only queried once
+    for the whole scene. If <stats> is given, the totals for loading the networks (but not for whatever is done with
+    them in between) are added to it.
+    """
+    if shaders is None:
+        shaders = cmds.ls(type=list(NETWORK_CLASSES)) or []
+    for shader in shaders:
+        network_class = NETWORK_CLASSES[cmds.nodeType(shader)]
+        if stats is None:
+            yield network_class(shader, lazy)
+            continue
+        stats._outer = _recorder
+        start = profiling.clock()
+        with profile(stats):
+            network = network_class(shader, lazy)
+        stats.seconds += profiling.clock() - start
+        stats.shaders += 1
+        stats.nodes += len(network.nodes)
+        stats._outer = None
+        yield network
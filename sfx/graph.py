@@ -0,0 +1,294 @@
+"""
+Plain python data structures for shaderfx graph connectivity. Nothing in here talks to Maya: SFXNetwork keeps these
+up to date as it edits the shader, so that questions about the shape of the graph don't need any shaderfx commands.
+"""
+
+
+class EdgeIndex(object):
+    """
+    An index of the connections in a network, stored as (source node, source socket, target node, target socket)
+    and looked up from either end:
+
+        edges = EdgeIndex()
+        edges.connect(3, 0, 1, 2)
+        # connect output 0 of node 3 to input 2 of node 1
+
+        print edges.inputs(1)
+        # { 2: 3 }
+
+        print edges.outputs(3)
+        # { 0: [1] }
+
+    Node ids are plain integers, so the index doesn't care whether nodes are wrapped or not.
+    """
+
+    def __init__(self):
+        # { target: { target_socket: (source, source_socket) } }
+        self.sources = {}
+        # { source: { source_socket: [ (target, target_socket), ... ] } }
+        self.targets = {}
+        # (target, target_socket) inputs whose source socket was guessed by from_sockets()
+        self.uncertain = set()
+        # source nodes whose outputs may be wrong because an uncertain connection was removed: see from_sockets()
+        self.stale = set()
+
+    def connect(self, source, source_socket, target, target_socket):
+        """
+        record a connection. An input can only have one connection, so this replaces any existing connection into
+        <target_socket>.
+        """
+        self.disconnect_input(target, target_socket)
+        self.uncertain.discard((target, target_socket))
+        self.sources.setdefault(target, {})[target_socket] = (source, source_socket)
+        self.targets.setdefault(source, {}).setdefault(source_socket, []).append((target, target_socket))
+
+    def disconnect(self, source, source_socket, target, target_socket):
+        """
+        remove a connection, if it exists
+        """
+        current = self.sources.get(target, {}).get(target_socket)
+        if current is None:
+            return
+        if current == (source, source_socket) or (current[0] == source and (target, target_socket) in self.uncertain):
+            self.disconnect_input(target, target_socket)
+
+    def disconnect_input(self, target, target_socket):
+        """
+        remove whatever connection goes into <target_socket> on <target>, if there is one
+        """
+        sockets = self.sources.get(target, {})
+        if target_socket not in sockets:
+            return
+        source, source_socket = sockets.pop(target_socket)
+        if not sockets:
+            del self.sources[target]
+        if (target, target_socket) in self.uncertain:
+            self.uncertain.discard((target, target_socket))
+            self.stale.add(source)
+
+        outgoing = self.targets[source]
+        outgoing[source_socket].remove((target, target_socket))
+        if not outgoing[source_socket]:
+            del outgoing[source_socket]
+        if not outgoing:
+            del self.targets[source]
+
+    def remove_node(self, node):
+        """
+        remove every connection into or out of <node>
+        """
+        for target_socket in list(self.sources.get(node, {})):
+            self.disconnect_input(node, target_socket)
+        for source_socket, outgoing in list(self.targets.get(node, {}).items()):
+            for target, target_socket in list(outgoing):
+                self.disconnect_input(target, target_socket)
+        self.stale.discard(node)
+
+    def inputs(self, node):
+        """
+        returns { socket: source_node } for the connected inputs of <node>
+        """
+        return dict((k, v[0]) for k, v in self.sources.get(node, {}).items())
+
+    def outputs(self, node):
+        """
+        returns { socket: [ target_node, ... ] } for the connected outputs of <node>
+        """
+        return dict((k, [t[0] for t in v]) for k, v in self.targets.get(node, {}).items())
+
+    def edges(self):
+        """
+        yields every connection as ( source, source_socket, target, target_socket )
+        """
+        for target, sockets in self.sources.items():
+            for target_socket, (source, source_socket) in sockets.items():
+                yield source, source_socket, target, target_socket
+
+    def __len__(self):
+        return sum(len(v) for v in self.sources.values())
+
+    @classmethod
+    def from_sockets(cls, inputs, outputs):
+        """
+        Build an index from per-node socket queries, which only report the node at the other end of each socket:
+
+            inputs:     { target: { target_socket: source } }
+            outputs:    { source: { source_socket: [ target, ... ] } }
+
+        Each input is paired with an output socket on its source which lists the same target. If a source feeds the
+        same target from more than one socket the pairing is a guess. That doesn't change what inputs() and
+        outputs() report, but if one of those connections is removed the source is added to 'stale' and its outputs
+        should be queried again and passed to reset_outputs().
+        """
+        index = cls()
+        index._pair(inputs, outputs)
+        return index
+
+    def reset_outputs(self, source, sockets):
+        """
+        Replace the outputs of <source> with freshly queried { source_socket: [ target, ... ] }, re-pairing them with
+        the inputs already in the index.
+        """
+        inputs = {}
+        for target, target_sockets in self.sources.items():
+            for target_socket, (other, _) in target_sockets.items():
+                if other == source:
+                    inputs.setdefault(target, {})[target_socket] = source
+        for target, target_sockets in inputs.items():
+            for target_socket in target_sockets:
+                self.uncertain.discard((target, target_socket))
+                self.disconnect_input(target, target_socket)
+        self.stale.discard(source)
+        self._pair(inputs, {source: sockets})
+
+    def _pair(self, inputs, outputs):
+        pending = {}
+        for source, sockets in outputs.items():
+            for source_socket in sorted(sockets):
+                for target in sockets[source_socket]:
+                    pending.setdefault((source, target), []).append(source_socket)
+        ambiguous = set(k for k, v in pending.items() if len(set(v)) > 1)
+
+        for target, sockets in inputs.items():
+            for target_socket in sorted(sockets):
+                source = sockets[target_socket]
+                candidates = pending.get((source, target))
+                source_socket = candidates.pop(0) if candidates else None
+                self.connect(source, source_socket, target, target_socket)
+                if (source, target) in ambiguous:
+                    self.uncertain.add((target, target_socket))
+
+
+class KeyIndex(object):
+    """
+    A two-way index between node ids and a key such as a name or a node type, where many nodes can share a key:
+
+        names = KeyIndex()
+        names.set(4, 'diffuse')
+        names.set(7, 'diffuse')
+
+        print names.find('diffuse')
+        # [4, 7]
+
+        print names.keys[4]
+        # 'diffuse'
+    """
+
+    def __init__(self):
+        # { node: key }
+        self.keys = {}
+        # { key: set( node, ... ) }
+        self.nodes = {}
+
+    def set(self, node, key):
+        """
+        record <key> for <node>, replacing any key it had before
+        """
+        self.remove(node)
+        self.keys[node] = key
+        self.nodes.setdefault(key, set()).add(node)
+
+    def remove(self, node):
+        """
+        forget <node>, if it is in the index
+        """
+        if node not in self.keys:
+            return
+        key = self.keys.pop(node)
+        self.nodes[key].discard(node)
+        if not self.nodes[key]:
+            del self.nodes[key]
+
+    def find(self, key):
+        """
+        returns a sorted list of the nodes with <key>
+        """
+        return sorted(self.nodes.get(key, ()))
+
+    def __contains__(self, node):
+        return node in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def layered_layout(root, inputs, sweeps=4):
+    """
+    Arrange the nodes which feed <root> in layers, for drawing a graph from right to left:
+
+        inputs = {1: [2, 3], 2: [4], 3: [4], 4: []}
+        print layered_layout(1, lambda n: inputs[n])
+        # { 1: (0, 0), 2: (1, 0), 3: (1, 1), 4: (2, 0) }
+
+    <inputs> is a function which returns the nodes connected to the inputs of a node, in socket order. The result is
+    { node: ( rank, position ) }, where <rank> is the length of the longest path from the node to the root, so every
+    node is drawn further from the root than everything it feeds, and <position> is the node's place within its rank.
+    Positions are ordered to reduce crossing connections by sorting each rank on the average position of its
+    neighbours, sweeping away from the root and back again <sweeps> times.
+
+    Every node is visited once, however many paths lead to it.
+    """
+    # find the nodes, breadth first, so each rank starts out in socket order
+    upstream = {}
+    depth = {root: 0}
+    found = [root]
+    for node in found:
+        sources = []
+        for source in inputs(node):
+            if source not in sources:
+                sources.append(source)
+        upstream[node] = sources
+        for source in sources:
+            if source not in depth:
+                depth[source] = depth[node] + 1
+                found.append(source)
+
+    downstream = dict((node, []) for node in found)
+    waiting = dict((node, 0) for node in found)
+    for node in found:
+        for source in upstream[node]:
+            downstream[source].append(node)
+            waiting[source] += 1
+
+    # longest path to the root: a node is ranked once everything it feeds has been
+    rank = {root: 0}
+    ready = [root]
+    while ready:
+        node = ready.pop()
+        for source in upstream[node]:
+            rank[source] = max(rank.get(source, 0), rank[node] + 1)
+            waiting[source] -= 1
+            if not waiting[source]:
+                ready.append(source)
+    # nodes in a cycle are never ready: fall back to their distance from the root
+    for node in found:
+        if waiting[node]:
+            rank[node] = depth[node]
+
+    layers = []
+    for node in found:
+        while len(layers) <= rank[node]:
+            layers.append([])
+        layers[rank[node]].append(node)
+
+    position = {}
+    for layer in layers:
+        position.update((node, n) for n, node in enumerate(layer))
+
+    def reorder(layer, neighbours):
+        def barycenter(node):
+            linked = neighbours[node]
+            if not linked:
+                return position[node]
+            return sum(position[n] for n in linked) / float(len(linked))
+
+        layer.sort(key=barycenter)
+        position.update((node, n) for n, node in enumerate(layer))
+
+    for _ in range(sweeps):
+        for layer in layers[1:]:
+            reorder(layer, downstream)
+        for layer in reversed(layers[:-1]):
+            reorder(layer, upstream)
+
+    return dict((node, (rank[node], position[node])) for node in found)
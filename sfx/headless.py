@@ -0,0 +1,543 @@
+"""
+An in-process stand-in for the parts of maya.cmds which the sfx package uses, so networks can be built, edited,
+tested and benchmarked without Maya:
+
+    from sfx import headless
+    headless.use_backend()
+
+    network = SFXNetwork.create('example')
+    tint = network.add(sfxnodes.Color, 'tint')
+    network.connect(tint.outputs.rgb, network.root.inputs.color)
+
+Each shader is a graph of nodes with typed properties, named input and output sockets and connections, and every
+shaderfx flag the package sends is implemented against it, with the errors Maya would raise for bad node ids,
+sockets and property types. Node type ids come from sfx.node_registry. Property types and socket names come from the
+sfx.typecache file for the emulated Maya version if there is one, and from SCHEMAS (or a generic schema) if not, so
+a cache generated in Maya makes the emulated nodes match the real ones.
+
+New shaders start with a small default graph. To start from the real one instead, save it from Maya with
+saveGraph and pass it as a template:
+
+    headless.use_backend(headless.HeadlessMaya(templates={'ShaderfxShader': 'path/to/default.sfx'}))
+
+saveGraph and loadGraph use the .sfx layout that sfx.sfxfile reads and writes, built from the same constants, so
+they only write real-format files once that layout has been checked against real ones. TestFixtures in tests.py
+loads the fixtures saved by ShaderFX with them and saves them again.
+
+Real shaderfx commands are much slower than the emulated ones. To make timings more realistic, give the backend a
+per-command latency in seconds, and optionally a different one for particular flags:
+
+    headless.use_backend(headless.HeadlessMaya(latency=0.0002, latencies={'saveGraph': 0.02}))
+
+The backend counts the commands it gets by flag in 'calls'. use_maya() puts maya.cmds back.
+"""
+import codecs
+import timeit
+from collections import OrderedDict
+from xml.sax.saxutils import quoteattr
+
+import sfx
+from sfx import sfxfile, typecache
+
+clock = timeit.default_timer
+
+# ( name, type ) for the properties every node has
+COMMON_PROPERTIES = (('name', 'string'), ('posx', 'float'), ('posy', 'float'), ('collapsed', 'bool'),
+                     ('uiorder', 'int'), ('activesocket', 'int'), ('socketswizzlevalue', 'string'))
+
+# the value a new property of each type starts with
+DEFAULT_VALUES = {'string': '', 'float': 0.0, 'bool': False, 'int': 0, 'float2': [0.0, 0.0],
+                  'float3': [0.0, 0.0, 0.0], 'float4': [0.0, 0.0, 0.0, 1.0]}
+
+# { node type: ( properties other than COMMON_PROPERTIES, input sockets, output sockets ) } for types with no cached
+# schema. Anything not listed gets GENERIC_SCHEMA.
+SCHEMAS = {
+    'Hardware Shader': ((), ('Color', 'Alpha', 'Normal', 'Specular Color', 'Emissive'), ()),
+    'Standard Base': ((), ('Base Color', 'Normal', 'Metallic', 'Roughness', 'Emissive', 'Opacity',
+                           'Ambient Occlusion'), ()),
+    'Color': ((('color', 'float4'),), (), ('RGB', 'R', 'G', 'B', 'A')),
+    'Float': ((('value', 'float'),), (), ('Result',)),
+    'Vector Construct': ((), ('XYZ', 'W'), ('RGB', 'RGBA')),
+    'Vector Component': ((), ('Vector',), ('X', 'Y', 'Z', 'W')),
+    'Constant Vector3': ((('value', 'float3'),), (), ('Result',)),
+    'Sample Texture': ((('texture', 'string'),), ('UV',), ('RGBA', 'R', 'G', 'B', 'A')),
+}
+GENERIC_SCHEMA = ((), ('A', 'B'), ('Result',))
+
+# { node type: { property: value } } for new nodes whose values don't start as the DEFAULT_VALUES for their type
+INITIAL_VALUES = {
+    'Color': {'color': [0.5, 0.5, 0.5, 1.0]},
+}
+
+# the class name of the hidden node at the end of a group
+GROUP_END = 'Group End'
+
+# what initShaderAttributes makes when there's no template: [ ( name, type ) ], with the root first, and
+# [ ( source, source socket, target, target socket ) ] as positions in that list
+DEFAULT_GRAPHS = {
+    'ShaderfxShader': ([('Hardware Shader', 'Hardware Shader'), ('TotalAmbientAndOpacity', 'Vector Construct'),
+                        ('SurfaceMaskCutoff', 'Float'), ('Color', 'Color')],
+                       [(1, 0, 0, 0), (3, 0, 1, 0)]),
+    'StingrayPBS': ([('Standard Base', 'Standard Base'), ('base_color', 'Constant Vector3')],
+                    [(1, 0, 0, 0)]),
+}
+
+
+class HeadlessNode(object):
+    """
+    A node in a HeadlessShader: its class name and id, { property: [ type, value ] } in property order, the names of
+    its input and output sockets, the id of its end node if it is a group and { input socket: swizzle }. As in
+    ShaderFX, the 'socketswizzlevalue' property reads and sets the swizzle of the socket picked by 'activesocket'.
+    """
+    __slots__ = ['nodetype', 'type_id', 'properties', 'inputs', 'outputs', 'group_end', 'swizzles']
+
+    def __init__(self, nodetype, type_id, properties, inputs, outputs):
+        self.nodetype = nodetype
+        self.type_id = type_id
+        self.properties = OrderedDict((k, [t, _default(t)]) for k, t in properties)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.group_end = 0
+        self.swizzles = {}
+
+    def __repr__(self):
+        return "<headlessNode '{0}' ({1})>".format(self.properties['name'][1], self.nodetype)
+
+
+class HeadlessShader(object):
+    """
+    The graph of one emulated shader. 'edges' maps ( target, target socket ) to ( source, source socket ), since an
+    input socket only takes one connection.
+    """
+
+    def __init__(self, flavour):
+        self.flavour = flavour
+        self.nodes = OrderedDict()
+        self.edges = OrderedDict()
+        self.root = 0
+        self.next_id = 1
+
+    def add(self, nodetype, type_id, schema):
+        """
+        adds a node of <nodetype> with the ( properties, inputs, outputs ) <schema>, named after its type, and
+        returns its id
+        """
+        properties, inputs, outputs = schema
+        node = HeadlessNode(nodetype, type_id, properties, inputs, outputs)
+        node.properties['name'][1] = nodetype
+        for key, value in INITIAL_VALUES.get(nodetype, {}).items():
+            if key in node.properties:
+                node.properties[key][1] = list(value) if isinstance(value, list) else value
+        return self._insert(node)
+
+    def _insert(self, node, idx=None):
+        if idx is None:
+            idx = self.next_id
+        self.nodes[idx] = node
+        # ids are never reused, like in shaderfx
+        self.next_id = max(self.next_id, idx + 1)
+        return idx
+
+    def node(self, idx):
+        try:
+            return self.nodes[idx]
+        except (KeyError, TypeError):
+            raise RuntimeError('node %s does not exist' % (idx,))
+
+    def sockets(self, idx, direction):
+        node = self.node(idx)
+        return node.outputs if direction else node.inputs
+
+    def check_socket(self, idx, direction, socket):
+        if not 0 <= socket < len(self.sockets(idx, direction)):
+            raise RuntimeError('node %s has no %s socket %s' % (idx, 'output' if direction else 'input', socket))
+
+    def connected(self, idx, direction, socket):
+        """
+        returns the ids of the nodes connected to a socket, in the order they were connected
+        """
+        if direction:
+            return [t for (t, _), s in self.edges.items() if s == (idx, socket)]
+        source = self.edges.get((idx, socket))
+        return [source[0]] if source else []
+
+    def delete(self, idx):
+        node = self.node(idx)
+        doomed = set([idx, node.group_end]) if node.group_end else set([idx])
+        for item in doomed:
+            self.nodes.pop(item, None)
+        for target, source in self.edges.items():
+            if target[0] in doomed or source[0] in doomed:
+                del self.edges[target]
+        if self.root in doomed:
+            self.root = 0
+
+    def clear(self):
+        self.nodes.clear()
+        self.edges.clear()
+        self.root = 0
+
+
+class HeadlessMaya(object):
+    """
+    Emulates cmds.shaderfx, and the shadingNode, nodeType, ls, file, about and undoInfo commands as the sfx package
+    uses them. See the module docstring.
+
+        version:    the Maya version reported by about(), which picks the sfx.typecache file to use
+        latency:    seconds every shaderfx command takes
+        latencies:  { flag: seconds } for flags which take longer or shorter than <latency>
+        templates:  { flavour: .sfx file } to load into new shaders instead of DEFAULT_GRAPHS
+        calls:      { flag: count } of the shaderfx commands received
+        undo_depth: the number of undo chunks currently open
+    """
+
+    def __init__(self, version='2016', latency=0.0, latencies=None, templates=None):
+        self.version = version
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.templates = templates or {}
+        self.shaders = OrderedDict()
+        self.calls = {}
+        self.undo_depth = 0
+        # { flavour: { node type: schema } }, filled from the type cache when a flavour is first used
+        self._schemas = {}
+
+    # ---- maya commands
+
+    def shadingNode(self, kind, asShader=False, name=None):
+        if kind not in sfxfile.FLAVOURS:
+            raise RuntimeError('unknown shading node type %s' % kind)
+        if not name or name in self.shaders:
+            # like Maya, number the name to make it unique
+            base = (name or kind).rstrip('0123456789')
+            counter = 1
+            while '%s%d' % (base, counter) in self.shaders:
+                counter += 1
+            name = '%s%d' % (base, counter)
+        self.shaders[name] = HeadlessShader(kind)
+        return name
+
+    def nodeType(self, name):
+        return self._shader(name).flavour
+
+    def ls(self, *names, **flags):
+        types = flags.get('type') or flags.get('typ')
+        if isinstance(types, basestring):
+            types = [types]
+        return [k for k, v in self.shaders.items() if (not names or k in names) and
+                (types is None or v.flavour in types)]
+
+    def delete(self, *names, **flags):
+        for name in names:
+            for item in ([name] if isinstance(name, basestring) else name):
+                self._shader(item)
+                del self.shaders[item]
+
+    def file(self, *args, **flags):
+        if flags.get('new') or flags.get('n'):
+            self.shaders.clear()
+        return None
+
+    def about(self, version=False, **flags):
+        return self.version
+
+    def undoInfo(self, openChunk=False, closeChunk=False, **flags):
+        if openChunk:
+            self.undo_depth += 1
+        if closeChunk:
+            self.undo_depth -= 1
+
+    def shaderfx(self, n=None, sfxnode=None, **flags):
+        if len(flags) != 1:
+            raise TypeError('shaderfx takes one flag at a time, not %s' % sorted(flags))
+        (flag, value), = flags.items()
+        self.calls[flag] = self.calls.get(flag, 0) + 1
+        delay = self.latencies.get(flag, self.latency)
+        if delay:
+            _wait(delay)
+        shader = self._shader(n or sfxnode)
+        if flag.startswith('edit_'):
+            return self._edit(shader, flag[5:], value)
+        handler = self._FLAGS.get(flag)
+        if handler is None:
+            raise TypeError('Invalid flag %r' % flag)
+        return handler(self, shader, value)
+
+    # ---- shaderfx flags
+
+    def _init_shader_attributes(self, shader, value):
+        shader.clear()
+        template = self.templates.get(shader.flavour)
+        if template:
+            return self._load_graph(shader, template)
+        nodes, edges = DEFAULT_GRAPHS[shader.flavour]
+        ids = []
+        for name, nodetype in nodes:
+            idx = shader.add(nodetype, self._type_id(shader, nodetype), self._schema(shader, nodetype))
+            shader.nodes[idx].properties['name'][1] = name
+            ids.append(idx)
+        shader.root = ids[0]
+        for source, source_socket, target, target_socket in edges:
+            shader.edges[(ids[target], target_socket)] = (ids[source], source_socket)
+
+    def _add_node(self, shader, type_id):
+        klass = sfx.node_registry[shader.flavour].by_id.get(type_id)
+        if klass is None:
+            raise RuntimeError('unknown node type id %s' % (type_id,))
+        if hasattr(klass, 'group_id'):
+            return self._add_group(shader, klass.group_id())
+        return shader.add(klass.TYPE, type_id, self._schema(shader, klass.TYPE))
+
+    def _add_group(self, shader, group_id):
+        klass = sfx.node_registry[shader.flavour].by_group.get(group_id)
+        if klass is None:
+            raise RuntimeError('unknown group %s' % group_id)
+        properties, inputs, outputs = self._schema(shader, klass.TYPE)
+        # a group's outputs belong to the hidden node at its end
+        start = shader.add(klass.TYPE, klass.ID, (properties, inputs, ()))
+        end = shader.add(GROUP_END, 0, (COMMON_PROPERTIES, (), outputs))
+        shader.nodes[start].group_end = end
+        return start
+
+    def _delete_node(self, shader, idx):
+        shader.delete(idx)
+
+    def _node_count(self, shader, value):
+        return len(shader.nodes)
+
+    def _root(self, shader, value):
+        return shader.root
+
+    def _help(self, shader, value):
+        return 'shaderfx (headless): ' + ', '.join(sorted(self._FLAGS) + ['edit_<type>'])
+
+    def _node_type_by_class_name(self, shader, nodetype):
+        klass = sfx.node_registry[shader.flavour].by_type.get(nodetype)
+        if klass is None:
+            raise RuntimeError('unknown node class %s' % nodetype)
+        return klass.ID
+
+    def _node_class_name(self, shader, idx):
+        return shader.node(idx).nodetype
+
+    def _is_group_start(self, shader, idx):
+        return shader.node(idx).group_end > 0
+
+    def _group_end(self, shader, idx):
+        node = shader.node(idx)
+        if not node.group_end:
+            raise RuntimeError('node %s is not a group' % idx)
+        return node.group_end
+
+    def _list_properties(self, shader, idx):
+        return list(shader.node(idx).properties)
+
+    def _property(self, shader, args):
+        idx, key = args
+        try:
+            return shader.node(idx).properties[key]
+        except KeyError:
+            raise RuntimeError('node %s has no property %s' % (idx, key))
+
+    def _property_type(self, shader, args):
+        return self._property(shader, args)[0]
+
+    def _property_value(self, shader, args):
+        value = self._property(shader, args)[1]
+        if args[1] == 'socketswizzlevalue':
+            node = shader.node(args[0])
+            return node.swizzles.get(node.properties['activesocket'][1], '')
+        return list(value) if isinstance(value, list) else value
+
+    def _edit(self, shader, kind, args):
+        prop = self._property(shader, args[:2])
+        if prop[0] != kind:
+            raise RuntimeError('property %s of node %s is a %s, not a %s' % (args[1], args[0], prop[0], kind))
+        values = list(args[2:])
+        if kind.startswith('float'):
+            values = [float(v) for v in values]
+        elif kind == 'int':
+            values = [int(v) for v in values]
+        elif kind == 'bool':
+            values = [bool(v) for v in values]
+        default = DEFAULT_VALUES.get(kind)
+        if isinstance(default, list):
+            if len(values) != len(default):
+                raise RuntimeError('a %s property takes %d values, not %d' % (kind, len(default), len(values)))
+            prop[1] = values
+        elif len(values) != 1:
+            raise RuntimeError('a %s property takes 1 value, not %d' % (kind, len(values)))
+        else:
+            prop[1] = values[0]
+        if args[1] == 'socketswizzlevalue':
+            node = shader.node(args[0])
+            node.swizzles[node.properties['activesocket'][1]] = prop[1]
+
+    def _socket_count(self, shader, args):
+        idx, direction = args
+        return len(shader.sockets(idx, direction))
+
+    def _socket_name(self, shader, args):
+        idx, direction, socket = args
+        shader.check_socket(idx, direction, socket)
+        return shader.sockets(idx, direction)[socket]
+
+    def _make_connection(self, shader, args):
+        source, source_socket, target, target_socket = args
+        shader.check_socket(source, 1, source_socket)
+        shader.check_socket(target, 0, target_socket)
+        # connecting to an input replaces whatever was connected to it before
+        shader.edges.pop((target, target_socket), None)
+        shader.edges[(target, target_socket)] = (source, source_socket)
+
+    def _break_connection(self, shader, args):
+        source, source_socket, target, target_socket = args
+        shader.check_socket(source, 1, source_socket)
+        shader.check_socket(target, 0, target_socket)
+        if shader.edges.get((target, target_socket)) == (source, source_socket):
+            del shader.edges[(target, target_socket)]
+
+    def _connected_socket_count(self, shader, args):
+        idx, direction, socket = args
+        shader.check_socket(idx, direction, socket)
+        return len(shader.connected(idx, direction, socket))
+
+    def _connected_node(self, shader, args):
+        idx, direction, socket, number = args[:4]
+        shader.check_socket(idx, direction, socket)
+        connected = shader.connected(idx, direction, socket)
+        return connected[number] if number < len(connected) else 0
+
+    def _save_graph(self, shader, path):
+        with codecs.open(path, 'w', 'utf-8') as handle:
+            handle.write(u'<?xml version="1.0" encoding="utf-8"?>\n')
+            handle.write(u'<%s %s=%s>\n' % (sfxfile.GRAPH_TAG, sfxfile.GRAPH_ROOT, quoteattr(str(shader.root))))
+            for idx, node in shader.nodes.items():
+                handle.write(u'  <%s%s>\n' % (sfxfile.NODE_TAG, _attributes(
+                    [(sfxfile.NODE_ID, idx), (sfxfile.NODE_CLASS, node.nodetype),
+                     (sfxfile.NODE_CLASS_ID, node.type_id), (sfxfile.NODE_GROUP_END, node.group_end)])))
+                for name, (kind, value) in node.properties.items():
+                    handle.write(u'    <%s%s/>\n' % (sfxfile.PROPERTY_TAG, _attributes(
+                        [(sfxfile.PROPERTY_NAME, name), (sfxfile.PROPERTY_TYPE, kind),
+                         (sfxfile.PROPERTY_VALUE, sfxfile.format_value(value, kind))])))
+                for direction, names in ((0, node.inputs), (1, node.outputs)):
+                    for name in names:
+                        handle.write(u'    <%s%s/>\n' % (sfxfile.SOCKET_TAG, _attributes(
+                            [(sfxfile.SOCKET_DIRECTION, direction), (sfxfile.SOCKET_NAME, name)])))
+                handle.write(u'  </%s>\n' % sfxfile.NODE_TAG)
+            for (target, target_socket), (source, source_socket) in shader.edges.items():
+                handle.write(u'  <%s%s/>\n' % (sfxfile.CONNECTION_TAG, _attributes(
+                    [(sfxfile.CONNECTION_SOURCE, source), (sfxfile.CONNECTION_SOURCE_SOCKET, source_socket),
+                     (sfxfile.CONNECTION_TARGET, target), (sfxfile.CONNECTION_TARGET_SOCKET, target_socket)])))
+            handle.write(u'</%s>\n' % sfxfile.GRAPH_TAG)
+
+    def _load_graph(self, shader, path):
+        try:
+            graph = sfxfile.read(path, shader.flavour)
+        except sfxfile.READ_ERRORS as e:
+            raise RuntimeError('could not load %s: %s' % (path, e))
+        shader.clear()
+        for idx, item in sorted(graph.nodes.items()):
+            nodetype = item.nodetype or GROUP_END
+            properties, inputs, outputs = self._schema(shader, nodetype)
+            # nodes saved by shaderfx carry their own properties and sockets: only fall back to the schema for the
+            # parts the file leaves out
+            if item.properties:
+                properties = [('name', 'string')] + [(k, t) for k, t in item.properties.items() if k != 'name']
+            if item.input_names or item.output_names:
+                inputs, outputs = item.input_names, item.output_names
+            node = HeadlessNode(nodetype, item.type_id or 0, properties, inputs, outputs)
+            for key, value in item.values.items():
+                if key in node.properties:
+                    node.properties[key][1] = value
+            node.group_end = item.group_end
+            shader._insert(node, idx)
+        for source, source_socket, target, target_socket in graph.edges.edges():
+            shader.edges[(target, target_socket)] = (source, source_socket)
+        shader.root = graph.root.index if graph.root is not None else min(shader.nodes or [0])
+
+    _FLAGS = {
+        'initShaderAttributes': _init_shader_attributes,
+        'addNode': _add_node,
+        'addGroup': _add_group,
+        'deleteNode': _delete_node,
+        'getNodeCount': _node_count,
+        'rhw': _root,
+        'help': _help,
+        'getNodeTypeByClassName': _node_type_by_class_name,
+        'getNodeClassName': _node_class_name,
+        'isGroupStart': _is_group_start,
+        'getGroupEndUID': _group_end,
+        'lp': _list_properties,
+        'gpt': _property_type,
+        'gpv': _property_value,
+        'gsc': _socket_count,
+        'getSocketCount': _socket_count,
+        'gsn': _socket_name,
+        'makeConnection': _make_connection,
+        'breakConnection': _break_connection,
+        'getConnectedSocketCount': _connected_socket_count,
+        'getConnectedNodeID': _connected_node,
+        'saveGraph': _save_graph,
+        'loadGraph': _load_graph,
+    }
+
+    # ---- helpers
+
+    def _shader(self, name):
+        try:
+            return self.shaders[name]
+        except KeyError:
+            raise RuntimeError('No object matches name: %s' % name)
+
+    def _type_id(self, shader, nodetype):
+        klass = sfx.node_registry[shader.flavour].by_type.get(nodetype)
+        return klass.ID if klass is not None else 0
+
+    def _schema(self, shader, nodetype):
+        """
+        returns ( properties, inputs, outputs ) for a node of <nodetype>, with the common properties first
+        """
+        if shader.flavour not in self._schemas:
+            cached = typecache.load(self.version, shader.flavour) or {}
+            self._schemas[shader.flavour] = cached.get('schemas', {})
+        cached = self._schemas[shader.flavour].get(nodetype)
+        if cached is not None:
+            extra = sorted((k, t) for k, t in cached['properties'].items() if k != 'name')
+            return (('name', 'string'),) + tuple(extra), cached['inputs'], cached['outputs']
+        extra, inputs, outputs = SCHEMAS.get(nodetype, GENERIC_SCHEMA)
+        return COMMON_PROPERTIES + extra, inputs, outputs
+
+    def __repr__(self):
+        return "<headlessMaya {0} shaders: {1}>".format(self.version, len(self.shaders))
+
+
+def _default(kind):
+    value = DEFAULT_VALUES.get(kind)
+    return list(value) if isinstance(value, list) else value
+
+
+def _wait(seconds):
+    # time.sleep() is too coarse for the fraction of a millisecond most commands take
+    end = clock() + seconds
+    while clock() < end:
+        pass
+
+
+def _attributes(pairs):
+    return u''.join(u' %s=%s' % (k, quoteattr(unicode(v))) for k, v in pairs)
+
+
+def use_backend(backend=None):
+    """
+    Send the sfx package's Maya commands to <backend>, a new HeadlessMaya if it isn't given, and return it
+    """
+    sfx.cmds = backend or HeadlessMaya()
+    return sfx.cmds
+
+
+def use_maya():
+    """
+    Send the sfx package's Maya commands to maya.cmds again
+    """
+    sfx.cmds = sfx._MayaCommands()
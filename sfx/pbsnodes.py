@@ -2,339 +2,89 @@
 This module publishes all of the node type avaliable for use with StingrayPBS shaders.
 
 Remember that these are for StingrayPBS networks - they won't work in a ShaderFX node network
-"""
-
-from sfx import SFXNodeType
-
-
-class VegetationBending(SFXNodeType):
-    TYPE = "Vegetation Bending"
-    ID = 20241
-
-
-class ConstantScalar(SFXNodeType):
-    TYPE = "Constant Scalar"
-    ID = 20196
-
-
-class ConstantVector2(SFXNodeType):
-    TYPE = "Constant Vector2"
-    ID = 20200
-
-
-class ConstantVector3(SFXNodeType):
-    TYPE = "Constant Vector3"
-    ID = 20190
-
-
-class ConstantVector4(SFXNodeType):
-    TYPE = "Constant Vector4"
-    ID = 20201
-
-
-class ConstructVector2(SFXNodeType):
-    TYPE = "Construct Vector2"
-    ID = 20202
-
-
-class ConstructVector3(SFXNodeType):
-    TYPE = "Construct Vector3"
-    ID = 20203
-
-
-class ConstructVector4(SFXNodeType):
-    TYPE = "Construct Vector4"
-    ID = 20204
-
-
-class EyeVector(SFXNodeType):
-    TYPE = "Eye Vector"
-    ID = 20214
-
-
-class MaterialVariable(SFXNodeType):
-    TYPE = "Material Variable"
-    ID = 20185
-
-
-class SunDirection(SFXNodeType):
-    TYPE = "Sun Direction"
-    ID = 20238
-
-
-class Time(SFXNodeType):
-    TYPE = "Time"
-    ID = 20207
-
-
-class Absolute(SFXNodeType):
-    TYPE = "Absolute"
-    ID = 20197
-
-
-class Add(SFXNodeType):
-    TYPE = "Add"
-    ID = 20187
-
-
-class Ceil(SFXNodeType):
-    TYPE = "Ceil"
-    ID = 20199
-
-
-class Clamp(SFXNodeType):
-    TYPE = "Clamp"
-    ID = 20193
-
-
-class Cosine(SFXNodeType):
-    TYPE = "Cosine"
-    ID = 20205
-
-
-class CrossProduct(SFXNodeType):
-    TYPE = "Cross Product"
-    ID = 20206
-
-
-class DDX(SFXNodeType):
-    TYPE = "DDX"
-    ID = 20208
-
-
-class DDY(SFXNodeType):
-    TYPE = "DDY"
-    ID = 20209
-
-
-class Distance(SFXNodeType):
-    TYPE = "Distance"
-    ID = 20211
-
-
-class Divide(SFXNodeType):
-    TYPE = "Divide"
-    ID = 20212
-
-
-class DotProduct(SFXNodeType):
-    TYPE = "Dot Product"
-    ID = 20213
-
-
-class Floor(SFXNodeType):
-    TYPE = "Floor"
-    ID = 20216
-
-
-class Fmod(SFXNodeType):
-    TYPE = "Fmod"
-    ID = 20217
-
-
-class Fractional(SFXNodeType):
-    TYPE = "Fractional"
-    ID = 20188
-
-
-class If(SFXNodeType):
-    TYPE = "If"
-    ID = 20189
-
-
-class InterpolateSmooth(SFXNodeType):
-    TYPE = "Interpolate Smooth"
-    ID = 20230
-
-
-class Invert(SFXNodeType):
-    TYPE = "Invert"
-    ID = 20220
-
-
-class Length(SFXNodeType):
-    TYPE = "Length"
-    ID = 20221
-
-
-class LinearInterpolate(SFXNodeType):
-    TYPE = "Linear Interpolate"
-    ID = 20184
-
-
-class Max(SFXNodeType):
-    TYPE = "Max"
-    ID = 20240
 
+The generated node types are listed in _NODE_TYPES and their classes are only created when they are first used, so
+importing this module is cheap. They work like ordinary module attributes:
 
-class Multiply(SFXNodeType):
-    TYPE = "Multiply"
-    ID = 20186
-
-
-class Normalize(SFXNodeType):
-    TYPE = "Normalize"
-    ID = 20222
-
-
-class Power(SFXNodeType):
-    TYPE = "Power"
-    ID = 20192
-
-
-class Reflect(SFXNodeType):
-    TYPE = "Reflect"
-    ID = 20226
-
-
-class Refract(SFXNodeType):
-    TYPE = "Refract"
-    ID = 20227
-
-
-class Sine(SFXNodeType):
-    TYPE = "Sine"
-    ID = 20229
-
-
-class SquareRoot(SFXNodeType):
-    TYPE = "Square Root"
-    ID = 20231
-
-
-class Subtract(SFXNodeType):
-    TYPE = "Subtract"
-    ID = 20182
-
-
-class StandardBase(SFXNodeType):
-    TYPE = "Standard Base"
-    ID = 20176
-
-
-class UnlitBase(SFXNodeType):
-    TYPE = "Unlit Base"
-    ID = 20242
-
-
-class SampleCube(SFXNodeType):
-    TYPE = "Sample Cube"
-    ID = 20237
-
-
-class SampleTexture(SFXNodeType):
-    TYPE = "Sample Texture"
-    ID = 20177
-
-
-class ObjectToWorld(SFXNodeType):
-    TYPE = "Object To World"
-    ID = 20223
-
-
-class TangentToWorld(SFXNodeType):
-    TYPE = "Tangent To World"
-    ID = 20195
-
-
-class WorldToObject(SFXNodeType):
-    TYPE = "World To Object"
-    ID = 20236
-
-
-class WorldToTangent(SFXNodeType):
-    TYPE = "World To Tangent"
-    ID = 20232
-
-
-class BlendNormals(SFXNodeType):
-    TYPE = "Blend Normals"
-    ID = 20198
-
-
-class Desaturation(SFXNodeType):
-    TYPE = "Desaturation"
-    ID = 20210
-
-
-class Flipbook(SFXNodeType):
-    TYPE = "Flipbook"
-    ID = 20215
-
-
-class Fresnel(SFXNodeType):
-    TYPE = "Fresnel"
-    ID = 20218
-
-
-class HSVtoRGB(SFXNodeType):
-    TYPE = "HSV to RGB"
-    ID = 20219
-
-
-class Panner(SFXNodeType):
-    TYPE = "Panner"
-    ID = 20224
-
-
-class Parallax(SFXNodeType):
-    TYPE = "Parallax"
-    ID = 20183
-
-
-class RGBtoHSV(SFXNodeType):
-    TYPE = "RGB to HSV"
-    ID = 20228
-
-
-class Rotator(SFXNodeType):
-    TYPE = "Rotator"
-    ID = 20225
-
-
-class Texcoord0(SFXNodeType):
-    TYPE = "Texcoord 0"
-    ID = 20178
-
-
-class Texcoord1(SFXNodeType):
-    TYPE = "Texcoord 1"
-    ID = 20179
-
-
-class Texcoord2(SFXNodeType):
-    TYPE = "Texcoord 2"
-    ID = 20180
-
-
-class Texcoord3(SFXNodeType):
-    TYPE = "Texcoord 3"
-    ID = 20181
-
-
-class VertexBinormal(SFXNodeType):
-    TYPE = "Vertex Binormal"
-    ID = 20235
-
-
-class VertexColor0(SFXNodeType):
-    TYPE = "Vertex Color 0"
-    ID = 20191
-
-
-class VertexPosition(SFXNodeType):
-    TYPE = "Vertex Position"
-    ID = 20233
-
-
-class VertexTangent(SFXNodeType):
-    TYPE = "Vertex Tangent"
-    ID = 20234
+    from sfx.pbsnodes import SampleTexture
+"""
 
+import sys
+
+from sfx import SFXNodeTypeModule
+
+
+# ( class name, TYPE, ID ) for the generated node types. The classes are created when they are first used: see
+# SFXNodeTypeModule
+_NODE_TYPES = (
+    ("VegetationBending", "Vegetation Bending", 20241),
+    ("ConstantScalar", "Constant Scalar", 20196),
+    ("ConstantVector2", "Constant Vector2", 20200),
+    ("ConstantVector3", "Constant Vector3", 20190),
+    ("ConstantVector4", "Constant Vector4", 20201),
+    ("ConstructVector2", "Construct Vector2", 20202),
+    ("ConstructVector3", "Construct Vector3", 20203),
+    ("ConstructVector4", "Construct Vector4", 20204),
+    ("EyeVector", "Eye Vector", 20214),
+    ("MaterialVariable", "Material Variable", 20185),
+    ("SunDirection", "Sun Direction", 20238),
+    ("Time", "Time", 20207),
+    ("Absolute", "Absolute", 20197),
+    ("Add", "Add", 20187),
+    ("Ceil", "Ceil", 20199),
+    ("Clamp", "Clamp", 20193),
+    ("Cosine", "Cosine", 20205),
+    ("CrossProduct", "Cross Product", 20206),
+    ("DDX", "DDX", 20208),
+    ("DDY", "DDY", 20209),
+    ("Distance", "Distance", 20211),
+    ("Divide", "Divide", 20212),
+    ("DotProduct", "Dot Product", 20213),
+    ("Floor", "Floor", 20216),
+    ("Fmod", "Fmod", 20217),
+    ("Fractional", "Fractional", 20188),
+    ("If", "If", 20189),
+    ("InterpolateSmooth", "Interpolate Smooth", 20230),
+    ("Invert", "Invert", 20220),
+    ("Length", "Length", 20221),
+    ("LinearInterpolate", "Linear Interpolate", 20184),
+    ("Max", "Max", 20240),
+    ("Multiply", "Multiply", 20186),
+    ("Normalize", "Normalize", 20222),
+    ("Power", "Power", 20192),
+    ("Reflect", "Reflect", 20226),
+    ("Refract", "Refract", 20227),
+    ("Sine", "Sine", 20229),
+    ("SquareRoot", "Square Root", 20231),
+    ("Subtract", "Subtract", 20182),
+    ("StandardBase", "Standard Base", 20176),
+    ("UnlitBase", "Unlit Base", 20242),
+    ("SampleCube", "Sample Cube", 20237),
+    ("SampleTexture", "Sample Texture", 20177),
+    ("ObjectToWorld", "Object To World", 20223),
+    ("TangentToWorld", "Tangent To World", 20195),
+    ("WorldToObject", "World To Object", 20236),
+    ("WorldToTangent", "World To Tangent", 20232),
+    ("BlendNormals", "Blend Normals", 20198),
+    ("Desaturation", "Desaturation", 20210),
+    ("Flipbook", "Flipbook", 20215),
+    ("Fresnel", "Fresnel", 20218),
+    ("HSVtoRGB", "HSV to RGB", 20219),
+    ("Panner", "Panner", 20224),
+    ("Parallax", "Parallax", 20183),
+    ("RGBtoHSV", "RGB to HSV", 20228),
+    ("Rotator", "Rotator", 20225),
+    ("Texcoord0", "Texcoord 0", 20178),
+    ("Texcoord1", "Texcoord 1", 20179),
+    ("Texcoord2", "Texcoord 2", 20180),
+    ("Texcoord3", "Texcoord 3", 20181),
+    ("VertexBinormal", "Vertex Binormal", 20235),
+    ("VertexColor0", "Vertex Color 0", 20191),
+    ("VertexPosition", "Vertex Position", 20233),
+    ("VertexTangent", "Vertex Tangent", 20234),
+    ("WorldNormal", "World Normal", 20194),
+)
 
-class WorldNormal(SFXNodeType):
-    TYPE = "World Normal"
-    ID = 20194
 
 # use this to regenerate the class names with SFXNodeType.generate_class_definitions
 _KNOWN_PBS_NAMES = """Vegetation Bending
@@ -402,4 +152,6 @@ Vertex Binormal
 Vertex Color 0
 Vertex Position
 Vertex Tangent
-World Normal"""
\ No newline at end of file
+World Normal"""
+
+sys.modules[__name__] = SFXNodeTypeModule(sys.modules[__name__], _NODE_TYPES)
@@ -0,0 +1,238 @@
+"""
+Recorders for the shaderfx commands the sfx package sends. Every command goes through sfx._shaderfx(), and the main
+SFXNetwork and SFXNode methods are marked as operations, so a recorder sees both:
+
+    with sfx.profile() as profiler:
+        network = SFXNetwork('example')
+        network.connect(tint.outputs.rgba, network.root.inputs.base_color)
+
+    print profiler.report()
+    # flag                      calls   total ms     p50 ms     p99 ms
+    # gpv                          28       1.90       0.06       0.12
+    # ...
+    # operation                 count      calls   calls/op
+    # SFXNetwork.connect            1          1       1.00
+
+An SFXTracer records the same statistics, and also a timeline of every operation and command which can be loaded
+into chrome://tracing or https://ui.perfetto.dev to see where the time goes:
+
+    with sfx.profile(profiling.SFXTracer()) as tracer:
+        network = SFXNetwork('example')
+        network.layout()
+
+    tracer.write('example_trace.json')
+
+Operations show up as nested spans, with the commands they send inside them. Each span has the shader name and, if
+there is one, the node index as arguments.
+
+Only one recorder is active at a time. When none is, the cost of the hooks is a check of one global.
+"""
+import json
+import os
+import thread
+import timeit
+from collections import OrderedDict
+
+clock = timeit.default_timer
+
+
+def command_flag(flags):
+    """
+    returns the name of the shaderfx flag in a command's keyword arguments, ignoring the node name
+    """
+    for key in flags:
+        if key not in ('n', 'sfxnode'):
+            return key
+    return None
+
+
+def command_node(flags):
+    """
+    returns the node index a command is about, or None
+    """
+    value = flags.get(command_flag(flags))
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _is_node(value):
+    # nodes have slots, and looking up a missing attribute on them queries the shader, so they are checked by class
+    return hasattr(type(value), 'index') and hasattr(type(value), 'node')
+
+
+def operation_node(args):
+    """
+    returns the node index of the first argument of an operation which is a node, a plug or a node index, or None
+    """
+    for arg in args:
+        if _is_node(arg):
+            return arg.index
+        if isinstance(arg, tuple) and arg and isinstance(arg[0], (int, long)):
+            return arg[0]
+        if isinstance(arg, (int, long)) and not isinstance(arg, bool):
+            return arg
+    return None
+
+
+def operation_target(target, args):
+    """
+    returns ( shader name, node index ) for an operation called on <target> with <args>. Either may be None.
+    """
+    if _is_node(target):
+        return target.node, target.index
+    if isinstance(target, type):
+        # create() and instantiate() are passed the name of the shader
+        shader = args[0] if args and isinstance(args[0], basestring) else None
+        return shader, None
+    state = getattr(target, '__dict__', {})
+    if 'network' in state:
+        state = state['network'].__dict__
+    return state.get('shader'), operation_node(args)
+
+
+def percentile(values, fraction):
+    """
+    returns the value at <fraction> (0 - 1) of the way through the sorted list <values>
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class SFXProfiler(object):
+    """
+    Records each shaderfx command as ( flag, seconds, operation, node index ) in 'commands', where <operation> is the
+    innermost operation that sent it, and counts the commands sent by each operation, including the ones sent by any
+    operations it calls.
+    """
+
+    def __init__(self):
+        self.commands = []
+        # { operation: [ times called, commands sent ] }
+        self.operations = OrderedDict()
+        # [ operation, commands sent so far ] for each operation in progress
+        self._stack = []
+
+    def begin(self, name, target, args):
+        self._stack.append([name, 0])
+
+    def end(self):
+        name, count = self._stack.pop()
+        totals = self.operations.setdefault(name, [0, 0])
+        totals[0] += 1
+        totals[1] += count
+        if self._stack:
+            self._stack[-1][1] += count
+
+    def command(self, flags, start, seconds):
+        operation = self._stack[-1][0] if self._stack else None
+        self.commands.append((command_flag(flags), seconds, operation, command_node(flags)))
+        if self._stack:
+            self._stack[-1][1] += 1
+
+    def flags(self):
+        """
+        returns { flag: { 'calls', 'total', 'p50', 'p99' } } with the times in seconds
+        """
+        times = {}
+        for flag, seconds, _, _ in self.commands:
+            times.setdefault(flag, []).append(seconds)
+        results = {}
+        for flag, values in times.items():
+            values.sort()
+            results[flag] = {'calls': len(values), 'total': sum(values),
+                             'p50': percentile(values, 0.5), 'p99': percentile(values, 0.99)}
+        return results
+
+    def calls_by(self, operation):
+        """
+        returns { flag: count } for the commands sent directly by <operation>
+        """
+        results = {}
+        for flag, _, sender, _ in self.commands:
+            if sender == operation:
+                results[flag] = results.get(flag, 0) + 1
+        return results
+
+    def report(self):
+        """
+        returns a table of the command statistics by flag, and the number of commands each operation cost
+        """
+        lines = ['%-24s %6s %10s %10s %10s' % ('flag', 'calls', 'total ms', 'p50 ms', 'p99 ms')]
+        for flag, stats in sorted(self.flags().items(), key=lambda item: -item[1]['total']):
+            lines.append('%-24s %6d %10.2f %10.2f %10.2f' % (flag, stats['calls'], stats['total'] * 1000,
+                                                            stats['p50'] * 1000, stats['p99'] * 1000))
+        lines.append('')
+        lines.append('%-24s %6s %10s %10s' % ('operation', 'count', 'calls', 'calls/op'))
+        for name, (count, calls) in self.operations.items():
+            lines.append('%-24s %6d %10d %10.2f' % (name, count, calls, calls / float(count)))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return "<sfxProfiler commands: {0} operations: {1}>".format(len(self.commands), len(self.operations))
+
+
+class SFXTracer(SFXProfiler):
+    """
+    An SFXProfiler which also records every operation and command as a span on a timeline. trace() returns the spans
+    in the Chrome trace event format, and write() saves them to a file.
+
+        events:     [ { 'name', 'cat', 'ph', 'ts', 'dur', 'pid', 'tid', 'args' } ]
+
+    <cat> is 'operation' or 'command', and the times are in microseconds from when the tracer was made.
+    """
+
+    def __init__(self):
+        super(SFXTracer, self).__init__()
+        self.events = []
+        self._origin = clock()
+        # [ operation, target, args, start ] for each operation in progress
+        self._spans = []
+
+    def begin(self, name, target, args):
+        super(SFXTracer, self).begin(name, target, args)
+        self._spans.append((name, target, args, clock()))
+
+    def end(self):
+        super(SFXTracer, self).end()
+        name, target, args, start = self._spans.pop()
+        # the target is only inspected now, because __init__ operations don't have a shader until they are done
+        shader, node = operation_target(target, args)
+        self._span(name, 'operation', start, clock() - start, shader, node)
+
+    def command(self, flags, start, seconds):
+        super(SFXTracer, self).command(flags, start, seconds)
+        self._span(command_flag(flags), 'command', start, seconds, flags.get('n', flags.get('sfxnode')),
+                   command_node(flags))
+
+    def _span(self, name, category, start, seconds, shader, node):
+        args = {}
+        if shader is not None:
+            args['shader'] = shader
+        if node is not None:
+            args['node'] = node
+        self.events.append({'name': name, 'cat': category, 'ph': 'X', 'ts': round((start - self._origin) * 1e6, 3),
+                            'dur': round(seconds * 1e6, 3), 'pid': os.getpid(), 'tid': thread.get_ident(),
+                            'args': args})
+
+    def trace(self):
+        """
+        returns the recorded spans as a Chrome trace dictionary, outermost spans first
+        """
+        # spans are recorded as they end, so inner ones come before the outer ones that contain them
+        events = sorted(self.events, key=lambda event: (event['ts'], -event['dur']))
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        """
+        write the trace to <path> as json, for chrome://tracing or https://ui.perfetto.dev
+        """
+        with open(path, 'w') as handle:
+            json.dump(self.trace(), handle)
+        return path
+
+    def __repr__(self):
+        return "<sfxTracer spans: {0}>".format(len(self.events))
@@ -0,0 +1,442 @@
+"""
+This module reads and writes saved .sfx graph files without needing Maya, so graphs can be inspected and edited on
+machines with no Maya license.
+
+    graph = sfxfile.read('path/to/shader.sfx')
+
+    print graph.root
+    # <sfxFileNode 'Standard Base' (Standard Base)>
+
+    print graph.find_by_type(pbsnodes.SampleTexture)
+    # [ <sfxFileNode 'color_map' (Sample Texture)> ]
+
+    graph.nodes[12].color = [1, 0, 0, 1]
+    graph.connect(tex.outputs.rgba, graph.root.inputs.base_color)
+    graph.write('path/to/edited.sfx')
+
+SFXFileGraph and SFXFileNode have the same shape as SFXNetwork and SFXNode, so most code which only reads a network
+will work with either.
+
+The files are XML. The top-level element holds nodes and connections:
+
+    <graph root="1">
+        <node id="12" class="Color" classid="20011" groupend="0">
+            <property name="color" type="float4" value="0.5 0.5 0.5 1"/>
+            <socket direction="1" name="RGB"/>
+        </node>
+        <connection source="12" sourcesocket="0" target="1" targetsocket="3"/>
+    </graph>
+
+'groupend' is the id of the matching end node for a group start node and 0 for everything else. Sockets are numbered
+in the order they appear for each direction (0 for inputs, 1 for outputs). The tag and attribute names are kept in
+the constants below in case they differ between Maya versions. Anything else in the file is kept as-is and written
+back out unchanged.
+
+This layout hasn't been checked against files saved by ShaderFX yet. 'mayapy tests.py capture' saves real ones as
+test fixtures, and the tests compare what this module reads from them with what Maya reports for the same graphs.
+
+The parser is incremental, so large graphs are never held in memory as a single document.
+"""
+import codecs
+from collections import OrderedDict
+from xml.sax.saxutils import quoteattr
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+import sfx
+from sfx.graph import EdgeIndex, KeyIndex
+
+GRAPH_TAG = 'graph'
+GRAPH_ROOT = 'root'
+NODE_TAG = 'node'
+NODE_ID = 'id'
+NODE_CLASS = 'class'
+NODE_CLASS_ID = 'classid'
+NODE_GROUP_END = 'groupend'
+PROPERTY_TAG = 'property'
+PROPERTY_NAME = 'name'
+PROPERTY_TYPE = 'type'
+PROPERTY_VALUE = 'value'
+SOCKET_TAG = 'socket'
+SOCKET_DIRECTION = 'direction'
+SOCKET_NAME = 'name'
+CONNECTION_TAG = 'connection'
+CONNECTION_SOURCE = 'source'
+CONNECTION_SOURCE_SOCKET = 'sourcesocket'
+CONNECTION_TARGET = 'target'
+CONNECTION_TARGET_SOCKET = 'targetsocket'
+
+# the shader node types for the two kinds of graph
+FLAVOURS = ('ShaderfxShader', 'StingrayPBS')
+
+# what read() and iter_node_records() raise for a file they can't read: a missing file, xml which doesn't parse
+# (ElementTree's ParseError is a SyntaxError) or elements missing the attributes named above
+READ_ERRORS = (EnvironmentError, SyntaxError, ValueError)
+
+
+def _local_name(tag):
+    """
+    strips the namespace, if any, off an element tag
+    """
+    return tag.rsplit('}', 1)[-1].lower()
+
+
+def _int_attribute(element, name):
+    """
+    the attribute <name> of <element> as an int. Raises ValueError if it's missing, which means the file isn't laid
+    out the way this module expects
+    """
+    value = element.get(name)
+    if value is None:
+        raise ValueError('<%s> has no %s attribute' % (_local_name(element.tag), name))
+    return int(value)
+
+
+def iter_node_records(sfxfile):
+    """
+    Yields a tuple ( node_id, is_group_start, name, node_class ) for every node in the .sfx file <sfxfile>. <name>
+    or <node_class> are None if they aren't in the file.
+    """
+    for event, element in ElementTree.iterparse(sfxfile, events=('end',)):
+        if _local_name(element.tag) != NODE_TAG:
+            continue
+        name = None
+        for child in element:
+            if _local_name(child.tag) == PROPERTY_TAG and child.get(PROPERTY_NAME) == 'name':
+                name = child.get(PROPERTY_VALUE, child.text)
+        group_end = int(element.get(NODE_GROUP_END) or 0)
+        yield _int_attribute(element, NODE_ID), group_end > 0, name, element.get(NODE_CLASS)
+        element.clear()
+
+
+def parse_value(text, kind):
+    """
+    converts the text of a property value in a .sfx file to a python value, based on the property type <kind>
+    """
+    if text is None:
+        return None
+    if kind == 'bool':
+        return text.strip().lower() in ('1', 'true')
+    if kind == 'int':
+        return int(text)
+    if kind == 'float':
+        return float(text)
+    if kind and kind.startswith('float') and kind[5:].isdigit():
+        return [float(v) for v in text.replace(',', ' ').split()]
+    return text
+
+
+def format_value(value, kind):
+    """
+    converts a python property value to the text stored in a .sfx file. The reverse of parse_value()
+    """
+    if value is None:
+        return ''
+    if kind == 'bool':
+        return 'true' if value else 'false'
+    if hasattr(value, '__iter__') and not isinstance(value, basestring):
+        return ' '.join(repr(float(v)) for v in value)
+    if kind == 'float':
+        return repr(float(value))
+    return unicode(value)
+
+
+class SFXFileNode(object):
+    """
+    A node read from a .sfx file. Like SFXNode, properties can be read and set as attributes:
+
+        print node.properties
+        # { 'name': 'string', 'color': 'float4', ... }
+
+        print node.color
+        # [0.5, 0.5, 0.5, 1.0]
+
+        node.color = [1, 0, 0, 1]
+        # changes the value in the graph, which is saved by SFXFileGraph.write()
+
+    The resolved SFXNodeType subclass for the node is stored in 'node_class', or None if the node's classid isn't
+    one of the known types.
+    """
+    __slots__ = ['index', 'nodetype', 'type_id', 'node_class', 'group_end', 'properties', 'values', 'attributes',
+                 'extra', 'input_names', 'output_names', '_graph', '_inputs', '_outputs']
+
+    def __init__(self, graph, index, attributes):
+        self._graph = graph
+        self.index = index
+        self.attributes = attributes
+        self.type_id = int(attributes[NODE_CLASS_ID]) if attributes.get(NODE_CLASS_ID) else None
+        self.node_class = None
+        self.nodetype = attributes.get(NODE_CLASS)
+        self.group_end = int(attributes.get(NODE_GROUP_END) or 0)
+        # { property_name: property_type }, in file order
+        self.properties = OrderedDict()
+        # { property_name: value }
+        self.values = {}
+        self.input_names = []
+        self.output_names = []
+        # unrecognized child elements, kept as xml text so they can be written back out
+        self.extra = []
+        self._inputs = None
+        self._outputs = None
+
+    @property
+    def is_group(self):
+        return self.group_end > 0
+
+    @property
+    def inputs(self):
+        if self._inputs is None:
+            self._inputs = sfx.SFXPlugs(self.index, self.input_names)
+        return self._inputs
+
+    @property
+    def outputs(self):
+        # as in a live network, the outputs of a group belong to its end node
+        if self.is_group and self.group_end in self._graph.nodes:
+            return self._graph.nodes[self.group_end].outputs
+        if self._outputs is None:
+            self._outputs = sfx.SFXPlugs(self.index, self.output_names)
+        return self._outputs
+
+    def __getattr__(self, item):
+        if hasattr(type(self), item):
+            return object.__getattribute__(self, item)
+        if item in self.properties:
+            return self.values.get(item)
+        raise sfx.SFXPropertyNotFound('no attribute named %s' % item)
+
+    def __setattr__(self, key, value):
+        if hasattr(type(self), key):
+            object.__setattr__(self, key, value)
+            return
+        if key not in self.properties:
+            raise sfx.SFXPropertyNotFound('no attribute named %s' % key)
+        self.values[key] = value
+        if key == 'name':
+            self._graph._names.set(self.index, value)
+
+    def __repr__(self):
+        return "<sfxFileNode '{0}' ({1})>".format(self.values.get('name'), self.nodetype)
+
+
+class SFXFileGraph(object):
+    """
+    A shaderfx graph read from a .sfx file, with the same lookups as SFXNetwork: 'nodes', 'root', find_by_name(),
+    find_by_type(), get_inputs() and get_outputs(). It can be edited with connect(), disconnect(), delete() and by
+    setting node properties, then saved with write().
+
+    'flavour' is 'ShaderfxShader' or 'StingrayPBS', worked out from the node type ids unless it's passed to read().
+    If the ids don't say which it is, 'flavour' is None and the nodes have no node_class.
+    """
+
+    def __init__(self, tag=GRAPH_TAG, attributes=None, flavour=None):
+        self.tag = tag
+        self.attributes = attributes or {}
+        self.flavour = flavour
+        self.nodes = {}
+        self.edges = EdgeIndex()
+        self._names = KeyIndex()
+        # the top-level items in file order: ('node', id), ('connection', None) or ('raw', xml text)
+        self._layout = []
+        self._has_connections = False
+
+    @property
+    def root(self):
+        return self.nodes.get(int(self.attributes.get(GRAPH_ROOT) or 0))
+
+    def find_by_name(self, name):
+        return [self.nodes[i] for i in self._names.find(name)]
+
+    def find_by_type(self, type):
+        # accepts either type string or SFXNodeType objects
+        if hasattr(type, 'TYPE'):
+            type = type.TYPE
+        return [self.nodes[i] for i in sorted(self.nodes) if self.nodes[i].nodetype == type]
+
+    def get_inputs(self, node):
+        if hasattr(node, 'index'):
+            node = node.index
+        return dict((k, self.nodes[v]) for k, v in self.edges.inputs(node).items())
+
+    def get_outputs(self, node):
+        if hasattr(node, 'index'):
+            node = node.index
+        return dict((k, [self.nodes[n] for n in v]) for k, v in self.edges.outputs(node).items())
+
+    def connect(self, start_plug, end_plug):
+        """
+        connect two sockets, represented by SFXPlug tuples of (node, socket), as in SFXNetwork.connect()
+        """
+        self.edges.connect(start_plug[0], start_plug[1], end_plug[0], end_plug[1])
+
+    def disconnect(self, start_plug, end_plug):
+        self.edges.disconnect(start_plug[0], start_plug[1], end_plug[0], end_plug[1])
+
+    def delete(self, node_or_id):
+        """
+        remove the specified node, and its connections, from the graph
+        """
+        if hasattr(node_or_id, 'index'):
+            node_or_id = node_or_id.index
+        del self.nodes[node_or_id]
+        self.edges.remove_node(node_or_id)
+        self._names.remove(node_or_id)
+
+    def _resolve_types(self, flavour):
+        """
+        find the SFXNodeType for each node. If no <flavour> is given, use the one whose ids match the root node, or
+        failing that the most nodes. If neither settles it the flavour is left as None and the nodes aren't typed.
+        """
+        tables = dict((f, sfx.node_registry[f].by_id) for f in FLAVOURS)
+        if flavour is None:
+            root = self.root
+            if root is not None and root.type_id is not None:
+                flavour = next((f for f in FLAVOURS if root.type_id in tables[f]), None)
+        if flavour is None:
+            counts = sorted((sum(1 for n in self.nodes.values() if n.type_id in tables[f]), f) for f in FLAVOURS)
+            if counts[-1][0] > counts[-2][0]:
+                flavour = counts[-1][1]
+        self.flavour = flavour
+        if flavour is None:
+            return
+        by_id = tables[flavour]
+        by_type = sfx.node_registry[flavour].by_type
+        for node in self.nodes.values():
+            node.node_class = by_id.get(node.type_id) or by_type.get(node.nodetype)
+            if node.nodetype is None and node.node_class is not None:
+                node.nodetype = node.node_class.TYPE
+
+    def _read_node(self, element):
+        node = SFXFileNode(self, _int_attribute(element, NODE_ID), dict(element.attrib))
+        for child in element:
+            tag = _local_name(child.tag)
+            if tag == PROPERTY_TAG:
+                name = child.get(PROPERTY_NAME)
+                kind = child.get(PROPERTY_TYPE)
+                node.properties[name] = kind
+                node.values[name] = parse_value(child.get(PROPERTY_VALUE, child.text), kind)
+            elif tag == SOCKET_TAG:
+                if int(child.get(SOCKET_DIRECTION) or 0):
+                    node.output_names.append(child.get(SOCKET_NAME))
+                else:
+                    node.input_names.append(child.get(SOCKET_NAME))
+            else:
+                child.tail = None
+                node.extra.append(ElementTree.tostring(child))
+        self.nodes[node.index] = node
+        if node.values.get('name'):
+            self._names.set(node.index, node.values['name'])
+        self._layout.append((NODE_TAG, node.index))
+
+    def _read_connection(self, element):
+        ends = [_int_attribute(element, name) for name in
+                (CONNECTION_SOURCE, CONNECTION_SOURCE_SOCKET, CONNECTION_TARGET, CONNECTION_TARGET_SOCKET)]
+        self.edges.connect(*ends)
+        if not self._has_connections:
+            self._has_connections = True
+            self._layout.append((CONNECTION_TAG, None))
+
+    @classmethod
+    def read(cls, sfxfile, flavour=None):
+        """
+        Read the .sfx file <sfxfile> and return an SFXFileGraph. <sfxfile> can be a path or an open file.
+        """
+        graph = None
+        top = None
+        depth = 0
+        for event, element in ElementTree.iterparse(sfxfile, events=('start', 'end')):
+            if event == 'start':
+                if graph is None:
+                    graph = cls(element.tag, dict(element.attrib))
+                    top = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+            tag = _local_name(element.tag)
+            if tag == NODE_TAG:
+                graph._read_node(element)
+            elif tag == CONNECTION_TAG:
+                graph._read_connection(element)
+            else:
+                element.tail = None
+                graph._layout.append(('raw', ElementTree.tostring(element)))
+            # drop everything that's been read so the document never builds up in memory
+            top.clear()
+
+        graph._resolve_types(flavour)
+        return graph
+
+    def write(self, sfxfile):
+        """
+        Save this graph to the path <sfxfile> in a form which shaderfx can load with loadGraph
+        """
+        layout = list(self._layout)
+        if not self._has_connections:
+            layout.append((CONNECTION_TAG, None))
+
+        with codecs.open(sfxfile, 'w', 'utf-8') as handle:
+            handle.write(u'<?xml version="1.0" encoding="utf-8"?>\n')
+            handle.write(u'<%s%s>\n' % (self.tag, _attributes(self.attributes)))
+            for kind, item in layout:
+                if kind == NODE_TAG:
+                    if item in self.nodes:
+                        self._write_node(handle, self.nodes[item])
+                elif kind == CONNECTION_TAG:
+                    for edge in sorted(self.edges.edges()):
+                        self._write_connection(handle, *edge)
+                else:
+                    handle.write(u'  ' + _text(item).strip() + u'\n')
+            handle.write(u'</%s>\n' % self.tag)
+
+    @staticmethod
+    def _write_node(handle, node):
+        handle.write(u'  <%s%s>\n' % (NODE_TAG, _attributes(node.attributes)))
+        for name, kind in node.properties.items():
+            handle.write(u'    <%s%s/>\n' % (PROPERTY_TAG, _attributes(
+                [(PROPERTY_NAME, name), (PROPERTY_TYPE, kind or ''),
+                 (PROPERTY_VALUE, format_value(node.values.get(name), kind))])))
+        for direction, names in ((0, node.input_names), (1, node.output_names)):
+            for name in names:
+                handle.write(u'    <%s%s/>\n' % (SOCKET_TAG, _attributes(
+                    [(SOCKET_DIRECTION, direction), (SOCKET_NAME, name)])))
+        for extra in node.extra:
+            handle.write(u'    ' + _text(extra).strip() + u'\n')
+        handle.write(u'  </%s>\n' % NODE_TAG)
+
+    @staticmethod
+    def _write_connection(handle, source, source_socket, target, target_socket):
+        handle.write(u'  <%s%s/>\n' % (CONNECTION_TAG, _attributes(
+            [(CONNECTION_SOURCE, source), (CONNECTION_SOURCE_SOCKET, source_socket),
+             (CONNECTION_TARGET, target), (CONNECTION_TARGET_SOCKET, target_socket)])))
+
+    def __repr__(self):
+        return "<sfxFileGraph '{0}'>".format(self.flavour)
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _attributes(pairs):
+    """
+    formats a dictionary or a list of (name, value) pairs as xml attributes
+    """
+    if hasattr(pairs, 'items'):
+        pairs = sorted(pairs.items())
+    return u''.join(u' %s=%s' % (k, quoteattr(_text(v) if isinstance(v, basestring) else unicode(v)))
+                    for k, v in pairs)
+
+
+def read(sfxfile, flavour=None):
+    """
+    Read the .sfx file <sfxfile> and return an SFXFileGraph. Raises one of READ_ERRORS if the file can't be read
+    """
+    return SFXFileGraph.read(sfxfile, flavour)
@@ -2,173 +2,54 @@
 This module publishes all of the node type avaliable for use with shaderfx shaders.
 
 Remember that these are for default ShaderFX networks - they won't work in a StingrayPBS node network
-"""
-
-from sfx import SFXNodeType
-
-
-class Comparison(SFXNodeType):
-    TYPE = "Comparison"
-    ID = 20162
-
-
-class IfElseBasic(SFXNodeType):
-    TYPE = "If Else Basic"
-    ID = 20163
-
-
-class Time(SFXNodeType):
-    TYPE = "Time"
-    ID = 20086
-
-
-
-
-class Light(SFXNodeType):
-    TYPE = "Light"
-    ID = 20152
-
-
-class LightList(SFXNodeType):
-    TYPE = "Light List"
-    ID = 20153
-
-
-class Add(SFXNodeType):
-    TYPE = "Add"
-    ID = 20026
-
-
-class Clamp(SFXNodeType):
-    TYPE = "Clamp"
-    ID = 20044
-
-
-class CrossProduct(SFXNodeType):
-    TYPE = "Cross Product"
-    ID = 20030
-
-
-class Distance(SFXNodeType):
-    TYPE = "Distance"
-    ID = 20048
-
-
-class Divide(SFXNodeType):
-    TYPE = "Divide"
-    ID = 20027
-
-
-class DotProduct(SFXNodeType):
-    TYPE = "Dot Product"
-    ID = 20018
-
-
-class Invert(SFXNodeType):
-    TYPE = "Invert"
-    ID = 20157
-
-
-class Length(SFXNodeType):
-    TYPE = "Length"
-    ID = 20032
-
-
-class Max(SFXNodeType):
-    TYPE = "Max"
-    ID = 20052
-
-
-class Multiply(SFXNodeType):
-    TYPE = "Multiply"
-    ID = 20016
-
-
-class Normalize(SFXNodeType):
-    TYPE = "Normalize"
-    ID = 20021
-
-
-class Subtract(SFXNodeType):
-    TYPE = "Subtract"
-    ID = 20022
-
-
-class View(SFXNodeType):
-    TYPE = "View"
-    ID = 20065
-
-
-class ViewI(SFXNodeType):
-    TYPE = "View I"
-    ID = 20067
-
-
-class ViewPrj(SFXNodeType):
-    TYPE = "View Prj"
-    ID = 20077
-
-
-class World(SFXNodeType):
-    TYPE = "World"
-    ID = 20061
-
-
-class WorldI(SFXNodeType):
-    TYPE = "World I"
-    ID = 20063
-
-
-class WorldIT(SFXNodeType):
-    TYPE = "World IT"
-    ID = 20064
-
-
-
-class Bool(SFXNodeType):
-    TYPE = "Bool"
-    ID = 20088
-
-
-class Color(SFXNodeType):
-    TYPE = "Color"
-    ID = 20011
-
-
-class Float(SFXNodeType):
-    TYPE = "Float"
-    ID = 20017
-
-
-class Float2(SFXNodeType):
-    TYPE = "Float2"
-    ID = 20139
-
-
-class Int(SFXNodeType):
-    TYPE = "Int"
-    ID = 20096
-
-
-class VectorComponent(SFXNodeType):
-    TYPE = "Vector Component"
-    ID = 20108
-
-
-class VectorConstruct(SFXNodeType):
-    TYPE = "Vector Construct"
-    ID = 20020
-
-
-class String(SFXNodeType):
-    TYPE = "String"
-    ID = 20105
 
+The generated node types are listed in _NODE_TYPES and their classes are only created when they are first used, so
+importing this module is cheap. They work like ordinary module attributes:
 
+    from sfx.sfxnodes import Color
+"""
 
-class Noise(SFXNodeType):
-    TYPE = "Noise"
-    ID = 20054
+import sys
+
+from sfx import SFXNodeType, SFXNodeTypeModule
+
+
+# ( class name, TYPE, ID ) for the generated node types. The classes are created when they are first used: see
+# SFXNodeTypeModule
+_NODE_TYPES = (
+    ("Comparison", "Comparison", 20162),
+    ("IfElseBasic", "If Else Basic", 20163),
+    ("Time", "Time", 20086),
+    ("Light", "Light", 20152),
+    ("LightList", "Light List", 20153),
+    ("Add", "Add", 20026),
+    ("Clamp", "Clamp", 20044),
+    ("CrossProduct", "Cross Product", 20030),
+    ("Distance", "Distance", 20048),
+    ("Divide", "Divide", 20027),
+    ("DotProduct", "Dot Product", 20018),
+    ("Invert", "Invert", 20157),
+    ("Length", "Length", 20032),
+    ("Max", "Max", 20052),
+    ("Multiply", "Multiply", 20016),
+    ("Normalize", "Normalize", 20021),
+    ("Subtract", "Subtract", 20022),
+    ("View", "View", 20065),
+    ("ViewI", "View I", 20067),
+    ("ViewPrj", "View Prj", 20077),
+    ("World", "World", 20061),
+    ("WorldI", "World I", 20063),
+    ("WorldIT", "World IT", 20064),
+    ("Bool", "Bool", 20088),
+    ("Color", "Color", 20011),
+    ("Float", "Float", 20017),
+    ("Float2", "Float2", 20139),
+    ("Int", "Int", 20096),
+    ("VectorComponent", "Vector Component", 20108),
+    ("VectorConstruct", "Vector Construct", 20020),
+    ("String", "String", 20105),
+    ("Noise", "Noise", 20054),
+)
 
 
 '''
@@ -439,3 +320,5 @@ Vector Construct
 Bump
 Camera Distance Tessellation
 String"""
+
+sys.modules[__name__] = SFXNodeTypeModule(sys.modules[__name__], _NODE_TYPES)
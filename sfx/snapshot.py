@@ -0,0 +1,159 @@
+"""
+Snapshots of the nodes, property values and connections of a network, written by SFXNetwork.snapshot() and read back
+by SFXNetwork.restore(). Nothing in here needs Maya, so snapshots can also be inspected outside of it:
+
+    snap = snapshot.read('path/to/example.snapshot.gz')
+
+    print snap
+    # <sfxSnapshot 'example' nodes: 28 edges: 3>
+
+    print snap.nodes[3]['properties']['color']
+    # [1.0, 0.0, 0.0, 1.0]
+
+A snapshot file is json, one record per line, so it can be streamed with iter_records() without reading the whole
+thing. If the path ends in '.gz' the file is gzipped. The first line is a header and the rest are schemas, nodes and
+connections, in that order:
+
+    {"format": "sfx-snapshot", "version": 1, "shader": "example", "flavour": "ShaderfxShader", "maya": "2016",
+        "root": 1, "node_count": 28, "graph_digest": "3f2a..."}
+    {"schema": "Color", "properties": {"color": "float4", ...}, "inputs": [], "outputs": ["rgb", "r", ...]}
+    {"node": 3, "key": "first", "name": "first", "type": "Color", "group": false, "group_end": null,
+        "properties": {"color": [1.0, 0.0, 0.0, 1.0], ...}}
+    {"edge": [3, 0, 1, 2], "plugs": ["first.rgb", "root.color"]}
+
+'graph_digest' is a sha1 of the shader's saveGraph output when the snapshot was taken, or null if it couldn't be
+saved: SFXNetwork.restore() uses it to tell whether the shader has changed since. Node 'key's are the ones from
+SFXNetwork.node_keys(); group end nodes have no key. 'plugs' is left out of an edge if either end has no key.
+"""
+import gzip
+import json
+from collections import OrderedDict
+
+FORMAT = 'sfx-snapshot'
+VERSION = 1
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def _str_keys(record):
+    # json gives back unicode keys, but property names are used as attribute names
+    return dict((str(k), v) for k, v in record.items())
+
+
+def iter_records(path):
+    """
+    Yields the records in the snapshot file <path> as dictionaries, starting with the header. Raises ValueError if
+    the file isn't a snapshot this module can read.
+    """
+    with _open(path, 'rb') as handle:
+        header = None
+        for line in handle:
+            if not line.strip():
+                continue
+            record = json.loads(line, object_hook=_str_keys)
+            if header is None:
+                header = record
+                if header.get('format') != FORMAT or header.get('version', 0) > VERSION:
+                    raise ValueError('%s is not a version %d sfx snapshot' % (path, VERSION))
+            yield record
+
+
+class SFXSnapshot(object):
+    """
+    The contents of a snapshot:
+
+        header:     { 'shader', 'flavour', 'maya', 'root', 'node_count', 'graph_digest' }
+        schemas:    { node_type: { 'properties': { name: type }, 'inputs': [ plug, ... ], 'outputs': [ plug, ... ] } }
+        nodes:      { node_id: { 'key', 'name', 'type', 'group', 'group_end', 'properties' } }
+        edges:      [ ( source, source_socket, target, target_socket, start_plug, end_plug ) ]
+
+    <start_plug> and <end_plug> are 'key.plug' strings, or None if the nodes at either end don't have keys.
+    """
+
+    def __init__(self, header=None):
+        self.header = header or {}
+        self.schemas = OrderedDict()
+        self.nodes = OrderedDict()
+        self.edges = []
+
+    def records(self):
+        """
+        yields the records to write for this snapshot, header first
+        """
+        header = OrderedDict([('format', FORMAT), ('version', VERSION)])
+        header.update(sorted(self.header.items()))
+        yield header
+        for nodetype, schema in self.schemas.items():
+            record = {'schema': nodetype}
+            record.update(schema)
+            yield record
+        for idx, node in self.nodes.items():
+            record = {'node': idx}
+            record.update(node)
+            yield record
+        for edge in self.edges:
+            record = {'edge': list(edge[:4])}
+            if edge[4] is not None and edge[5] is not None:
+                record['plugs'] = list(edge[4:])
+            yield record
+
+    def write(self, path):
+        """
+        write this snapshot to <path>, gzipped if it ends with '.gz'
+        """
+        with _open(path, 'wb') as handle:
+            for record in self.records():
+                handle.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    @classmethod
+    def read(cls, path):
+        """
+        read the snapshot file at <path>
+        """
+        snapshot = None
+        for record in iter_records(path):
+            if snapshot is None:
+                snapshot = cls(record)
+            elif 'schema' in record:
+                snapshot.schemas[str(record.pop('schema'))] = record
+            elif 'node' in record:
+                snapshot.nodes[record.pop('node')] = record
+            elif 'edge' in record:
+                snapshot.edges.append(tuple(record['edge']) + tuple(record.get('plugs', (None, None))))
+        if snapshot is None:
+            raise ValueError('%s is empty' % path)
+        snapshot.header.pop('format', None)
+        snapshot.header.pop('version', None)
+        return snapshot
+
+    def to_spec(self):
+        """
+        Returns a build() spec for the keyed nodes and the connections between them, as SFXNetwork.to_spec() would
+        have made it when the snapshot was taken (with no properties ignored)
+        """
+        spec = {'root': {'properties': {}}, 'nodes': [], 'connections': []}
+        for node in self.nodes.values():
+            if node['key'] == 'root':
+                spec['root']['properties'] = node['properties']
+            elif node['key'] is not None:
+                node_spec = {'name': node['name'], 'type': node['type'], 'properties': node['properties']}
+                if node['key'] != node['name']:
+                    node_spec['key'] = node['key']
+                spec['nodes'].append(node_spec)
+        spec['connections'] = sorted(e[4:] for e in self.edges if e[4] is not None and e[5] is not None)
+        return spec
+
+    def __repr__(self):
+        return "<sfxSnapshot '{0}' nodes: {1} edges: {2}>".format(self.header.get('shader'), len(self.nodes),
+                                                                  len(self.edges))
+
+
+def read(path):
+    """
+    read the snapshot file at <path> and return an SFXSnapshot
+    """
+    return SFXSnapshot.read(path)
@@ -0,0 +1,135 @@
+"""
+An on-disk cache of the node type ids and schemas for each Maya version and shader flavour, so they only have to be
+queried from Maya once. Generate a cache from inside Maya with a shader of the right flavour:
+
+    shader = SFXNetwork.create('scratch').shader
+    data = typecache.generate(shader, sfxnodes._KNOWN_SFX_NAMES)
+    typecache.save(data)
+
+After that sfx.schema_cache loads the schemas for the running Maya from the cache instead of querying them, and
+SFXNodeType.generate_class_definitions(use_cache=True) uses the cached ids. To see which ids changed between two Maya
+versions:
+
+    print typecache.format_diff(typecache.diff_ids('2016', '2017', 'ShaderfxShader'))
+
+The cache files live in the folder named by the SFX_CACHE_DIR environment variable, or in ~/.sfx_cache. Each one is
+json:
+
+    {"maya": "2016", "flavour": "ShaderfxShader",
+     "ids": {"Color": 20011, ...},
+     "schemas": {"Color": {"properties": {"color": "float4", ...}, "inputs": [], "outputs": ["rgb", ...]}, ...},
+     "errors": {"Some Node": "the error from Maya", ...}}
+
+Loading and comparing caches doesn't need Maya.
+"""
+import json
+import os
+from functools import partial
+
+import sfx
+
+CACHE_DIR_VARIABLE = 'SFX_CACHE_DIR'
+
+
+def cache_folder():
+    """
+    the folder for cache files: $SFX_CACHE_DIR if it's set, otherwise ~/.sfx_cache
+    """
+    return os.environ.get(CACHE_DIR_VARIABLE) or os.path.join(os.path.expanduser('~'), '.sfx_cache')
+
+
+def cache_path(maya_version, flavour):
+    """
+    the path of the cache file for <maya_version> and <flavour>
+    """
+    return os.path.join(cache_folder(), '%s-%s.json' % (flavour, maya_version))
+
+
+def generate(shader, node_list):
+    """
+    Query the id and schema of every node type in <node_list> (a newline-separated string of type names, like the
+    lists at the bottom of sfxnodes and pbsnodes) from <shader>, and return them as a cache dictionary for save().
+    Each type is added to the shader to read its schema and deleted again. Types which can't be queried are listed
+    in 'errors' with the message from Maya; a type is only listed in 'ids' if a node of that type could be made.
+    """
+    cmd = partial(sfx._shaderfx, sfxnode=shader)
+    data = {'maya': sfx.maya_version(), 'flavour': sfx.cmds.nodeType(shader), 'ids': {}, 'schemas': {},
+            'errors': {}}
+    for item in node_list.split('\n'):
+        try:
+            type_id = cmd(getNodeTypeByClassName=item)
+            idx = cmd(addNode=type_id)
+        except RuntimeError as e:
+            data['errors'][item] = str(e)
+            continue
+        data['ids'][item] = type_id
+        try:
+            data['schemas'][item] = sfx.SFXNodeSchema.query(shader, idx).to_dict()
+        except RuntimeError as e:
+            data['errors'][item] = str(e)
+        finally:
+            cmd(deleteNode=idx)
+    return data
+
+
+def save(data, path=None):
+    """
+    write the cache dictionary <data> to <path>, by default the cache_path() for its Maya version and flavour
+    """
+    path = path or cache_path(data['maya'], data['flavour'])
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w') as handle:
+        json.dump(data, handle, indent=1, sort_keys=True)
+    return path
+
+
+def load(maya_version, flavour):
+    """
+    returns the cache dictionary for <maya_version> and <flavour>, or None if there isn't one or it can't be read.
+    A truncated or corrupt cache file is ignored, so the schemas are queried from Maya instead and the next save()
+    replaces it.
+    """
+    path = cache_path(maya_version, flavour)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as handle:
+            data = json.load(handle)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    # property types and names have to be plain strings: see SFXNodeSchema.query()
+    for schema in data.get('schemas', {}).values():
+        schema['properties'] = dict((str(k), v and str(v)) for k, v in schema['properties'].items())
+    return data
+
+
+def diff_ids(old_version, new_version, flavour):
+    """
+    Compare the ids in the caches for two Maya versions. Returns a dictionary with
+
+        added:      { type: id } for types only in <new_version>
+        removed:    { type: id } for types only in <old_version>
+        changed:    { type: ( old_id, new_id ) } for types whose id is different
+    """
+    old = (load(old_version, flavour) or {}).get('ids', {})
+    new = (load(new_version, flavour) or {}).get('ids', {})
+    return {'added': dict((k, v) for k, v in new.items() if k not in old),
+            'removed': dict((k, v) for k, v in old.items() if k not in new),
+            'changed': dict((k, (old[k], v)) for k, v in new.items() if k in old and old[k] != v)}
+
+
+def format_diff(diff):
+    """
+    returns the result of diff_ids() as readable text
+    """
+    lines = []
+    for kind in ('added', 'removed'):
+        for name, id_code in sorted(diff[kind].items()):
+            lines.append('%-8s %-40s %s' % (kind, name, id_code))
+    for name, (old_id, new_id) in sorted(diff['changed'].items()):
+        lines.append('%-8s %-40s %s -> %s' % ('changed', name, old_id, new_id))
+    return '\n'.join(lines) or 'no changes'
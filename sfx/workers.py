@@ -0,0 +1,292 @@
+"""
+Runs a function over the networks in lots of .sfx, .ma and .mb files, spread across a pool of worker processes which
+each keep Maya running between files:
+
+    def audit(network):
+        return len(network.find_by_type(pbsnodes.SampleTexture))
+
+    if __name__ == '__main__':
+        with workers.SFXWorkerPool(processes=8) as pool:
+            for result in pool.run(paths, audit):
+                print result.path, result.value or result.error
+
+The function is called with an SFXNetwork (or StingrayPBSNetwork) for every shader in each file, and must be
+importable by the workers, so it has to be defined at the top level of a module. Its return values have to be
+picklable. Each result's 'value' is { shader: return value } for the file. Results come back as soon as each file is
+done, so they aren't in the same order as <paths>.
+
+An exception in the function is reported in the result's 'error' and the worker carries on. If a worker dies, or takes
+longer than the pool's <timeout> on one file, it's replaced and the file is tried again, up to <retries> times.
+
+Workers start Maya with maya.standalone, or use sfx.headless if Maya isn't available. On Linux and OS X the workers are
+forked from the calling process, so make the pool before initializing Maya in it. On Windows, run the script with
+mayapy and keep the code that makes the pool inside an "if __name__ == '__main__':" block.
+"""
+import multiprocessing
+import os
+import re
+import time
+import traceback
+import cPickle as pickle
+from collections import OrderedDict
+from Queue import Empty
+
+import sfx
+
+# how often, in seconds, the pool checks on its workers while it waits for results
+POLL_INTERVAL = 0.1
+
+
+class SFXWorkResult(object):
+    """
+    The outcome of one file:
+
+        path:       the file
+        index:      the position of the file in the paths passed to run()
+        value:      { shader: return value } or None if it failed
+        error:      the traceback or the reason it failed, or None
+        attempts:   how many times the file was tried
+    """
+    __slots__ = ['path', 'index', 'value', 'error', 'attempts']
+
+    def __init__(self, path, index=None, value=None, error=None, attempts=1):
+        self.path = path
+        self.index = index
+        self.value = value
+        self.error = error
+        self.attempts = attempts
+
+    def __repr__(self):
+        return "<sfxWorkResult '{0}' {1}>".format(self.path, 'failed' if self.error else 'ok')
+
+
+def start_maya():
+    """
+    starts maya.standalone in this process, or switches sfx to the headless backend if Maya isn't available
+    """
+    try:
+        import maya.standalone
+    except ImportError:
+        from sfx import headless
+        headless.use_backend()
+        return
+    maya.standalone.initialize()
+
+
+def file_networks(path):
+    """
+    Yields a network for every shader in <path>, in a new scene. A .sfx file is loaded into a new shader named after
+    the file; a Maya scene is opened.
+    """
+    sfx.cmds.file(new=True, force=True)
+    if path.lower().endswith('.sfx'):
+        from sfx import sfxfile
+        try:
+            flavour = sfxfile.read(path).flavour
+        except sfxfile.READ_ERRORS:
+            flavour = None
+        name = re.sub(r'\W', '_', os.path.splitext(os.path.basename(path))[0])
+        if flavour is not None:
+            yield sfx.NETWORK_CLASSES[flavour].instantiate(name, path)
+        else:
+            yield _try_flavours(name, path)
+    else:
+        sfx.cmds.file(path, open=True, force=True)
+        for network in sfx.load_scene_networks():
+            yield network
+
+
+def _try_flavours(name, path):
+    """
+    Loads the .sfx file <path>, which sfx.sfxfile can't identify, into a new shader of each flavour in turn and
+    returns the network for the first one whose root node is one of that flavour's types. Loading a graph into the
+    wrong kind of shader fails silently, so that's the only sign of which one it belongs in. Raises ValueError if
+    neither fits.
+    """
+    from sfx import sfxfile
+    for flavour in sfxfile.FLAVOURS:
+        network = sfx.NETWORK_CLASSES[flavour].create(name)
+        try:
+            network.cmd(loadGraph=path)
+            network.refresh()
+            if sfx.node_registry.resolve(flavour, network.root.nodetype) is not None:
+                return network
+        except RuntimeError:
+            pass
+        sfx.cmds.delete(network.shader)
+    raise ValueError('%s is not a ShaderFX or StingrayPBS graph' % path)
+
+
+def _worker(tasks, results, func, initializer):
+    """
+    the main loop of a worker process: runs <func> over the networks in each path from <tasks> until it gets None
+    """
+    start_maya()
+    if initializer is not None:
+        initializer()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        run_id, index, attempt, path = task
+        try:
+            value = OrderedDict((network.shader, func(network)) for network in file_networks(path))
+            # pickle here, so a value that can't be sent back is reported instead of lost
+            results.put((run_id, index, attempt, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), None))
+        except Exception:
+            results.put((run_id, index, attempt, None, traceback.format_exc()))
+
+
+class _Worker(object):
+    """
+    a worker process, its task queue and the task it's working on
+    """
+
+    def __init__(self, results, func, initializer):
+        self.tasks = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_worker, args=(self.tasks, results, func, initializer))
+        self.process.daemon = True
+        self.process.start()
+        self.task = None
+        self.started = None
+
+    def send(self, task):
+        self.task = task
+        self.started = time.time()
+        self.tasks.put(task)
+
+    def stop(self):
+        if self.process.is_alive():
+            self.tasks.put(None)
+            self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+class SFXWorkerPool(object):
+    """
+    A pool of worker processes which each keep Maya running between files. See the module docstring.
+
+        processes:      the number of workers, by default one per core
+        retries:        how many more times to try a file whose worker died or timed out
+        timeout:        the longest a worker may spend on one file, in seconds, or None for no limit
+        initializer:    an optional function each worker calls once after starting Maya, for instance to load
+                        plugins. Like the function passed to run(), it has to be defined at the top of a module.
+
+    Workers are started by run() and kept until close(), so a pool can run several jobs without restarting Maya.
+    """
+
+    def __init__(self, processes=None, retries=1, timeout=None, initializer=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.retries = retries
+        self.timeout = timeout
+        self.initializer = initializer
+        self.restarts = 0
+        self._runs = 0
+        self._func = None
+        self._workers = []
+        self._results = None
+
+    def _start(self, func):
+        if func is not self._func:
+            # the function is handed to the workers when they start, so a new one needs new workers
+            self.close()
+            self._func = func
+        if self._results is None:
+            self._results = multiprocessing.Queue()
+        while len(self._workers) < self.processes:
+            self._workers.append(_Worker(self._results, func, self.initializer))
+
+    def run(self, paths, func):
+        """
+        Calls <func> with the network for every shader in each of <paths> and yields an SFXWorkResult for each file as
+        it's finished. If the generator is closed before it's finished, the workers still busy with its files are
+        replaced.
+        """
+        self._start(func)
+        self._runs += 1
+        run_id = self._runs
+        paths = list(paths)
+        pending = [(index, 1) for index in reversed(range(len(paths)))]
+        attempts = {}
+        busy = {}
+        try:
+            while pending or busy:
+                for worker in self._workers:
+                    if worker.task is None and pending:
+                        index, attempt = pending.pop()
+                        attempts[index] = attempt
+                        busy[index] = worker
+                        worker.send((run_id, index, attempt, paths[index]))
+
+                try:
+                    result_run, index, attempt, value, error = self._results.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    result_run = index = attempt = None
+                # a worker which was replaced may still have sent a result for an earlier attempt or an earlier run
+                if result_run == run_id and index in busy and attempt == attempts[index]:
+                    busy.pop(index).task = None
+                    if value is not None:
+                        value = pickle.loads(value)
+                    yield SFXWorkResult(paths[index], index, value, error, attempts[index])
+
+                for position, worker in enumerate(self._workers):
+                    if worker.task is None:
+                        continue
+                    timed_out = self.timeout is not None and time.time() - worker.started > self.timeout
+                    if worker.process.is_alive() and not timed_out:
+                        continue
+                    index = worker.task[1]
+                    reason = 'timed out' if timed_out else 'worker died (exit code %s)' % worker.process.exitcode
+                    self._replace(position)
+                    self.restarts += 1
+                    del busy[index]
+                    if attempts[index] <= self.retries:
+                        pending.append((index, attempts[index] + 1))
+                    else:
+                        yield SFXWorkResult(paths[index], index, None, reason, attempts[index])
+        finally:
+            # workers still busy with this run's files would hold up the next run
+            for position, worker in enumerate(self._workers):
+                if worker.task is not None:
+                    self._replace(position)
+
+    def _replace(self, position):
+        """
+        kill the worker at <position> and start a new one in its place
+        """
+        process = self._workers[position].process
+        process.terminate()
+        # reap it, so killed workers don't pile up as zombies over a long run
+        process.join()
+        self._workers[position] = _Worker(self._results, self._func, self.initializer)
+
+    def close(self):
+        """
+        stop the workers
+        """
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+        self._func = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "<sfxWorkerPool processes: {0} running: {1}>".format(self.processes, len(self._workers))
+
+
+def run(paths, func, processes=None, retries=1, timeout=None):
+    """
+    Calls <func> with the network for every shader in each of <paths>, using a new SFXWorkerPool, and returns a list
+    of SFXWorkResults in the same order as <paths>
+    """
+    paths = list(paths)
+    with SFXWorkerPool(processes, retries, timeout) as pool:
+        results = dict((r.index, r) for r in pool.run(paths, func))
+    return [results[i] for i in range(len(paths))]
@@ -4,15 +4,44 @@ Basic unit tests for the sfx module. Usage:
 
    cd path/to/tests/and/sfx/module
    path/to/mayapy.exe  tests.py
+
+Without Maya, 'python tests.py' runs them against the emulated shaderfx in sfx.headless. The tests which count the
+nodes in Maya's own default graph are skipped.
 """
 
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
 import unittest
 
-import maya.cmds as cmds
-
+import sfx
+import sfx.headless as headless
+import sfx.pbsnodes as pbsnodes
+import sfx.profiling as profiling
+import sfx.sfxfile as sfxfile
 import sfx.sfxnodes as sfxnodes
-from sfx import SFXNetwork, SFXPropertyNotFound
+import sfx.snapshot as snapshot
+import sfx.typecache as typecache
+import sfx.workers as workers
+from sfx import SFXNetwork, SFXNode, SFXPropertyNotFound, SFXSpecError
+from sfx.graph import EdgeIndex, layered_layout
+
+try:
+    import maya.cmds as cmds
+
+    HEADLESS = False
+except ImportError:
+    cmds = headless.use_backend()
+    HEADLESS = True
 
+# The .sfx layout sfx.sfxfile reads, and sfx.headless writes, hasn't been checked against files ShaderFX really saves.
+# Until there are fixtures for that (see capture_fixtures()), the tests which read what saveGraph writes only run
+# headless, where saveGraph writes that layout itself.
+FORMAT_UNVERIFIED = "the .sfx layout hasn't been checked against real saveGraph output yet"
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
 
 
 class TestShaderFX(unittest.TestCase):
@@ -32,17 +61,34 @@ class TestShaderFXNetwork(TestShaderFX):
         root_node = new_network.root
         assert root_node.nodetype == 'Hardware Shader'
 
+    @unittest.skipIf(HEADLESS, 'needs the default graph from Maya')
     def test_find_by_name(self):
         new_network = SFXNetwork.create('example')
         assert len(new_network.find_by_name('SurfaceMaskCutoff')) == 1
         assert len(new_network.find_by_name('nonexistent')) == 0
         assert len(new_network.find_by_name('Color')) == 7
 
+    def test_find_by_name_after_rename(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        new_node.name = 'renamed'
+        assert new_network.find_by_name('renamed') == [new_node]
+        assert new_network.find_by_name('added') == []
+        new_network.delete(new_node)
+        assert new_network.find_by_name('renamed') == []
+
+    @unittest.skipIf(HEADLESS, 'needs the default graph from Maya')
     def test_find_by_type(self):
         new_network = SFXNetwork.create('example')
         assert len(new_network.find_by_type(sfxnodes.Color)) == 26
         assert len(new_network.find_by_type(sfxnodes.DerivedNormalZMap)) == 0
 
+    def test_find_by_type_string(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        assert new_node in new_network.find_by_type('Color')
+        assert new_network.find_by_type('Color') == new_network.find_by_type(sfxnodes.Color)
+
     def test_node_dict(self):
         new_network = SFXNetwork.create('example')
         assert hasattr(new_network.nodes, 'keys')
@@ -73,6 +119,391 @@ class TestShaderFXNetwork(TestShaderFX):
         connections = new_network.get_inputs(target)
         assert new_node not in connections.values()
 
+    def test_eager_network(self):
+        new_network = SFXNetwork.create('example')
+        eager_network = SFXNetwork('example', lazy=False)
+        assert sorted(eager_network.nodes.keys()) == sorted(new_network.nodes.keys())
+        assert eager_network.root.nodetype == 'Hardware Shader'
+
+    def test_get_outputs(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        target = new_network.find_by_name('TotalAmbientAndOpacity')[0]
+        new_network.connect(new_node.outputs.rgb, target.inputs.xyz)
+        assert target in new_network.get_outputs(new_node)[new_node.outputs.rgb[1]]
+
+    def test_refresh(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        target = new_network.find_by_name('TotalAmbientAndOpacity')[0]
+        new_network.connect(new_node.outputs.rgb, target.inputs.xyz)
+        assert new_node in new_network.get_inputs(target).values()
+        # edit the shader behind the network's back
+        new_network.cmd(breakConnection=new_node.outputs.rgb + target.inputs.xyz)
+        new_network.refresh()
+        assert new_node not in new_network.get_inputs(target).values()
+
+    def test_batch(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        target = new_network.find_by_name('TotalAmbientAndOpacity')[0]
+        with new_network.batch() as batch:
+            new_node.uiorder = 5
+            new_node.uiorder = 10
+            assert new_node.uiorder == 10
+            new_network.connect(new_node.outputs.rgb, target.inputs.xyz)
+            assert new_node not in new_network.get_inputs(target).values()
+        assert batch.coalesced == 1
+        assert new_node.uiorder == 10
+        assert new_node in new_network.get_inputs(target).values()
+
+    def test_batch_exception(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+
+        def failing_batch():
+            with new_network.batch():
+                new_node.uiorder = 10
+                raise ValueError('cancel the batch')
+
+        self.assertRaises(ValueError, failing_batch)
+        assert new_node.uiorder == 0
+
+    def test_build(self):
+        new_network = SFXNetwork.create('example')
+        spec = {'nodes': [{'name': 'first', 'type': sfxnodes.Color, 'properties': {'uiorder': 3}},
+                          {'name': 'second', 'type': 'Color'}],
+                'connections': [('first.rgb', 'TotalAmbientAndOpacity.xyz')]}
+        created = new_network.build(spec)
+        assert created['first'].uiorder == 3
+        assert created['second'].nodetype == 'Color'
+        target = new_network.find_by_name('TotalAmbientAndOpacity')[0]
+        assert created['first'] in new_network.get_inputs(target).values()
+
+    def test_build_invalid(self):
+        new_network = SFXNetwork.create('example')
+        node_count = len(new_network.nodes)
+        spec = {'nodes': [{'name': 'first', 'type': 'NotANodeType'}, {'type': sfxnodes.Color}],
+                'connections': [('first.rgb', 'nonexistent.xyz')]}
+        try:
+            new_network.build(spec)
+        except SFXSpecError as e:
+            assert len(e.problems) == 3
+        else:
+            assert False, 'build() accepted an invalid spec'
+        assert len(new_network.nodes) == node_count
+
+    def test_diff(self):
+        master = SFXNetwork.create('master')
+        master.build({'nodes': [{'name': 'first', 'type': sfxnodes.Color, 'properties': {'uiorder': 3}}],
+                      'connections': [('first.rgb', 'TotalAmbientAndOpacity.xyz')]})
+        derived = SFXNetwork.create('derived')
+        patch = derived.diff(master)
+        assert len(patch.add) == 1 and len(patch.connect) == 1
+        derived.apply_patch(patch)
+        assert derived.find_by_name('first')[0].uiorder == 3
+        assert len(derived.diff(master)) == 0
+
+    def test_diff_ignores_ui(self):
+        master = SFXNetwork.create('master')
+        derived = SFXNetwork.create('derived')
+        target = derived.find_by_name('TotalAmbientAndOpacity')[0]
+        target.posx = 300
+        assert len(derived.diff(master)) == 0
+        spec = {'nodes': [{'name': 'TotalAmbientAndOpacity', 'type': target.nodetype, 'properties': {'uiorder': 5}}]}
+        patch = derived.diff(spec, delete=False)
+        assert patch.set == [('TotalAmbientAndOpacity', 'uiorder', 5)]
+        assert not patch.delete
+
+    def test_keys_in_batch(self):
+        new_network = SFXNetwork.create('example')
+        with new_network.batch():
+            added = new_network.add(sfxnodes.Color, 'added')
+            assert new_network.find_by_name('added') == [added]
+            assert new_network.node_keys()['added'] is added
+            assert [n['name'] for n in new_network.to_spec()['nodes']].count('added') == 1
+        assert added.name == 'added'
+
+    def test_snapshot(self):
+        new_network = SFXNetwork.create('example')
+        new_network.build({'nodes': [{'name': 'first', 'type': sfxnodes.Color, 'properties': {'uiorder': 3}}],
+                           'connections': [('first.rgb', 'TotalAmbientAndOpacity.xyz')]})
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, 'example.snapshot.gz')
+            new_network.snapshot(path)
+            restored = SFXNetwork.restore(path)
+            assert sorted(restored.nodes) == sorted(new_network.nodes)
+            assert len(restored.edges) == len(new_network.edges)
+            copy = SFXNetwork.restore(path, 'copy')
+            assert copy.find_by_name('first')[0].uiorder == 3
+            assert len(copy.diff(new_network)) == 0
+
+            # an unchanged shader is loaded from the snapshot without reading its nodes or connections
+            with sfx.profile() as profiler:
+                restored = SFXNetwork.restore(path)
+            assert sorted(profiler.flags()) == ['getNodeCount', 'rhw', 'saveGraph']
+            assert restored.find_by_name('first')[0].uiorder == 3
+            assert sorted(restored.edges.edges()) == sorted(restored._query_edges().edges())
+
+            # edits made since the snapshot are undone
+            first = new_network.find_by_name('first')[0]
+            first.color = [1.0, 0.0, 0.0, 1.0]
+            new_network.connect(first.outputs.rgb, new_network.root.inputs.emissive)
+            restored = SFXNetwork.restore(path)
+            assert restored.find_by_name('first')[0].color == [0.5, 0.5, 0.5, 1.0]
+            assert restored.root.inputs.emissive[1] not in restored.get_inputs(restored.root)
+            assert sorted(restored.edges.edges()) == sorted(restored._query_edges().edges())
+        finally:
+            shutil.rmtree(folder)
+
+    def test_layout(self):
+        new_network = SFXNetwork.create('example')
+        created = new_network.build({'nodes': [{'name': 'first', 'type': sfxnodes.Color}],
+                                     'connections': [('first.rgb', 'TotalAmbientAndOpacity.xyz')]})
+        target = new_network.find_by_name('TotalAmbientAndOpacity')[0]
+        new_network.connect(target.outputs.rgb, new_network.root.inputs.color)
+        new_network.layout()
+        assert created['first'].posx < target.posx < new_network.root.posx
+        assert target.collapsed
+
+    def test_layout_groups(self):
+        new_network = SFXNetwork.create('example')
+        texture = new_network.add(sfxnodes.TextureMap, 'texture')
+        new_network.connect(texture.outputs.result, new_network.root.inputs.emissive)
+        end_position = (texture.end_node.posx, texture.end_node.posy)
+        new_network.layout()
+        # the group is placed where its outputs are used, and its hidden end node is left alone
+        assert texture.posx < new_network.root.posx
+        assert texture.collapsed
+        assert (texture.end_node.posx, texture.end_node.posy) == end_position
+
+    def test_load_scene_networks(self):
+        SFXNetwork.create('example')
+        sfx.StingrayPBSNetwork.create('example_pbs')
+        stats = sfx.SFXSceneStats()
+        loaded = sfx.load_scene_networks(stats=stats)
+        first = next(loaded)
+        # networks are only loaded as they are asked for
+        assert stats.shaders == 1
+        networks = [first] + list(loaded)
+        assert sorted((n.shader, type(n).__name__) for n in networks) == [('example', 'SFXNetwork'),
+                                                                         ('example_pbs', 'StingrayPBSNetwork')]
+        assert stats.nodes == sum(len(n.nodes) for n in networks)
+        assert stats.commands > 0
+        assert sfx._recorder is None
+
+    def test_one_wrapper_per_node(self):
+        new_network = SFXNetwork.create('example')
+        assert new_network.root is new_network.nodes[new_network.root.index]
+        tint = new_network.add(sfxnodes.Color, 'tint')
+        new_network.connect(tint.outputs.rgb, new_network.root.inputs.color)
+        assert new_network.get_inputs(new_network.root)[0] is tint
+        assert new_network.node(tint.index) is tint
+        # separate wrappers for the same node are equal
+        assert SFXNode('example', tint.index) == tint
+        assert SFXNode('example', tint.index) != new_network.root
+
+    def test_node_made_elsewhere(self):
+        new_network = SFXNetwork.create('example')
+        idx = new_network.cmd(addNode=sfxnodes.Float.ID)
+        assert new_network.node(idx) is new_network.node(idx)
+        assert new_network.find_by_name('Float') == [new_network.node(idx)]
+
+    def test_group_end_node(self):
+        new_network = SFXNetwork.create('example')
+        group = new_network.add(sfxnodes.TextureMap, 'texture')
+        end = group.end_node
+        assert new_network.nodes[end.index] is end
+        new_network.delete(group)
+        assert end.index not in new_network.nodes
+
+    def test_upstream(self):
+        new_network = SFXNetwork.create('example')
+        root = new_network.root
+        target = new_network.find_by_name('TotalAmbientAndOpacity')[0]
+        color = new_network.find_by_name('Color')[0]
+        tint = new_network.add(sfxnodes.Color, 'tint')
+        new_network.connect(tint.outputs.rgb, root.inputs.emissive)
+        new_network.connect(tint.outputs.a, target.inputs.w)
+        found = list(new_network.upstream(root))
+        # tint feeds two nodes but is only visited once, at its nearest
+        assert found == [(target, root.inputs.color[1], 1), (tint, root.inputs.emissive[1], 1),
+                         (color, target.inputs.xyz[1], 2)]
+        assert [n for n, _, _ in new_network.upstream(root, depth=1)] == [target, tint]
+        assert [n for n, _, _ in new_network.upstream(root.inputs.color)] == [target, color, tint]
+        assert [n for n, _, _ in new_network.upstream(root.inputs.color, stop=sfxnodes.VectorConstruct)] == [target]
+        assert [n for n, _, d in new_network.downstream(color)] == [target, root]
+
+    def test_upstream_stops_early(self):
+        new_network = SFXNetwork.create('example')
+        root = new_network.root
+        with sfx.profile() as profiler:
+            found = any(n.nodetype == 'Vector Construct' for n, _, _ in new_network.upstream(root))
+        assert found
+        # only the root's sockets were queried
+        assert profiler.flags()['getSocketCount']['calls'] == 1
+        assert new_network._edge_index is None
+
+    def test_prune(self):
+        new_network = SFXNetwork.create('example')
+        root = new_network.root
+        texture = new_network.add(sfxnodes.TextureMap, 'texture')
+        new_network.connect(texture.outputs.result, root.inputs.emissive)
+        unused = new_network.add(sfxnodes.TextureMap, 'unused')
+        orphan = new_network.add(sfxnodes.Color, 'orphan')
+        feeds_orphan = new_network.add(sfxnodes.VectorConstruct, 'feeds_orphan')
+        new_network.connect(orphan.outputs.rgb, feeds_orphan.inputs.xyz)
+        count = len(new_network.nodes)
+
+        dead = new_network.prune(dry_run=True)
+        assert len(new_network.nodes) == count
+        assert set(n.name for n in dead) >= set(['unused', 'orphan', 'feeds_orphan'])
+        assert unused.end_node not in dead
+
+        assert new_network.prune() == dead
+        assert new_network.find_by_name('orphan') == []
+        assert unused.end_node.index not in new_network.nodes
+        assert new_network.nodes[texture.end_node.index] is texture.end_node
+        assert new_network.get_inputs(root)[root.inputs.emissive[1]] is texture.end_node
+        assert new_network.prune(dry_run=True) == []
+
+    def test_dedupe(self):
+        new_network = SFXNetwork.create('example')
+        root = new_network.root
+        tints = [new_network.add(sfxnodes.Color, 'tint') for _ in range(3)]
+        for tint, color in zip(tints, ([0.0, 1.0, 0.0, 1.0], [0.0, 1.0, 0.0, 1.0], [1.0, 0.0, 0.0, 1.0])):
+            tint.color = color
+        mixes = [new_network.add(sfxnodes.VectorConstruct, 'mix') for _ in range(2)]
+        for tint, mix in zip(tints, mixes):
+            new_network.connect(tint.outputs.rgb, mix.inputs.xyz)
+        new_network.connect(mixes[0].outputs.rgb, root.inputs.emissive)
+        new_network.connect(mixes[1].outputs.rgb, root.inputs.normal)
+        new_network.connect(tints[2].outputs.rgb, root.inputs.alpha)
+
+        merged = new_network.dedupe(dry_run=True)
+        # the second mix is only a duplicate once its input is
+        assert merged == {tints[1]: tints[0], mixes[1]: mixes[0]}
+        assert len(new_network.find_by_name('tint')) == 3
+
+        assert new_network.dedupe() == merged
+        assert new_network.find_by_name('tint') == [tints[0], tints[2]]
+        inputs = new_network.get_inputs(root)
+        assert inputs[root.inputs.emissive[1]] is inputs[root.inputs.normal[1]] is mixes[0]
+        assert inputs[root.inputs.alpha[1]] is tints[2]
+        assert new_network.dedupe() == {}
+
+    def test_dedupe_swizzles(self):
+        new_network = SFXNetwork.create('example')
+        tint = new_network.add(sfxnodes.Color, 'tint')
+        tint.color = [0.0, 1.0, 0.0, 1.0]
+        mixes = [new_network.add(sfxnodes.VectorConstruct, 'mix') for _ in range(3)]
+        for mix, swizzle in zip(mixes, ('xyz', 'zyx', 'zyx')):
+            new_network.connect(tint.outputs.rgb, mix.inputs.xyz, swizzle)
+        # only the nodes with the same swizzle are merged, and a dry run only sends queries
+        with sfx.profile() as profiler:
+            assert new_network.dedupe(dry_run=True) == {mixes[2]: mixes[1]}
+        assert not [c for c in profiler.commands if c[0].startswith('edit')]
+
+    def test_dedupe_keeps_swizzles(self):
+        new_network = SFXNetwork.create('example')
+        root = new_network.root
+        tints = [new_network.add(sfxnodes.Color, 'tint') for _ in range(2)]
+        for tint in tints:
+            tint.color = [0.0, 1.0, 0.0, 1.0]
+        mix = new_network.add(sfxnodes.VectorConstruct, 'mix')
+        new_network.connect(tints[0].outputs.rgb, root.inputs.emissive)
+        new_network.connect(tints[1].outputs.rgb, mix.inputs.xyz, 'zyx')
+        with sfx.profile() as profiler:
+            assert new_network.dedupe() == {tints[1]: tints[0]}
+        # the consumer is reconnected with the swizzle it had
+        assert new_network.get_inputs(mix)[mix.inputs.xyz[1]] == tints[0]
+        swizzles = [c for c in profiler.commands if c[0] == 'edit_string' and c[3] == mix.index]
+        assert len(swizzles) == 1
+        assert new_network._swizzles(mix) == ((mix.inputs.xyz[1], 'zyx'),)
+
+    def test_fingerprint(self):
+        first = SFXNetwork.create('first')
+        second = SFXNetwork.create('second')
+        # the same graph, built in a different order
+        for network, names in ((first, ('a', 'b')), (second, ('b', 'a'))):
+            added = dict((name, network.add(sfxnodes.Color, name)) for name in names)
+            added['b'].color = [1.0, 0.0, 0.0, 1.0]
+            network.connect(added['a'].outputs.rgb, network.root.inputs.emissive)
+        assert first.fingerprint() == second.fingerprint()
+
+        fingerprint = first.fingerprint()
+        tint = first.find_by_name('a')[0]
+        tint.posx = 250
+        assert first.fingerprint() == fingerprint
+        with sfx.profile() as profiler:
+            tint.color = [0.0, 0.0, 1.0, 1.0]
+            changed = first.fingerprint()
+        assert changed != fingerprint
+        # only the edited node and the root it feeds are read again
+        assert set(e[3] for e in profiler.commands if e[0] == 'gpv') == set([tint.index, first.root.index])
+        tint.color = [0.5, 0.5, 0.5, 1.0]
+        assert first.fingerprint() == fingerprint
+
+        first.disconnect(tint.outputs.rgb, first.root.inputs.emissive)
+        assert first.fingerprint() != fingerprint
+        # property names and values from Maya may be unicode or str
+        assert repr(sfx._hashable({u'name': u'tint'}.items())) == repr(sfx._hashable({'name': 'tint'}.items()))
+
+    def test_fingerprint_swizzles(self):
+        fingerprints = []
+        for name, swizzle in (('first', 'xyz'), ('second', 'zyx')):
+            network = SFXNetwork.create(name)
+            tint = network.add(sfxnodes.Color, 'tint')
+            network.connect(tint.outputs.rgb, network.root.inputs.emissive, swizzle)
+            fingerprints.append(network.fingerprint())
+        assert fingerprints[0] != fingerprints[1]
+        with sfx.profile() as profiler:
+            network.refresh()
+            network.fingerprint()
+        assert not [c for c in profiler.commands if c[0].startswith('edit')]
+        network.connect(tint.outputs.rgb, network.root.inputs.emissive, 'xyz')
+        assert network.fingerprint() == fingerprints[0]
+
+    def test_discovery(self):
+        new_network = SFXNetwork.create('example')
+        new_network.delete(new_network.add(sfxnodes.Color))
+        probed = new_network._discover_by_probe()
+        assert len(probed) == new_network.cmd(getNodeCount=True)
+
+    @unittest.skipIf(not HEADLESS, FORMAT_UNVERIFIED)
+    def test_discovery_from_graph(self):
+        new_network = SFXNetwork.create('example')
+        new_network.delete(new_network.add(sfxnodes.Color))
+        probed = new_network._discover_by_probe()
+        # discovery falls back to probing if the saved graph can't be read, but it should always be readable
+        from_graph = new_network._discover_from_graph()
+        assert from_graph is not None
+        assert sorted(i[:3] for i in from_graph) == sorted(i[:3] for i in probed)
+
+    def test_discovery_fallback(self):
+        new_network = SFXNetwork.create('example')
+        folder = tempfile.mkdtemp()
+        original = sfxfile.iter_node_records
+        warnings = []
+        handler = logging.Handler()
+        handler.emit = warnings.append
+        sfx.logger.addHandler(handler)
+        try:
+            # saved graphs laid out differently from what sfxfile expects: truncated, missing ids, or no nodes found
+            for text in ('<graph root="1"><node id="1"', '<graph root="1"><node ident="1"/></graph>', '<graph/>'):
+                path = os.path.join(folder, 'other.sfx')
+                with open(path, 'w') as handle:
+                    handle.write(text)
+                sfxfile.iter_node_records = lambda _: original(path)
+                assert new_network._discover_from_graph() is None
+            assert len(warnings) == 3
+            assert all(new_network.shader in w.getMessage() for w in warnings)
+        finally:
+            sfxfile.iter_node_records = original
+            sfx.logger.removeHandler(handler)
+            shutil.rmtree(folder)
+
     def test_cmd(self):
         new_network = SFXNetwork.create('example')
         result = new_network.cmd(help=True)
@@ -105,6 +536,33 @@ class TestSFXNode(TestShaderFX):
         for k, v in props.items():
             assert expected[k] == v
 
+    def test_node_class(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        assert new_node.node_class is sfxnodes.Color
+
+    def test_lazy_node_schema(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        lazy_node = SFXNode('example', new_node.index)
+        assert lazy_node.properties == new_node.properties
+        assert lazy_node.outputs.rgb == new_node.outputs.rgb
+
+    def test_schema_cache(self):
+        new_network = SFXNetwork.create('example')
+        sfx.schema_cache.clear()
+        first = new_network.add(sfxnodes.Color, 'first')
+        second = new_network.add(sfxnodes.Color, 'second')
+        assert first.properties is second.properties
+        assert sfx.schema_cache.misses == 1
+        assert sfx.schema_cache.hits == 1
+
+    def test_schema_is_read_only(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        example = lambda: new_node.properties.update({'fred': 'int'})
+        self.assertRaises(TypeError, example)
+
     def test_properties_getter_4(self):
         new_network = SFXNetwork.create('example')
         new_node = new_network.add(sfxnodes.Color, 'added')
@@ -140,8 +598,610 @@ class TestSFXNode(TestShaderFX):
         self.assertRaises(SFXPropertyNotFound, example)
 
 
+class TestSFXFile(unittest.TestCase):
+    EXAMPLE = """<?xml version="1.0" encoding="utf-8"?>
+<graph root="1">
+  <node id="1" class="Standard Base" classid="20176" groupend="0">
+    <property name="name" type="string" value="root"/>
+    <socket direction="0" name="Base Color"/>
+    <socket direction="0" name="Normal"/>
+  </node>
+  <node id="2" class="Constant Vector4" classid="20201" groupend="0">
+    <property name="name" type="string" value="tint"/>
+    <property name="value" type="float4" value="1 0.5 0.5 1"/>
+    <socket direction="1" name="RGBA"/>
+  </node>
+  <connection source="2" sourcesocket="0" target="1" targetsocket="0"/>
+</graph>
+"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'example.sfx')
+        with open(self.path, 'w') as handle:
+            handle.write(self.EXAMPLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_read(self):
+        graph = sfxfile.read(self.path)
+        assert graph.flavour == 'StingrayPBS'
+        assert graph.root.name == 'root'
+        tint = graph.find_by_name('tint')[0]
+        assert tint.node_class is pbsnodes.ConstantVector4
+        assert graph.find_by_type(pbsnodes.ConstantVector4) == [tint]
+        assert tint.value == [1.0, 0.5, 0.5, 1.0]
+        assert graph.get_inputs(graph.root) == {0: tint}
+
+    def test_write(self):
+        graph = sfxfile.read(self.path)
+        tint = graph.find_by_name('tint')[0]
+        tint.value = [0, 0, 1, 1]
+        graph.disconnect(tint.outputs.rgba, graph.root.inputs.base_color)
+        graph.connect(tint.outputs.rgba, graph.root.inputs.normal)
+        edited = os.path.join(self.folder, 'edited.sfx')
+        graph.write(edited)
+
+        reread = sfxfile.read(edited)
+        assert reread.nodes[2].value == [0.0, 0.0, 1.0, 1.0]
+        assert reread.get_inputs(1) == {1: reread.nodes[2]}
+
+    @unittest.skipIf(not HEADLESS, FORMAT_UNVERIFIED)
+    def test_read_saved_graph(self):
+        cmds.file(new=True, f=True)
+        new_network = SFXNetwork.create('example')
+        new_network.cmd(saveGraph=self.path)
+        graph = sfxfile.read(self.path)
+        assert sorted(graph.nodes) == sorted(new_network.nodes)
+
+    def test_unknown_flavour(self):
+        with open(self.path, 'w') as handle:
+            handle.write(self.EXAMPLE.replace('classid="20176"', 'classid="1"').replace('classid="20201"',
+                                                                                      'classid="2"'))
+        graph = sfxfile.read(self.path)
+        assert graph.flavour is None
+        assert graph.root.node_class is None
+
+
+def fixture_shaderfx():
+    network = SFXNetwork.create('shaderfx')
+    tint = network.add(sfxnodes.Color, 'tint')
+    tint.color = [1.0, 0.0, 0.0, 1.0]
+    network.connect(tint.outputs.rgb, network.root.inputs.emissive)
+    network.add(sfxnodes.TextureMap, 'texture')
+    return network
+
+
+def fixture_stingray_pbs():
+    network = sfx.StingrayPBSNetwork.create('pbs')
+    tint = network.add(pbsnodes.ConstantVector3, 'tint')
+    network.connect((tint.index, 0), (network.root.index, 0))
+    return network
+
+
+def describe(network):
+    """
+    the root, nodes and connections of <network> in the form of the .json file saved with each fixture. Only node and
+    socket queries are used, not saveGraph, so the description doesn't depend on the file format
+    """
+    network._load_nodes(network._discover_by_probe())
+    nodes = {}
+    for idx, node in network.nodes.items():
+        end = isinstance(node, sfx.SFXGroupEndNode)
+        nodes[str(idx)] = {'group': isinstance(node, sfx.SFXGroupNode), 'type': None if end else node.nodetype,
+                           'name': None if end else network._names.keys.get(idx)}
+    edges = sorted([source, target, target_socket] for source, _, target, target_socket in
+                   network._query_edges().edges())
+    return {'flavour': network.flavour, 'root': network.root.index, 'nodes': nodes, 'edges': edges}
+
+
+def capture_fixtures(folder=FIXTURES):
+    """
+    Saves the graphs made by the fixture_ functions with saveGraph into <folder>, each with a .json description from
+    describe(), for TestFixtures. This has to run in Maya: 'mayapy tests.py capture'. Commit the files it writes.
+    """
+    if HEADLESS:
+        raise RuntimeError('fixtures have to be saved by ShaderFX itself, in Maya')
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    for build in (fixture_shaderfx, fixture_stingray_pbs):
+        cmds.file(new=True, f=True)
+        network = build()
+        path = os.path.join(folder, '%s-%s.sfx' % (network.shader, sfx.maya_version()))
+        network.cmd(saveGraph=path)
+        with open(os.path.splitext(path)[0] + '.json', 'w') as handle:
+            json.dump(describe(network), handle, indent=1, sort_keys=True)
+
+
+def fixture_paths(folder=FIXTURES):
+    """
+    the .sfx fixtures in <folder> which have a .json description
+    """
+    if not os.path.isdir(folder):
+        return []
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                  if f.endswith('.sfx') and os.path.exists(os.path.join(folder, f[:-4] + '.json')))
+
+
+@unittest.skipUnless(fixture_paths(), "no saveGraph fixtures yet: see capture_fixtures()")
+class TestFixtures(unittest.TestCase):
+    """
+    checks sfx.sfxfile, and the saveGraph and loadGraph of sfx.headless, against graphs saved by ShaderFX in Maya
+    """
+
+    def expected(self, path):
+        with open(os.path.splitext(path)[0] + '.json') as handle:
+            return json.load(handle)
+
+    def check_graph(self, graph, expected):
+        assert graph.flavour == expected['flavour']
+        assert graph.root.index == expected['root']
+        assert sorted(graph.nodes) == sorted(int(i) for i in expected['nodes'])
+        for idx, node in expected['nodes'].items():
+            if node['type']:
+                assert graph.nodes[int(idx)].nodetype == node['type']
+                assert graph.nodes[int(idx)].name == node['name']
+        assert sorted([s, t, ts] for s, _, t, ts in graph.edges.edges()) == expected['edges']
+
+    def test_read(self):
+        for path in fixture_paths():
+            expected = self.expected(path)
+            self.check_graph(sfxfile.read(path), expected)
+            records = sorted((idx, is_group) for idx, is_group, _, _ in sfxfile.iter_node_records(path))
+            assert records == sorted((int(i), n['group']) for i, n in expected['nodes'].items())
+
+    def test_headless(self):
+        previous = sfx.cmds
+        headless.use_backend(headless.HeadlessMaya())
+        folder = tempfile.mkdtemp()
+        try:
+            for path in fixture_paths():
+                expected = self.expected(path)
+                network = sfx.NETWORK_CLASSES[expected['flavour']].instantiate('fixture', path)
+                described = describe(network)
+                assert (described['root'], described['edges']) == (expected['root'], expected['edges'])
+                assert sorted(described['nodes']) == sorted(expected['nodes'])
+                # and what the headless saveGraph writes reads back the same
+                saved = os.path.join(folder, 'saved.sfx')
+                network.cmd(saveGraph=saved)
+                self.check_graph(sfxfile.read(saved), expected)
+                sfx.cmds.file(new=True, f=True)
+        finally:
+            sfx.cmds = previous
+            shutil.rmtree(folder)
+
+
+@unittest.skipIf(not HEADLESS, FORMAT_UNVERIFIED)
+class TestSavedGraphs(unittest.TestCase):
+    """
+    reads and writes graphs saved by the shader's own saveGraph. Once there are fixtures this can run in Maya too
+    """
+
+    def setUp(self):
+        cmds.file(new=True, f=True)
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def saved(self, network):
+        path = os.path.join(self.folder, network.shader + '.sfx')
+        network.cmd(saveGraph=path)
+        return path
+
+    def check_round_trip(self, network):
+        path = self.saved(network)
+        graph = sfxfile.read(path)
+        assert graph.flavour == network.flavour
+        assert graph.root.index == network.root.index
+        assert sorted(graph.nodes) == sorted(network.nodes)
+        for idx, node in network.nodes.items():
+            if not isinstance(node, sfx.SFXGroupEndNode):
+                assert graph.nodes[idx].nodetype == node.nodetype
+        assert sorted(e[::2] for e in graph.edges.edges()) == sorted(e[::2] for e in network.edges.edges())
+        # the saved graph is what network discovery reads
+        assert network._discover_from_graph() is not None
+
+        written = os.path.join(self.folder, 'written.sfx')
+        graph.write(written)
+        loaded = type(network).instantiate('loaded_' + network.shader, written)
+        assert len(loaded.diff(network)) == 0
+
+    def test_shaderfx(self):
+        self.check_round_trip(fixture_shaderfx())
+
+    def test_stingray_pbs(self):
+        self.check_round_trip(fixture_stingray_pbs())
+
+
+class TestEdgeIndex(unittest.TestCase):
+    def test_connect(self):
+        edges = EdgeIndex()
+        edges.connect(3, 0, 1, 2)
+        assert edges.inputs(1) == {2: 3}
+        assert edges.outputs(3) == {0: [1]}
+
+    def test_replace_input(self):
+        edges = EdgeIndex()
+        edges.connect(3, 0, 1, 2)
+        edges.connect(4, 0, 1, 2)
+        assert edges.inputs(1) == {2: 4}
+        assert edges.outputs(3) == {}
+
+    def test_remove_node(self):
+        edges = EdgeIndex()
+        edges.connect(3, 0, 1, 2)
+        edges.connect(1, 0, 5, 0)
+        edges.remove_node(1)
+        assert len(edges) == 0
+
+    def test_from_sockets(self):
+        edges = EdgeIndex.from_sockets({1: {0: 3, 1: 3}}, {3: {0: [1], 1: [1]}})
+        assert edges.outputs(3) == {0: [1], 1: [1]}
+        # the pairing of sockets between 3 and 1 is a guess, so removing one marks 3 as stale
+        edges.disconnect_input(1, 1)
+        assert 3 in edges.stale
+        edges.reset_outputs(3, {1: [1]})
+        assert edges.outputs(3) == {1: [1]}
+        assert not edges.stale
+
+
+class TestNodeRegistry(unittest.TestCase):
+    def test_lookups(self):
+        table = sfx.node_registry['ShaderfxShader']
+        assert table.by_type['Color'] is sfxnodes.Color
+        assert table.by_id[sfxnodes.Color.ID] is sfxnodes.Color
+        assert table.by_group[sfxnodes.Brick.group_id()] is sfxnodes.Brick
+        assert sfxnodes.Color in table
+        assert pbsnodes.SampleTexture not in table
+
+    def test_resolve(self):
+        for node_type in (sfxnodes.Color, 'Color', sfxnodes.Color.ID):
+            assert sfx.node_registry.resolve('ShaderfxShader', node_type) is sfxnodes.Color
+        assert sfx.node_registry.resolve('ShaderfxShader', pbsnodes.SampleTexture) is None
+        assert sfx.node_registry.resolve('StingrayPBS', 'SampleTexture') is pbsnodes.SampleTexture
+
+    def test_lazy_types(self):
+        assert 'Color' in dir(sfxnodes)
+        assert sfxnodes.Color is sfxnodes.Color
+        assert sfxnodes.Color.__module__ == 'sfx.sfxnodes'
+        assert (sfxnodes.Color.TYPE, sfxnodes.Color.ID) == ('Color', 20011)
+        self.assertRaises(AttributeError, getattr, sfxnodes, 'NotANodeType')
+
+    def test_flavour_of(self):
+        assert sfx.node_registry.flavour_of(sfxnodes.Color) == 'ShaderfxShader'
+        assert sfx.node_registry.flavour_of(pbsnodes.SampleTexture) == 'StingrayPBS'
+        assert sfx.node_registry.flavour_of(SFXNode) is None
+
+
+class TestTypeCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.old_folder = os.environ.get(typecache.CACHE_DIR_VARIABLE)
+        os.environ[typecache.CACHE_DIR_VARIABLE] = self.folder
+
+    def tearDown(self):
+        if self.old_folder is None:
+            del os.environ[typecache.CACHE_DIR_VARIABLE]
+        else:
+            os.environ[typecache.CACHE_DIR_VARIABLE] = self.old_folder
+        shutil.rmtree(self.folder)
+
+    def example(self, version, ids):
+        return {'maya': version, 'flavour': 'ShaderfxShader', 'ids': ids, 'errors': {},
+                'schemas': {'Fake Type': {'properties': {'name': 'string'}, 'inputs': ['a'], 'outputs': ['result']}}}
+
+    def test_save_load(self):
+        typecache.save(self.example('1999', {'Color': 1}))
+        assert typecache.load('1999', 'ShaderfxShader')['ids'] == {'Color': 1}
+        assert typecache.load('1999', 'StingrayPBS') is None
+
+    def test_load_corrupt(self):
+        path = typecache.save(self.example('1999', {'Color': 1}))
+        with open(path, 'w') as handle:
+            handle.write('{"maya": "1999", "ids": {"Col')
+        assert typecache.load('1999', 'ShaderfxShader') is None
+        cache = sfx.SFXSchemaCache()
+        cache.load('1999', 'ShaderfxShader')
+        assert not cache.schemas
+
+    def test_rebuild_corrupt(self):
+        new_network = SFXNetwork.create('example')
+        path = typecache.cache_path(sfx.maya_version(), 'ShaderfxShader')
+        with open(path, 'w') as handle:
+            handle.write('not json')
+        sfx.SFXNodeType.generate_class_definitions(new_network.shader, 'Color', use_cache=True)
+        assert typecache.load(sfx.maya_version(), 'ShaderfxShader')['ids'] == {'Color': sfxnodes.Color.ID}
+
+    def test_diff_ids(self):
+        typecache.save(self.example('1999', {'Color': 1, 'Float': 2}))
+        typecache.save(self.example('2000', {'Color': 3, 'Int': 4}))
+        diff = typecache.diff_ids('1999', '2000', 'ShaderfxShader')
+        assert diff == {'added': {'Int': 4}, 'removed': {'Float': 2}, 'changed': {'Color': (1, 3)}}
+
+    def test_schema_cache_load(self):
+        typecache.save(self.example('1999', {}))
+        cache = sfx.SFXSchemaCache()
+        cache.load('1999', 'ShaderfxShader')
+        schema = cache.schemas[('Fake Type', '1999', 'ShaderfxShader')]
+        assert schema.inputs == {'a': 0}
+
+    def test_generate(self):
+        new_network = SFXNetwork.create('example')
+        data = typecache.generate(new_network.shader, 'Color\nNot A Node Type')
+        assert data['ids']['Color'] == sfxnodes.Color.ID
+        assert 'color' in data['schemas']['Color']['properties']
+        assert list(data['errors']) == ['Not A Node Type']
+        assert 'Not A Node Type' not in data['ids']
+
+
+class TestProfiling(TestShaderFX):
+    def test_profile(self):
+        new_network = SFXNetwork.create('example')
+        new_node = new_network.add(sfxnodes.Color, 'added')
+        target = new_network.find_by_name('TotalAmbientAndOpacity')[0]
+        with sfx.profile() as profiler:
+            new_network.connect(new_node.outputs.rgb, target.inputs.xyz)
+        assert profiler.operations['SFXNetwork.connect'] == [1, 1]
+        assert profiler.calls_by('SFXNetwork.connect') == {'makeConnection': 1}
+        assert profiler.flags()['makeConnection']['calls'] == 1
+        assert sfx._recorder is None
+
+    def test_nested_operations(self):
+        new_network = SFXNetwork.create('example')
+        with sfx.profile() as profiler:
+            with new_network.batch():
+                new_network.add(sfxnodes.Color, 'added').uiorder = 2
+        # the property set is sent by the batch, and add() is counted on its own
+        assert profiler.operations['SFXBatch.flush'][1] >= 1
+        assert profiler.operations['SFXNetwork.add'][0] == 1
+
+    def test_trace(self):
+        new_network = SFXNetwork.create('example')
+        with sfx.profile(profiling.SFXTracer()) as tracer:
+            new_node = new_network.add(sfxnodes.Color, 'added')
+            new_node.uiorder = 2
+        events = tracer.trace()['traceEvents']
+        add = [e for e in events if e['name'] == 'SFXNetwork.add'][0]
+        assert add['ph'] == 'X'
+        assert add['args']['shader'] == 'example'
+        # the commands sent by add() are inside its span
+        inside = [e for e in events if e['cat'] == 'command' and add['ts'] <= e['ts'] <= add['ts'] + add['dur']]
+        assert 'addNode' in [e['name'] for e in inside]
+        edit = [e for e in events if e['name'] == 'SFXNode._set_property'][0]
+        assert edit['args'] == {'shader': 'example', 'node': new_node.index}
+
+        path = tempfile.mktemp(suffix='.json')
+        try:
+            with open(tracer.write(path)) as handle:
+                assert len(json.load(handle)['traceEvents']) == len(events)
+        finally:
+            os.remove(path)
+
+    def test_percentile(self):
+        values = [float(n) for n in range(101)]
+        assert profiling.percentile(values, 0.5) == 50.0
+        assert profiling.percentile(values, 0.99) == 99.0
+        assert profiling.percentile([], 0.5) == 0.0
+
+
+class TestHeadless(unittest.TestCase):
+    def setUp(self):
+        self.maya = headless.HeadlessMaya()
+        self.previous = sfx.cmds
+        headless.use_backend(self.maya)
+        self.network = SFXNetwork.create('example')
+
+    def tearDown(self):
+        sfx.cmds = self.previous
+
+    def test_create(self):
+        assert self.maya.ls('example') == ['example']
+        assert self.maya.nodeType('example') == 'ShaderfxShader'
+        assert self.network.root.nodetype == 'Hardware Shader'
+        assert self.network.find_by_name('TotalAmbientAndOpacity')
+        # the shader name is made unique, as in Maya
+        assert self.maya.shadingNode('ShaderfxShader', asShader=True, name='example') == 'example1'
+
+    def test_connections(self):
+        tint = self.network.add(sfxnodes.Color, 'tint')
+        target = self.network.find_by_name('TotalAmbientAndOpacity')[0]
+        self.network.connect(tint.outputs.rgb, target.inputs.xyz)
+        self.network.refresh()
+        assert self.network.get_inputs(target)[target.inputs.xyz[1]] == tint
+        # an input only takes one connection
+        other = self.network.add(sfxnodes.Color, 'other')
+        self.network.connect(other.outputs.r, target.inputs.xyz)
+        self.network.refresh()
+        assert self.network.get_inputs(target)[target.inputs.xyz[1]] == other
+        assert target not in self.network.get_outputs(tint).get(0, [])
+        self.assertRaises(RuntimeError, self.network.cmd, makeConnection=(tint.index, 99, target.index, 0))
+
+    def test_properties(self):
+        tint = self.network.add(sfxnodes.Color, 'tint')
+        tint.color = (1, 0, 0, 1)
+        assert tint.color == [1.0, 0.0, 0.0, 1.0]
+        self.assertRaises(RuntimeError, self.network.cmd, edit_int=(tint.index, 'color', 1))
+        self.assertRaises(RuntimeError, self.network.cmd, gpv=(999, 'name'))
+
+    def test_groups(self):
+        group = self.network.add(sfxnodes.TextureMap, 'texture')
+        assert self.network.cmd(isGroupStart=group.index)
+        assert group.end_node.index != group.index
+        assert group.outputs.plugs
+        self.network.delete(group)
+        assert group.end_node.index not in self.maya.shaders['example'].nodes
+
+    def test_save_and_load(self):
+        tint = self.network.add(sfxnodes.Color, 'tint')
+        tint.color = (0, 1, 0, 1)
+        self.network.connect(tint.outputs.rgb, self.network.root.inputs.color)
+        path = tempfile.mktemp(suffix='.sfx')
+        try:
+            self.network.cmd(saveGraph=path)
+            copy = SFXNetwork.instantiate('copy', path)
+        finally:
+            os.remove(path)
+        assert sorted(copy.nodes) == sorted(self.network.nodes)
+        assert copy.find_by_name('tint')[0].color == [0.0, 1.0, 0.0, 1.0]
+        assert copy.get_inputs(copy.root)[0].index == tint.index
+
+    def test_latency(self):
+        slow = headless.HeadlessMaya(latency=0.001)
+        headless.use_backend(slow)
+        network = SFXNetwork.create('slow')
+        slow.calls.clear()
+        start = profiling.clock()
+        network.cmd(getNodeCount=True)
+        assert profiling.clock() - start >= 0.001
+        assert slow.calls == {'getNodeCount': 1}
+
+
+def count_nodes(network):
+    if 'crash' in network.shader:
+        os._exit(3)
+    if 'broken' in network.shader:
+        raise ValueError('broken')
+    return len(network.nodes)
+
+
+@unittest.skipIf(not HEADLESS, 'the workers are forked, which Maya does not survive')
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        cmds.file(new=True, f=True)
+        self.folder = tempfile.mkdtemp()
+        self.paths = []
+        for name, size in (('first', 1), ('second', 2), ('broken', 0), ('crash', 0)):
+            network = SFXNetwork.create(name)
+            for _ in range(size):
+                network.add(sfxnodes.Color)
+            path = os.path.join(self.folder, name + '.sfx')
+            network.cmd(saveGraph=path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_run(self):
+        with workers.SFXWorkerPool(processes=2, retries=1) as pool:
+            results = dict((os.path.basename(r.path), r) for r in pool.run(self.paths, count_nodes))
+            assert results['first.sfx'].value == {'first': 5}
+            assert results['second.sfx'].value == {'second': 6}
+            assert 'ValueError' in results['broken.sfx'].error
+            # a worker that dies is replaced, and the file is tried again
+            assert results['crash.sfx'].attempts == 2
+            assert 'died' in results['crash.sfx'].error
+            assert pool.restarts == 2
+            # the workers are kept for the next run
+            assert [r.value for r in pool.run(self.paths[:1], count_nodes)] == [{'first': 5}]
+            assert pool.restarts == 2
+
+    def test_abandoned_run(self):
+        with workers.SFXWorkerPool(processes=2) as pool:
+            first_run = pool.run(self.paths[:2], count_nodes)
+            next(first_run)
+            first_run.close()
+            # nothing left over from the first run turns up in the next one
+            results = [(os.path.basename(r.path), r.value) for r in pool.run(self.paths[1::-1], count_nodes)]
+            assert sorted(results) == [('first.sfx', {'first': 5}), ('second.sfx', {'second': 6})]
+
+    def test_in_order(self):
+        results = workers.run(self.paths[:2], count_nodes, processes=2)
+        assert [r.value for r in results] == [{'first': 5}, {'second': 6}]
+        # the same file twice gets two results
+        results = workers.run([self.paths[0], self.paths[1], self.paths[0]], count_nodes, processes=2)
+        assert [r.value for r in results] == [{'first': 5}, {'second': 6}, {'first': 5}]
+
+    def test_unknown_flavour(self):
+        path = os.path.join(self.folder, 'unknown.sfx')
+        with open(path, 'w') as handle:
+            handle.write('<graph root="1"><node id="1" class="Mystery" classid="1" groupend="0"/></graph>')
+        result, = workers.run([path], count_nodes, processes=1)
+        assert 'ValueError' in result.error
+
+    def test_flavour_fallback(self):
+        # the type ids don't say which flavour this is, so the file is loaded to find out
+        path = os.path.join(self.folder, 'unmarked.sfx')
+        with open(path, 'w') as handle:
+            handle.write('<graph root="1"><node id="1" class="Standard Base" classid="1" groupend="0"/></graph>')
+        assert sfxfile.read(path).flavour is None
+        network, = workers.file_networks(path)
+        assert isinstance(network, sfx.StingrayPBSNetwork)
+        assert cmds.ls(type='ShaderfxShader') == []
+
+
+class TestLayeredLayout(unittest.TestCase):
+    def test_shared_node(self):
+        inputs = {1: [2, 4], 2: [3], 3: [4], 4: []}
+        result = layered_layout(1, inputs.get)
+        # 4 feeds both the root and 3, so it goes to the left of 3
+        assert [result[n][0] for n in (1, 2, 3, 4)] == [0, 1, 2, 3]
+
+    def test_visits_once(self):
+        visits = []
+
+        def inputs(node):
+            visits.append(node)
+            return [node + 1, node + 2] if node < 20 else []
+
+        result = layered_layout(0, inputs)
+        assert sorted(visits) == sorted(set(visits))
+        assert result[21][0] == 20
+
+    def test_crossings(self):
+        inputs = {1: [2, 3], 2: [4, 5], 3: [4], 4: [], 5: []}
+        result = layered_layout(1, inputs.get)
+        # 3 is below 2, so the node they share should be below the node only 2 uses
+        assert result[4][1] > result[5][1]
+
+
+class TestSFXSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def example(self):
+        result = snapshot.SFXSnapshot({'shader': 'example', 'flavour': 'ShaderfxShader', 'maya': '2016', 'root': 1,
+                                       'node_count': 2})
+        result.schemas['Color'] = {'properties': {'name': 'string', 'color': 'float4'}, 'inputs': [],
+                                   'outputs': ['rgb']}
+        result.nodes[1] = {'key': 'root', 'name': 'root', 'type': 'Hardware Shader', 'group': False,
+                           'group_end': None, 'properties': {}}
+        result.nodes[2] = {'key': 'tint', 'name': 'tint', 'type': 'Color', 'group': False, 'group_end': None,
+                           'properties': {'color': [1.0, 0.0, 0.0, 1.0]}}
+        result.edges.append((2, 0, 1, 0, 'tint.rgb', 'root.color'))
+        return result
+
+    def test_round_trip(self):
+        for name in ('example.snapshot', 'example.snapshot.gz'):
+            path = os.path.join(self.folder, name)
+            self.example().write(path)
+            result = snapshot.read(path)
+            assert result.header['shader'] == 'example'
+            assert result.nodes[2]['properties']['color'] == [1.0, 0.0, 0.0, 1.0]
+            assert result.edges == [(2, 0, 1, 0, 'tint.rgb', 'root.color')]
+
+    def test_to_spec(self):
+        spec = self.example().to_spec()
+        assert [n['name'] for n in spec['nodes']] == ['tint']
+        assert spec['connections'] == [('tint.rgb', 'root.color')]
+
+    def test_not_a_snapshot(self):
+        path = os.path.join(self.folder, 'example.snapshot')
+        with open(path, 'w') as handle:
+            handle.write('{"format": "something else"}\n')
+        self.assertRaises(ValueError, snapshot.read, path)
+
+
 if __name__ == '__main__':
-    import maya.standalone
+    if not HEADLESS:
+        import maya.standalone
 
-    maya.standalone.initialize()
-    unittest.main()
+        maya.standalone.initialize()
+    if sys.argv[1:] == ['capture']:
+        capture_fixtures()
+    else:
+        unittest.main()